@@ -1,15 +1,35 @@
-class Account:
+from abc import ABC, abstractmethod
 
+import EventLogger
+
+
+class Account(ABC):
     #account object class
-    def __init__(self, accountID: str, accountType:str,balance:float, creditLimit:float = 0):
+    #the storage is picked once, when the account is opened with Account.open: with a ledger the balance, credit limit and used credit
+    #live in the ledger arrays and the account is a view on its slot (LedgerAccount), without one they are plain attributes (PlainAccount)
+    __slots__ = ("model", "accountID", "accountType")
+
+    def __init__(self, model, accountID: str, accountType:str,balance:float, creditLimit:float = 0, *, log_creation: bool = True):
+        self.model = model
         self.accountID = accountID
         self.accountType = accountType
-        self.balance = balance
-        self.creditLimit = creditLimit
-        self.usedCredit = 0
+        self.init_storage(balance, creditLimit)
 
-        #logging
-        self.model.log_event(f"Account {accountID} of type {accountType} created with balance {balance} and credit limit {creditLimit}", accountID, is_transaction = False)
+        #logging, bulk generated accounts are logged once for the whole population
+        if log_creation:
+            self.model.record_event(EventLogger.EventType.ACCOUNT_CREATED, accountID, balance=balance, credit=creditLimit, security=accountType)
+
+    @classmethod
+    def open(cls, model, accountID: str, accountType: str, balance: float, creditLimit: float = 0, *, ledger = None, slot: int = None, log_creation: bool = True):
+        #opens an account with the storage of the model: a view on the ledger if there is one (on slot if it was filled in bulk), plain attributes otherwise
+        if ledger is not None:
+            return LedgerAccount(model, accountID, accountType, balance, creditLimit, ledger=ledger, slot=slot, log_creation=log_creation)
+        return PlainAccount(model, accountID, accountType, balance, creditLimit, log_creation=log_creation)
+
+    @abstractmethod
+    def init_storage(self, balance: float, creditLimit: float):
+        #sets the opening balance and credit limit in the storage of the account
+        pass
 
     def getAccountID(self):
         return self.accountID
@@ -27,9 +47,22 @@ class Account:
         return self.usedCredit
 
 
+    def available(self):
+        #amount that can be deducted: balance plus unused credit for cash, balance for securities
+        if self.accountType == "Cash":
+            return self.balance + self.creditLimit - self.usedCredit
+        return self.balance
+
+    def notify_waiting(self):
+        #wakes the transactions waiting for this account that can now be covered
+        wait_list = self.model.wait_list
+        if wait_list is not None:
+            wait_list.notify(self)
+
     def checkBalance(self, amount : float, securityType: str):
         if self.accountType == "Cash" and securityType == "Cash":
-           return  self.balance + self.creditLimit >= amount
+           #only the credit that is not used yet can cover the amount
+           return  self.balance + self.creditLimit - self.usedCredit >= amount
         elif self.accountType == securityType:
             return self.balance >= amount
         else:
@@ -46,7 +79,8 @@ class Account:
 
                 self.balance = self.balance + amount
                 #logging
-                self.model.log_event(f"Account {self.accountID} added {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}", self.accountID, is_transaction = False)
+                self.model.record_event(EventLogger.EventType.CASH_ADDED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
+                self.notify_waiting()
                 return amount
 
             elif self.creditLimit != self.creditLimit - self.usedCredit:
@@ -55,7 +89,8 @@ class Account:
                     #reset the used credit with the amount
                     self.usedCredit = self.usedCredit - amount
                     # logging
-                    self.model.log_event(f"Account {self.accountID} added {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}", self.accountID, is_transaction=False)
+                    self.model.record_event(EventLogger.EventType.CASH_ADDED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
+                    self.notify_waiting()
                     return amount
                 else:
                     #set used credit to 0 and add remaining to balance
@@ -63,20 +98,21 @@ class Account:
                     self.usedCredit = 0
                     self.balance = self.balance + remaining
                     # logging
-                    self.model.log_event(f"Account {self.accountID} added {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}",self.accountID, is_transaction=False)
+                    self.model.record_event(EventLogger.EventType.CASH_ADDED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
+                    self.notify_waiting()
                     return amount
 
         #if security account:
         elif self.accountType == securityType:
             self.balance = self.balance + amount
             #logging
-            self.model.log_event(f"Account {self.accountID} added {amount} securities of type {self.accountType}. New amount: {self.balance}", self.accountID, is_transaction = False)
+            self.model.record_event(EventLogger.EventType.SECURITIES_ADDED, self.accountID, amount=amount, balance=self.balance, security=self.accountType)
+            self.notify_waiting()
             return amount
 
         else:
-            print("Error: account doesn't allow to add this type of assets")
             #logging
-            self.model.log_event(f"ERROR: account {self.accountID} doesn't allow to add this type of assets", self.accountID, is_transaction = False)
+            self.model.record_event(EventLogger.EventType.WRONG_ASSET_TYPE, self.accountID, security=securityType, text="add")
             return 0
 
 
@@ -90,28 +126,29 @@ class Account:
                 self.usedCredit = self.creditLimit
                 self.balance = 0
                 # logging
-                self.model.log_event(f"Account {self.accountID} deducted {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}",self.accountID, is_transaction=False)
+                self.model.record_event(EventLogger.EventType.CASH_DEDUCTED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
                 return deducted
 
             elif total_available > amount and self.balance == 0:
                 #adjust the creditLimit accordingly
                 self.usedCredit = self.usedCredit + amount
                 # logging
-                self.model.log_event(f"Account {self.accountID} deducted {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}", self.accountID, is_transaction=False)
+                self.model.record_event(EventLogger.EventType.CASH_DEDUCTED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
                 return amount
 
             elif self.balance > 0:
                 if self.balance >= amount:
                     self.balance = self.balance - amount
                     # logging
-                    self.model.log_event(f"Account {self.accountID} deducted {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}", self.accountID, is_transaction=False)
+                    self.model.record_event(EventLogger.EventType.CASH_DEDUCTED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
                     return amount
                 else:
+                    #balance is used first, the remainder is taken from credit
                     deductedFromBalance = self.balance
                     self.balance = 0
-                    self.usedCredit = self.usedCredit + deductedFromBalance
+                    self.usedCredit = self.usedCredit + amount - deductedFromBalance
                     # logging
-                    self.model.log_event(f"Account {self.accountID} deducted {amount} cash. Total cash amount: {self.balance}, total credit amount: {self.usedCredit}",self.accountID, is_transaction=False)
+                    self.model.record_event(EventLogger.EventType.CASH_DEDUCTED, self.accountID, amount=amount, balance=self.balance, credit=self.usedCredit)
                     return amount
 
         #deduct securities
@@ -119,7 +156,7 @@ class Account:
             if self.balance >= amount:
                 self.balance = self.balance -amount
                 # logging
-                self.model.log_event(f"Account {self.accountID} deducted {amount} securities of type {self.accountType}. New amount: {self.balance}", self.accountID, is_transaction=False)
+                self.model.record_event(EventLogger.EventType.SECURITIES_DEDUCTED, self.accountID, amount=amount, balance=self.balance, security=self.accountType)
                 return amount
             else:
                 #@ruben i think this should not be possible. if there is not enough to deduct, nothing should be deducted and partial settlement should be triggered
@@ -128,7 +165,69 @@ class Account:
                 return deducted
 
         else:
-            print("Error: account doesn't allow to deduct this type of assets")
             # logging
-            self.model.log_event(f"ERROR: account {self.accountID} doesn't allow to deduct this type of assets", self.accountID, is_transaction=False)
-            return 0
\ No newline at end of file
+            self.model.record_event(EventLogger.EventType.WRONG_ASSET_TYPE, self.accountID, security=securityType, text="deduct")
+            return 0
+
+
+class PlainAccount(Account):
+    #balance, credit limit and used credit as attributes of the account
+    __slots__ = ("balance", "_creditLimit", "usedCredit")
+
+    def init_storage(self, balance: float, creditLimit: float):
+        self.balance = balance
+        self._creditLimit = creditLimit
+        self.usedCredit = 0
+
+    @property
+    def creditLimit(self):
+        return self._creditLimit
+
+    @creditLimit.setter
+    def creditLimit(self, value):
+        raised = value > self._creditLimit
+        self._creditLimit = value
+        if raised:
+            self.notify_waiting()
+
+
+class LedgerAccount(Account):
+    #view on the slot of the account in the ledger arrays
+    __slots__ = ("ledger", "slot")
+
+    def __init__(self, model, accountID: str, accountType: str, balance: float, creditLimit: float = 0, *, ledger, slot: int = None, log_creation: bool = True):
+        self.ledger = ledger
+        self.slot = slot
+        super().__init__(model, accountID, accountType, balance, creditLimit, log_creation=log_creation)
+
+    def init_storage(self, balance: float, creditLimit: float):
+        #a slot that was already filled in bulk is only viewed
+        if self.slot is None:
+            self.slot = self.ledger.add_account(self.accountType, balance, creditLimit)
+
+    @property
+    def balance(self):
+        return float(self.ledger.balance[self.slot])
+
+    @balance.setter
+    def balance(self, value):
+        self.ledger.balance[self.slot] = value
+
+    @property
+    def creditLimit(self):
+        return float(self.ledger.creditLimit[self.slot])
+
+    @creditLimit.setter
+    def creditLimit(self, value):
+        raised = value > self.creditLimit
+        self.ledger.creditLimit[self.slot] = value
+        if raised:
+            self.notify_waiting()
+
+    @property
+    def usedCredit(self):
+        return float(self.ledger.usedCredit[self.slot])
+
+    @usedCredit.setter
+    def usedCredit(self, value):
+        self.ledger.usedCredit[self.slot] = value
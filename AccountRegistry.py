@@ -0,0 +1,47 @@
+class AccountRegistry:
+    """Index of the accounts of every institution by account type.
+
+    Next to the accounts per (institution, account type) it keeps, per account type, the list of
+    institutions that hold such an account, so a counterparty for an instruction can be drawn in
+    constant time without building the list of all other institutions."""
+
+    def __init__(self):
+        #(institutionID, accountType) -> accounts of that institution and type
+        self.accounts = {}
+        #institutionID -> securities types the institution holds
+        self.security_types = {}
+        #accountType -> institutions holding an account of that type, and the position of each institution in that list
+        self.holders = {}
+        self.holder_positions = {}
+
+    def add(self, institution, account):
+        #registers a new account, called when institutions get created and by InstitutionAgent.create_account
+        key = (institution.institutionID, account.accountType)
+        if key not in self.accounts:
+            self.accounts[key] = []
+            holders = self.holders.setdefault(account.accountType, [])
+            self.holder_positions[key] = len(holders)
+            holders.append(institution)
+            if account.accountType != "Cash":
+                self.security_types.setdefault(institution.institutionID, []).append(account.accountType)
+        self.accounts[key].append(account)
+
+    def get_accounts(self, institution, accountType: str):
+        #accounts of the institution of this type, the returned list is shared and shouldn't be changed
+        return self.accounts.get((institution.institutionID, accountType), [])
+
+    def get_security_types(self, institution):
+        return self.security_types.get(institution.institutionID, [])
+
+    def sample_counterparty(self, institution, accountType: str, rng):
+        #draws another institution holding an account of this type, None if there is none
+        holders = self.holders.get(accountType, [])
+        own_position = self.holder_positions.get((institution.institutionID, accountType))
+        candidates = len(holders) - (own_position is not None)
+        if candidates <= 0:
+            return None
+        position = rng.randrange(candidates)
+        if own_position is not None and position >= own_position:
+            #skip the institution itself
+            position += 1
+        return holders[position]
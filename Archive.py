@@ -0,0 +1,187 @@
+import csv
+import os
+from collections import Counter
+
+INSTRUCTION_FIELDS = ["uniqueID", "motherID", "direction", "institutionID", "securityType", "amount", "status",
+                      "linkcode", "isChild", "generation", "creation_time", "transactionID", "archived_time"]
+TRANSACTION_FIELDS = ["transactionID", "delivererID", "receiverID", "securityType", "amount", "status",
+                      "generation", "creation_time", "archived_time"]
+PARTIAL_FIELDS = ["partialID", "transactionID", "delivererID", "receiverID", "securityType", "generation",
+                  "settled_amount", "remaining_amount", "settled_time"]
+
+
+def is_terminal(status: str):
+    #settled and cancelled instructions and transactions don't change anymore
+    return status == "Settled" or status.startswith("Cancelled")
+
+
+def instruction_record(instruction, archived_time: str):
+    linkedTransaction = instruction.linkedTransaction
+    return {
+        "uniqueID": instruction.uniqueID,
+        "motherID": instruction.motherID,
+        "direction": instruction.direction,
+        "institutionID": instruction.institution.institutionID if instruction.institution is not None else None,
+        "securityType": instruction.securityType,
+        "amount": instruction.amount,
+        "status": instruction.status,
+        "linkcode": instruction.linkcode,
+        "isChild": instruction.isChild,
+        "generation": instruction.generation,
+        "creation_time": instruction.creation_time.isoformat(),
+        "transactionID": linkedTransaction.transactionID if linkedTransaction is not None else None,
+        "archived_time": archived_time,
+    }
+
+
+def transaction_record(transaction, archived_time: str):
+    return {
+        "transactionID": transaction.transactionID,
+        "delivererID": transaction.deliverer.uniqueID,
+        "receiverID": transaction.receiver.uniqueID,
+        "securityType": transaction.deliverer.securityType,
+        "amount": transaction.deliverer.amount,
+        "status": transaction.status,
+        "generation": transaction.deliverer.generation,
+        "creation_time": transaction.creation_time.isoformat(),
+        "archived_time": archived_time,
+    }
+
+
+class ArchiveTable:
+    """Append-only columnar table with a lookup by key.
+
+    Rows are collected in column lists. Without a spill directory they stay in memory, with one every
+    full chunk of chunk_size rows is written to a csv file and dropped from memory. The lookup keeps
+    (chunk, row) per key, so a spilled record is read back from its chunk file."""
+
+    def __init__(self, name: str, fields: list, key: str, spill_dir: str = None, chunk_size: int = 100000):
+        self.name = name
+        self.fields = fields
+        self.key = key
+        self.spill_dir = spill_dir
+        self.chunk_size = chunk_size
+        self.columns = {field: [] for field in fields}
+        self.chunk = 0
+        self.lookup = {}
+        self.loaded_chunk = None
+        self.loaded_rows = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def __contains__(self, key):
+        return key in self.lookup
+
+    def append(self, record: dict):
+        row = len(self.columns[self.key])
+        for field in self.fields:
+            self.columns[field].append(record[field])
+        self.lookup[record[self.key]] = (self.chunk, row)
+        if self.spill_dir is not None and row + 1 >= self.chunk_size:
+            self.spill()
+
+    def chunk_filename(self, chunk: int):
+        return os.path.join(self.spill_dir, f"{self.name}-{chunk:05d}.csv")
+
+    def spill(self):
+        #writes the rows in memory to the next chunk file
+        with open(self.chunk_filename(self.chunk), "w", newline="") as chunk_file:
+            writer = csv.writer(chunk_file)
+            writer.writerow(self.fields)
+            writer.writerows(zip(*(self.columns[field] for field in self.fields)))
+        self.columns = {field: [] for field in self.fields}
+        self.chunk += 1
+
+    def get(self, key):
+        #archived record of a key as a dict, None if it is not archived
+        location = self.lookup.get(key)
+        if location is None:
+            return None
+        chunk, row = location
+        if chunk == self.chunk:
+            return {field: self.columns[field][row] for field in self.fields}
+        if self.loaded_chunk != chunk:
+            #spilled records come back as strings, the last read chunk is kept for consecutive lookups
+            with open(self.chunk_filename(chunk), newline="") as chunk_file:
+                self.loaded_rows = list(csv.DictReader(chunk_file))
+            self.loaded_chunk = chunk
+        return self.loaded_rows[row]
+
+
+class Archive:
+    """Archive of the instructions and transactions that reached a terminal status.
+
+    Records can be looked up by uniqueID and transactionID, an instruction that was partially settled is
+    archived once with the amount of its last generation. The counters per status keep the totals of the run
+    without going back to the records."""
+
+    def __init__(self, spill_dir: str = None, chunk_size: int = 100000):
+        self.instructions = ArchiveTable("instructions", INSTRUCTION_FIELDS, "uniqueID", spill_dir, chunk_size)
+        self.transactions = ArchiveTable("transactions", TRANSACTION_FIELDS, "transactionID", spill_dir, chunk_size)
+        self.instruction_statuses = Counter()
+        self.transaction_statuses = Counter()
+        self.settled_value = 0.0
+
+    def archive_instruction(self, instruction, archived_time: str):
+        self.add_instruction_record(instruction_record(instruction, archived_time))
+
+    def add_instruction_record(self, record: dict):
+        self.instructions.append(record)
+        self.instruction_statuses[record["status"]] += 1
+
+    def archive_transaction(self, transaction, archived_time: str):
+        self.add_transaction_record(transaction_record(transaction, archived_time))
+
+    def add_transaction_record(self, record: dict):
+        self.transactions.append(record)
+        self.transaction_statuses[record["status"]] += 1
+        if record["status"] == "Settled":
+            self.settled_value += record["amount"]
+
+    def get_instruction(self, uniqueID):
+        return self.instructions.get(uniqueID)
+
+    def get_transaction(self, transactionID):
+        return self.transactions.get(transactionID)
+
+
+class PartialSettlements:
+    """Lineage of the partial settlements of a run, one record per partial settlement.
+
+    The instructions and the transaction keep their ids and count their partial settlements in their generation,
+    the settled parts are only recorded here. The lineage is kept with and without the archive, spilled like an
+    archive table with a spill directory."""
+
+    def __init__(self, spill_dir: str = None, chunk_size: int = 100000):
+        self.records = ArchiveTable("partial_settlements", PARTIAL_FIELDS, "partialID", spill_dir, chunk_size)
+        #transactionID -> partialIDs of its partial settlements, in generation order
+        self.by_transaction = {}
+        self.settled_value = 0.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, transaction, settled_amount: float, settled_time: str):
+        #called after the instructions continued with their next generation
+        partialID = len(self.records)
+        deliverer = transaction.deliverer
+        self.records.append({
+            "partialID": partialID,
+            "transactionID": transaction.transactionID,
+            "delivererID": deliverer.uniqueID,
+            "receiverID": transaction.receiver.uniqueID,
+            "securityType": deliverer.securityType,
+            "generation": deliverer.generation,
+            "settled_amount": settled_amount,
+            "remaining_amount": deliverer.amount,
+            "settled_time": settled_time,
+        })
+        self.by_transaction.setdefault(transaction.transactionID, []).append(partialID)
+        self.settled_value += settled_amount
+
+    def get_partials(self, transactionID):
+        #records of the partial settlements of a transaction, oldest first
+        return [self.records.get(partialID) for partialID in self.by_transaction.get(transactionID, [])]
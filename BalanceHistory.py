@@ -0,0 +1,189 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+#recorded account values, every one is a (snapshots, accounts) float64 file next to the steps of the snapshots
+HISTORY_COLUMNS = ("balance", "creditLimit", "usedCredit")
+METADATA_FILE = "history.json"
+ACCOUNTS_FILE = "accounts.csv"
+
+
+def column_filename(directory: str, name: str):
+    return os.path.join(directory, f"{name}.f8")
+
+
+def open_column(directory: str, name: str, snapshots: int, width: int, mode: str):
+    #memory map of a column file with room for snapshots rows, the file is grown (sparse) when it is too small
+    filename = column_filename(directory, name)
+    if mode == "r+":
+        needed = snapshots * width * 8
+        with open(filename, "ab") as column_file:
+            if column_file.tell() < needed:
+                column_file.truncate(needed)
+    return np.memmap(filename, dtype=np.float64, mode=mode, shape=(snapshots, width))
+
+
+class BalanceHistory:
+    """Writes snapshots of balance, creditLimit and usedCredit of all accounts to memory mapped column files.
+
+    Every column is a fixed width (snapshots, accounts) float64 file in directory, a snapshot is one contiguous
+    row, so recording it is a single copy (from the ledger arrays when there is a ledger). The files get room for
+    the expected number of snapshots up front and grow when a run goes on longer. history.json holds the width,
+    the number of snapshots and the step of every snapshot, accounts.csv the account of every column position.
+    The width is the number of accounts when the history starts (or account_capacity if that is larger),
+    accounts opened after that get a position while there is room and are left out otherwise.
+    BalanceHistoryReader reads the files back without loading them."""
+
+    def __init__(self, model, directory: str, interval: int = 1, expected_snapshots: int = 1024, account_capacity: int = None):
+        self.model = model
+        self.directory = directory
+        self.interval = interval
+        self.accounts = list(model.accounts)
+        self.width = max(len(self.accounts), account_capacity or 0, 1)
+        self.capacity = max(expected_snapshots, 1)
+        self.snapshots = 0
+        self.steps = []
+        self.dropped_accounts = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in HISTORY_COLUMNS:
+            #a new history starts from empty files
+            open(column_filename(directory, name), "wb").close()
+        self.open_columns()
+        self.slots = None
+        self.update_slots()
+
+    def open_columns(self):
+        self.columns = {name: open_column(self.directory, name, self.capacity, self.width, "r+") for name in HISTORY_COLUMNS}
+
+    def update_slots(self):
+        #registers accounts opened since the last snapshot, with a ledger the snapshot is gathered by slot
+        known = len(self.accounts)
+        for account in self.model.accounts[known:]:
+            if len(self.accounts) < self.width:
+                self.accounts.append(account)
+            else:
+                self.dropped_accounts += 1
+        if self.model.ledger is not None and (self.slots is None or len(self.slots) != len(self.accounts)):
+            self.slots = np.fromiter((account.slot for account in self.accounts), dtype=np.int64, count=len(self.accounts))
+
+    def grow(self):
+        for column in self.columns.values():
+            column.flush()
+        self.capacity = 2 * self.capacity
+        self.open_columns()
+
+    def record(self, step: int):
+        #writes the snapshot of the current values as the next row
+        if len(self.model.accounts) != len(self.accounts) + self.dropped_accounts:
+            self.update_slots()
+        if self.snapshots == self.capacity:
+            self.grow()
+        row = self.snapshots
+        count = len(self.accounts)
+        ledger = self.model.ledger
+        for name in HISTORY_COLUMNS:
+            target = self.columns[name][row, :count]
+            if ledger is not None:
+                np.take(getattr(ledger, name), self.slots, out=target)
+            else:
+                target[:] = np.fromiter((getattr(account, name) for account in self.accounts), dtype=np.float64, count=count)
+        self.steps.append(step)
+        self.snapshots += 1
+
+    def record_due(self, step: int):
+        if step % self.interval == 0:
+            self.record(step)
+
+    def flush(self):
+        #the mapped pages go to disk, the metadata tells readers how many rows are valid
+        for column in self.columns.values():
+            column.flush()
+        with open(os.path.join(self.directory, ACCOUNTS_FILE), "w", newline="") as accounts_file:
+            writer = csv.writer(accounts_file)
+            writer.writerow(["position", "accountID", "accountType"])
+            writer.writerows((position, account.accountID, account.accountType) for position, account in enumerate(self.accounts))
+        metadata = {"columns": list(HISTORY_COLUMNS), "width": self.width, "capacity": self.capacity, "snapshots": self.snapshots,
+                    "interval": self.interval, "steps": self.steps, "dropped_accounts": self.dropped_accounts}
+        with open(os.path.join(self.directory, METADATA_FILE), "w") as metadata_file:
+            json.dump(metadata, metadata_file)
+
+    def close(self):
+        self.flush()
+
+    def __getstate__(self):
+        #a checkpoint keeps the position in the files, a restored model maps them again and overwrites the later snapshots
+        self.flush()
+        state = self.__dict__.copy()
+        del state["columns"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.open_columns()
+
+
+class BalanceHistoryReader:
+    """Read only view on a balance history directory. Every method returns slices of the memory maps,
+    nothing is copied or loaded until the returned arrays are used."""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, METADATA_FILE)) as metadata_file:
+            metadata = json.load(metadata_file)
+        self.directory = directory
+        self.width = metadata["width"]
+        self.snapshots = metadata["snapshots"]
+        self.interval = metadata["interval"]
+        self.steps = np.array(metadata["steps"], dtype=np.int64)
+        with open(os.path.join(directory, ACCOUNTS_FILE), newline="") as accounts_file:
+            rows = list(csv.DictReader(accounts_file))
+        self.account_ids = [row["accountID"] for row in rows]
+        self.account_types = [row["accountType"] for row in rows]
+        self.positions = {accountID: position for position, accountID in enumerate(self.account_ids)}
+        #only the valid rows are mapped
+        self.columns = {name: open_column(directory, name, metadata["capacity"], self.width, "r")[:self.snapshots]
+                        for name in metadata["columns"]}
+
+    def __len__(self):
+        return self.snapshots
+
+    def rows(self, start_step: int = None, stop_step: int = None):
+        #snapshot rows of the steps start_step <= step < stop_step
+        start = 0 if start_step is None else int(np.searchsorted(self.steps, start_step, side="left"))
+        stop = self.snapshots if stop_step is None else int(np.searchsorted(self.steps, stop_step, side="left"))
+        return slice(start, stop)
+
+    def position(self, account):
+        #column position of an account ID (or a position that is passed through)
+        return self.positions[account] if isinstance(account, str) else account
+
+    def column(self, name: str, start_step: int = None, stop_step: int = None):
+        #(snapshots, accounts) view of one value over a step range
+        return self.columns[name][self.rows(start_step, stop_step)]
+
+    def account(self, account, start_step: int = None, stop_step: int = None):
+        #trajectory of one account: a strided view per value, next to the steps of the snapshots
+        rows = self.rows(start_step, stop_step)
+        position = self.position(account)
+        trajectory = {name: column[rows, position] for name, column in self.columns.items()}
+        trajectory["step"] = self.steps[rows]
+        return trajectory
+
+    def accounts(self, accounts, start_step: int = None, stop_step: int = None):
+        #views of a contiguous range of positions (a slice), any other selection of accounts is gathered into a copy
+        rows = self.rows(start_step, stop_step)
+        if isinstance(accounts, slice):
+            positions = accounts
+        else:
+            positions = [self.position(account) for account in accounts]
+        selection = {name: column[rows, positions] for name, column in self.columns.items()}
+        selection["step"] = self.steps[rows]
+        return selection
+
+    def snapshot(self, step: int):
+        #values of all accounts at the last snapshot taken at or before step
+        row = int(np.searchsorted(self.steps, step, side="right")) - 1
+        if row < 0:
+            raise KeyError(f"no snapshot at or before step {step}")
+        return {name: column[row] for name, column in self.columns.items()}
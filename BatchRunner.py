@@ -0,0 +1,187 @@
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+
+#columns of every result row next to the parameters of the run
+RESULT_FIELDS = ["run", "replication", "seed", "run_status", "error", "steps", "wall_time",
+                 "instructions_created", "instructions_settled", "settlement_rate",
+                 "transactions_created", "transactions_settled", "settled_value"]
+#seconds a run may go on after max_wall_time before its process is killed, a single step can take a while
+HARD_TIMEOUT_GRACE = 60.0
+
+
+def parameter_combinations(grid: dict):
+    #every combination of the parameter grid, e.g. {"num_institutions": [5, 10], "steps_per_day": [100, 500]}
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_replication(run: int, replication: int, seed: int, parameters: dict, max_wall_time: float = None):
+    """Runs one replication in a worker process and returns its summary row.
+    Errors are caught and reported in the row, a run that exceeds max_wall_time seconds is stopped at the next step."""
+    row = {"run": run, "replication": replication, "seed": seed, "run_status": "finished", "error": "", "steps": 0}
+    row.update(parameters)
+    start = time.perf_counter()
+    try:
+        import SettlementModel
+        import RunSimulation
+
+        #grids are json with the parameter names of the config files of RunSimulation, timedeltas are given in seconds
+        model = SettlementModel.SettlementModel(seed=seed, **RunSimulation.convert_parameters({"log_verbosity": "quiet", "keep_log": False, **parameters}))
+        total_steps = model.simulation_duration_days * model.steps_per_day
+        for _ in range(total_steps):
+            model.step()
+            if max_wall_time is not None and time.perf_counter() - start > max_wall_time:
+                row["run_status"] = "timeout"
+                break
+        model.close()
+        row["steps"] = model.steps
+        row.update(model.summary_metrics())
+    except Exception as error:
+        row["run_status"] = "error"
+        row["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+    row["wall_time"] = time.perf_counter() - start
+    return row
+
+
+def replication_process(connection, run: int, replication: int, seed: int, parameters: dict, max_wall_time: float = None):
+    #entry point of the process of one replication, the row goes back over the pipe
+    connection.send(run_replication(run, replication, seed, parameters, max_wall_time))
+    connection.close()
+
+
+class ResultWriter:
+    #appends result rows to a csv or jsonl file as soon as they come in
+    def __init__(self, filename: str, fieldnames: list):
+        self.filename = filename
+        self.is_jsonl = filename.endswith(".jsonl")
+        self.file = open(filename, "w", newline="")
+        if not self.is_jsonl:
+            self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction="ignore")
+            self.writer.writeheader()
+
+    def write(self, row: dict):
+        if self.is_jsonl:
+            self.file.write(json.dumps(row, default=str) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BatchRunner:
+    """Runs every combination of a parameter grid for a number of replications, at most workers at a time.
+
+    Every replication gets its own seed (base_seed + run number), so a sweep can be repeated exactly.
+    Results are written to one file in the order the runs finish, so a slow replication doesn't hold back
+    the results of the others, and a failing replication only produces an error row.
+    Every replication runs in its own process: a process that dies only produces a crashed row for its own run,
+    and a run that is still going hard_timeout seconds after it started (by default max_wall_time plus a grace
+    period, so a step that hangs is caught too) is killed and reported as killed."""
+
+    def __init__(self, grid: dict, replications: int = 1, output: str = "batch_results.csv", workers: int = None, base_seed: int = 0,
+                 max_wall_time: float = None, hard_timeout: float = None):
+        self.grid = grid
+        self.replications = replications
+        self.output = output
+        self.workers = workers if workers is not None else os.cpu_count()
+        self.base_seed = base_seed
+        self.max_wall_time = max_wall_time
+        if hard_timeout is None and max_wall_time is not None:
+            hard_timeout = max_wall_time + HARD_TIMEOUT_GRACE
+        self.hard_timeout = hard_timeout
+
+    def runs(self):
+        #(run, replication, seed, parameters) of every run in the sweep
+        runs = []
+        for parameters in parameter_combinations(self.grid):
+            for replication in range(self.replications):
+                run = len(runs)
+                runs.append((run, replication, self.base_seed + run, parameters))
+        return runs
+
+    def failed_row(self, spec: tuple, status: str, error: str):
+        run, replication, seed, parameters = spec
+        row = {"run": run, "replication": replication, "seed": seed, "run_status": status, "error": error}
+        row.update(parameters)
+        return row
+
+    def run(self):
+        runs = self.runs()
+        writer = ResultWriter(self.output, list(self.grid) + RESULT_FIELDS)
+        results = []
+        #mesa only works with spawned processes
+        context = multiprocessing.get_context("spawn")
+        pending = deque(runs)
+        #process -> (run, connection, start)
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < self.workers:
+                    spec = pending.popleft()
+                    receiver, sender = context.Pipe(duplex=False)
+                    process = context.Process(target=replication_process, args=(sender, *spec, self.max_wall_time), daemon=True)
+                    process.start()
+                    sender.close()
+                    running[process] = (spec, receiver, time.monotonic())
+
+                timeout = None
+                if self.hard_timeout is not None:
+                    timeout = max(0.0, min(start + self.hard_timeout for _, _, start in running.values()) - time.monotonic())
+                wait([process.sentinel for process in running] + [receiver for _, receiver, _ in running.values()], timeout)
+
+                for process, (spec, receiver, start) in list(running.items()):
+                    row = None
+                    if receiver.poll():
+                        try:
+                            row = receiver.recv()
+                        except EOFError:
+                            #the process died after it opened the pipe but before it sent its row
+                            pass
+                    elif process.is_alive():
+                        if self.hard_timeout is None or time.monotonic() - start < self.hard_timeout:
+                            continue
+                        process.kill()
+                        row = self.failed_row(spec, "killed", f"still running after {self.hard_timeout} s")
+                    process.join()
+                    receiver.close()
+                    if row is None:
+                        #the process died, only this run is affected
+                        row = self.failed_row(spec, "crashed", f"worker process exited with code {process.exitcode}")
+                    del running[process]
+                    writer.write(row)
+                    results.append(row)
+                    print(f"Run {row['run']} ({len(results)}/{len(runs)}) {row['run_status']}")
+        finally:
+            for process in running:
+                process.kill()
+            writer.close()
+        return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of the settlement model over all cores.")
+    parser.add_argument("grid", help="json file with a list of values per model parameter")
+    parser.add_argument("--replications", type=int, default=1)
+    parser.add_argument("--output", default="batch_results.csv", help="csv or jsonl file for the results")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run, every next run gets the next seed")
+    parser.add_argument("--max-wall-time", type=float, default=None, help="seconds after which a run is stopped")
+    parser.add_argument("--hard-timeout", type=float, default=None, help="seconds after which the process of a run is killed, default max wall time + 60")
+    args = parser.parse_args()
+
+    with open(args.grid) as grid_file:
+        grid = json.load(grid_file)
+    runner = BatchRunner(grid, replications=args.replications, output=args.output, workers=args.workers, base_seed=args.seed, max_wall_time=args.max_wall_time,
+                         hard_timeout=args.hard_timeout)
+    runner.run()
+    print(f"Results saved to {args.output}")
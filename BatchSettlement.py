@@ -0,0 +1,171 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+#ordering policies of the batch: attribute of the transaction arrays to sort on and whether the largest comes first
+ORDER_POLICIES = {
+    "fifo": ("creation_time", False),
+    "lifo": ("creation_time", True),
+    "largest": ("amount", True),
+    "smallest": ("amount", False),
+}
+
+
+@dataclass
+class BatchConfig:
+    """End of day batch settings of a model: the ordering policy, the number of worker processes
+    (shards > 1 spreads the batch over them by security type and needs the ledger) and whether
+    the transactions still queued after the batch go through gridlock resolution."""
+    order: str = "fifo"
+    shards: int = 1
+    resolve_gridlock: bool = True
+
+
+def order_transactions(arrays: dict, policy: str):
+    #returns the positions of the transactions in settlement order, ties keep the order of model.transactions
+    if policy not in ORDER_POLICIES:
+        raise ValueError(f"Unknown ordering policy {policy}, choose from {list(ORDER_POLICIES)}")
+    key, descending = ORDER_POLICIES[policy]
+    values = -arrays[key] if descending else arrays[key]
+    return np.argsort(values, kind="stable")
+
+
+def transaction_arrays(transactions: list, ledger):
+    """Collects the legs of the transactions in arrays of ledger slots, so they can be checked and posted at once.
+    A transaction is eligible when both amounts are equal and every account holds the asset it has to deliver or receive.
+    The amounts, security types and accounts are gathered from the columns of the instruction store
+    (transactions can't be empty)."""
+    count = len(transactions)
+    store = transactions[0].model.instruction_store
+    deliverer_rows = np.fromiter((transaction.deliverer.row for transaction in transactions), dtype=np.int64, count=count)
+    receiver_rows = np.fromiter((transaction.receiver.row for transaction in transactions), dtype=np.int64, count=count)
+    creation_times = np.fromiter((transaction.creation_time.timestamp() for transaction in transactions), dtype=np.float64, count=count)
+
+    #store codes -> ledger slots and ledger type codes
+    account_slots = np.array([-1 if account is None else account.slot for account in store.tables["account"].values], dtype=np.int64)
+    security_codes = np.array([ledger.get_type_code(security_type) for security_type in store.tables["security"].values], dtype=np.int16)
+
+    amount = store.amount[deliverer_rows]
+    arrays = {
+        "deliverer_securities": account_slots[store.securities_account[deliverer_rows]],
+        "receiver_securities": account_slots[store.securities_account[receiver_rows]],
+        "receiver_cash": account_slots[store.cash_account[receiver_rows]],
+        "deliverer_cash": account_slots[store.cash_account[deliverer_rows]],
+        "security_code": security_codes[store.security_code[deliverer_rows]],
+        "amount": amount,
+        "creation_time": creation_times,
+        "eligible": (amount == store.amount[receiver_rows]) & (amount > 0),
+    }
+
+    codes = arrays["security_code"]
+    arrays["eligible"] &= ledger.typeCode[arrays["deliverer_securities"]] == codes
+    arrays["eligible"] &= ledger.typeCode[arrays["receiver_securities"]] == codes
+    arrays["eligible"] &= ledger.typeCode[arrays["deliverer_cash"]] == 0
+    arrays["eligible"] &= ledger.typeCode[arrays["receiver_cash"]] == 0
+    return arrays
+
+
+def select_covered(ledger, arrays: dict, order):
+    """Positions (in settlement order) of the transactions that settle: each eligible transaction is taken when the
+    securities of the deliverer and the cash of the receiver cover it next to the transactions taken before it,
+    otherwise it is skipped and the later ones can still use what it would have taken."""
+    eligible = arrays["eligible"][order]
+    amounts = arrays["amount"][order]
+    deliverer_securities = arrays["deliverer_securities"][order]
+    receiver_cash = arrays["receiver_cash"][order]
+
+    #up to the first transaction that isn't covered cumulatively, skipping changes nothing and the check is vectorized
+    used_amounts = np.where(eligible, amounts, 0.0)
+    covered = eligible & (
+        ledger.check(deliverer_securities, used_amounts, arrays["security_code"][order], cumulative=True)
+        & ledger.check(receiver_cash, used_amounts, "Cash", cumulative=True)
+    )
+    uncovered = eligible & ~covered
+    if not uncovered.any():
+        return order[covered]
+    first_skip = int(np.argmax(uncovered))
+    selected = covered.copy()
+    selected[first_skip:] = False
+
+    #from there on the remaining amount per account decides, the eligible check already matched the asset types
+    remaining = ledger.available()
+    np.subtract.at(remaining, deliverer_securities[selected], amounts[selected])
+    np.subtract.at(remaining, receiver_cash[selected], amounts[selected])
+    for position in np.flatnonzero(eligible[first_skip:]) + first_skip:
+        amount = amounts[position]
+        securities = deliverer_securities[position]
+        cash = receiver_cash[position]
+        if remaining[securities] >= amount and remaining[cash] >= amount:
+            remaining[securities] -= amount
+            remaining[cash] -= amount
+            selected[position] = True
+    return order[selected]
+
+
+def post_legs(ledger, arrays: dict, selected, inflows_first: bool = False):
+    #moves securities from deliverer to receiver and cash from receiver to deliverer for the selected transactions
+    amounts = arrays["amount"][selected]
+    codes = arrays["security_code"][selected]
+    if inflows_first:
+        ledger.add(arrays["receiver_securities"][selected], amounts, codes)
+        ledger.add(arrays["deliverer_cash"][selected], amounts, "Cash")
+        ledger.deduct(arrays["deliverer_securities"][selected], amounts, codes)
+        ledger.deduct(arrays["receiver_cash"][selected], amounts, "Cash")
+        return
+    ledger.deduct(arrays["deliverer_securities"][selected], amounts, codes)
+    ledger.add(arrays["receiver_securities"][selected], amounts, codes)
+    ledger.deduct(arrays["receiver_cash"][selected], amounts, "Cash")
+    ledger.add(arrays["deliverer_cash"][selected], amounts, "Cash")
+
+
+class BatchSettlement:
+    """End of business day settlement of all Matched transactions in one vectorized pass over the ledger.
+
+    Transactions are taken in the order of the ordering policy. A transaction settles when the securities
+    of the deliverer and the cash (plus unused credit) of the receiver cover it together with all earlier
+    settling transactions on the same accounts, a transaction that isn't covered is skipped. Incoming legs
+    of the same batch are not counted, so every posted leg is covered without depending on the others."""
+
+    def __init__(self, model, order_policy: str = "fifo"):
+        if order_policy not in ORDER_POLICIES:
+            raise ValueError(f"Unknown ordering policy {order_policy}, choose from {list(ORDER_POLICIES)}")
+        self.model = model
+        self.order_policy = order_policy
+
+    def run(self):
+        matched = [transaction for transaction in self.model.transactions if transaction.status == "Matched"]
+        if not matched:
+            return {"matched": 0, "settled": 0, "settled_value": 0.0}
+
+        if self.model.ledger is None:
+            return self.run_sequential(matched)
+
+        arrays = transaction_arrays(matched, self.model.ledger)
+        order = order_transactions(arrays, self.order_policy)
+        selected = select_covered(self.model.ledger, arrays, order)
+
+        post_legs(self.model.ledger, arrays, selected)
+
+        for position in selected:
+            matched[position].settle_in_batch()
+
+        settled_value = float(arrays["amount"][selected].sum())
+        #logging
+        self.model.log_event(f"Batch settlement settled {len(selected)} of {len(matched)} matched transactions for a value of {settled_value}", "batch", is_transaction = True)
+        return {"matched": len(matched), "settled": len(selected), "settled_value": settled_value}
+
+    def run_sequential(self, matched: list):
+        #without a ledger the transactions are settled one by one in the order of the policy
+        key, descending = ORDER_POLICIES[self.order_policy]
+        if key == "amount":
+            ordered = sorted(matched, key=lambda transaction: transaction.deliverer.amount, reverse=descending)
+        else:
+            ordered = sorted(matched, key=lambda transaction: transaction.creation_time, reverse=descending)
+        settled = 0
+        settled_value = 0.0
+        for transaction in ordered:
+            transaction.settle()
+            if transaction.status == "Settled":
+                settled += 1
+                settled_value += transaction.deliverer.amount
+        return {"matched": len(matched), "settled": settled, "settled_value": settled_value}
@@ -0,0 +1,396 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import traceback
+from datetime import datetime
+
+#columns of every result, keyed by (benchmark, num_institutions, volume) when compared against a baseline
+RESULT_FIELDS = ["benchmark", "num_institutions", "volume", "repeats", "status", "error", "operations",
+                 "best_time", "median_time", "throughput", "peak_memory"]
+#allowed relative drop in throughput or growth in peak memory before a benchmark counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+
+def build_model(num_institutions: int, seed: int, **parameters):
+    #quiet model without an in-memory log, the model modules are imported here like in BatchRunner
+    import SettlementModel
+    import EventLogger
+
+    parameters = {"log": EventLogger.LogConfig(verbosity=EventLogger.QUIET, keep=False), **parameters}
+    return SettlementModel.SettlementModel(num_institutions=num_institutions, seed=seed, **parameters)
+
+
+def create_instructions(model, volume: int):
+    #lets the institutions create instruction pairs until there are volume instructions
+    institutions = model.participants
+    attempts = 0
+    while len(model.instructions) < volume and attempts < 10 * volume:
+        institutions[attempts % len(institutions)].create_instruction()
+        attempts += 1
+    return model.instructions
+
+
+def validate_all(model, volume: int):
+    instructions = create_instructions(model, volume)
+    for instruction in instructions:
+        instruction.set_status("Validated")
+    return instructions
+
+
+def match_all(model, volume: int):
+    for instruction in validate_all(model, volume):
+        if instruction.direction == "delivery" and instruction.status == "Validated":
+            instruction.match()
+    return list(model.transactions)
+
+
+def set_balances(model, securities_balance: float, cash_balance: float = None):
+    for account in model.accounts:
+        if account.accountType != "Cash":
+            account.balance = securities_balance
+        elif cash_balance is not None:
+            account.balance = cash_balance
+
+
+#every benchmark does its setup and returns the timed part, which returns the number of operations it did;
+#a benchmark that holds on to resources (worker processes) sets teardown on it, which is called after the run
+
+def bench_generate_data(num_institutions: int, volume: int, seed: int):
+    #construction of the model, dominated by generate_data; the volume is not used
+    def run():
+        model = build_model(num_institutions, seed)
+        return len(model.accounts)
+    return run
+
+
+def bench_create_instruction(num_institutions: int, volume: int, seed: int):
+    model = build_model(num_institutions, seed)
+    def run():
+        institutions = model.participants
+        for i in range(volume):
+            institutions[i % len(institutions)].create_instruction()
+        return volume
+    return run
+
+
+def bench_match(num_institutions: int, volume: int, seed: int):
+    model = build_model(num_institutions, seed)
+    deliveries = [instruction for instruction in validate_all(model, volume) if instruction.direction == "delivery"]
+    def run():
+        for instruction in deliveries:
+            if instruction.status == "Validated":
+                instruction.match()
+        return len(model.transactions)
+    return run
+
+
+def bench_settle(num_institutions: int, volume: int, seed: int):
+    #every transaction has enough cash and securities and settles fully
+    model = build_model(num_institutions, seed, allow_partial=False)
+    transactions = match_all(model, volume)
+    set_balances(model, securities_balance=1e12, cash_balance=1e12)
+    def run():
+        for transaction in transactions:
+            transaction.settle()
+        return len(transactions)
+    return run
+
+
+def bench_settle_partial(num_institutions: int, volume: int, seed: int):
+    #securities accounts hold less than the instructions ask for, so settle takes the partial settlement path
+    model = build_model(num_institutions, seed, allow_partial=True)
+    transactions = match_all(model, volume)
+    for institution in model.participants:
+        institution.allowPartial = True
+    set_balances(model, securities_balance=50.0, cash_balance=1e12)
+    def run():
+        for transaction in transactions:
+            transaction.settle()
+        return len(transactions)
+    return run
+
+
+def bench_batch_settle(num_institutions: int, volume: int, seed: int, shards: int = 1):
+    #end of day batch over all matched transactions, the securities accounts only cover part of them
+    model = build_model(num_institutions, seed, allow_partial=False, use_ledger=True, batch={"shards": shards})
+    transactions = match_all(model, volume)
+    set_balances(model, securities_balance=20000.0)
+    if shards > 1:
+        #workers are started outside the timed part
+        model.batch_settlement.start()
+    def run():
+        model.batch_settlement.run()
+        return len(transactions)
+    run.teardown = model.close
+    return run
+
+
+def bench_batch_sharded(num_institutions: int, volume: int, seed: int):
+    """The same batch spread over one worker process per security type. It tracks the overhead of sharding
+    next to batch_settle: the selection stays in the model process, so the workers don't make it faster yet."""
+    return bench_batch_settle(num_institutions, volume, seed, shards=4)
+
+
+def bench_account_balance(num_institutions: int, volume: int, seed: int):
+    #alternating addBalance and deductBalance on all accounts
+    model = build_model(num_institutions, seed)
+    accounts = model.accounts
+    def run():
+        for i in range(volume):
+            account = accounts[i % len(accounts)]
+            account.addBalance(100.0, account.accountType)
+            account.deductBalance(100.0, account.accountType)
+        return 2 * volume
+    return run
+
+
+class PlainInstruction:
+    #baseline of instruction_access: the attributes it reads as plain slots of an object
+    __slots__ = ("amount", "status", "securityType", "creation_time", "uniqueID")
+
+    def __init__(self, instruction):
+        for name in self.__slots__:
+            setattr(self, name, getattr(instruction, name))
+
+
+def read_instructions(instructions: list):
+    for instruction in instructions:
+        instruction.amount
+        instruction.status
+        instruction.securityType
+        instruction.creation_time
+        instruction.uniqueID
+    return 5 * len(instructions)
+
+
+def bench_instruction_access(num_institutions: int, volume: int, seed: int):
+    #attribute reads on instruction agents, every read goes through a column of the instruction store
+    model = build_model(num_institutions, seed)
+    instructions = create_instructions(model, volume)
+    def run():
+        return read_instructions(instructions)
+    return run
+
+
+def bench_plain_access(num_institutions: int, volume: int, seed: int):
+    #the same reads on plain attributes, the cost of the store columns is the gap to instruction_access
+    model = build_model(num_institutions, seed)
+    instructions = [PlainInstruction(instruction) for instruction in create_instructions(model, volume)]
+    def run():
+        return read_instructions(instructions)
+    return run
+
+
+def log_entry(model, i: int):
+    #half transaction events, half account activity
+    import EventLogger
+
+    if i % 2 == 0:
+        model.record_event(EventLogger.EventType.INSTRUCTION_VALIDATED, i)
+    else:
+        model.record_event(EventLogger.EventType.CASH_ADDED, i, amount=100.0, balance=float(i), credit=0.0)
+
+
+def bench_log_event(num_institutions: int, volume: int, seed: int):
+    import EventLogger
+
+    #nothing is printed, the entries go to in-memory sinks
+    model = build_model(num_institutions, seed)
+    model.event_logger.event_sinks = [EventLogger.MemoryLogSink()]
+    model.event_logger.activity_sinks = [EventLogger.MemoryLogSink()]
+    def run():
+        for i in range(volume):
+            log_entry(model, i)
+        model.event_logger.flush()
+        return volume
+    return run
+
+
+def bench_save_log(num_institutions: int, volume: int, seed: int):
+    import EventLogger
+
+    model = build_model(num_institutions, seed, log=EventLogger.LogConfig(verbosity=EventLogger.QUIET, keep=True))
+    for i in range(volume):
+        log_entry(model, i)
+    directory = tempfile.mkdtemp(prefix="benchmark-")
+    def run():
+        model.save_log(os.path.join(directory, "event_log.csv"), os.path.join(directory, "activity_log.csv"))
+        return volume
+    return run
+
+
+def bench_cold_start(num_institutions: int, volume: int, seed: int):
+    #fresh interpreter running the headless runner without steps: imports and model construction; the volume is not used
+    runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), "RunSimulation.py")
+    command = [sys.executable, runner, "--institutions", str(num_institutions), "--seed", str(seed), "--steps", "0"]
+    def run():
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        return 1
+    return run
+
+
+BENCHMARKS = {
+    "generate_data": bench_generate_data,
+    "create_instruction": bench_create_instruction,
+    "match": bench_match,
+    "settle": bench_settle,
+    "settle_partial": bench_settle_partial,
+    "batch_settle": bench_batch_settle,
+    "batch_sharded": bench_batch_sharded,
+    "instruction_access": bench_instruction_access,
+    "plain_access": bench_plain_access,
+    "account_balance": bench_account_balance,
+    "log_event": bench_log_event,
+    "save_log": bench_save_log,
+    "cold_start": bench_cold_start,
+}
+
+
+def timed(run):
+    #runs the timed part of a benchmark, returns the operations and the seconds it took
+    try:
+        start = time.perf_counter()
+        operations = run()
+        return operations, time.perf_counter() - start
+    finally:
+        teardown = getattr(run, "teardown", None)
+        if teardown is not None:
+            teardown()
+
+
+def run_benchmark(name: str, num_institutions: int, volume: int, repeats: int = 3, seed: int = 0):
+    """Times the benchmark repeats times, every repeat with a fresh setup, and measures the peak memory
+    of the timed part in one extra run under tracemalloc (tracing slows the code down, so it isn't timed).
+    An untimed warm-up run comes first, so the first repeat doesn't pay for the imports and first-call caches.
+    Errors are caught and reported in the result."""
+    result = {"benchmark": name, "num_institutions": num_institutions, "volume": volume, "repeats": repeats,
+              "status": "ok", "error": "", "operations": 0}
+    try:
+        timed(BENCHMARKS[name](num_institutions, volume, seed))
+        times = []
+        for _ in range(repeats):
+            operations, seconds = timed(BENCHMARKS[name](num_institutions, volume, seed))
+            times.append(seconds)
+
+        run = BENCHMARKS[name](num_institutions, volume, seed)
+        tracemalloc.start()
+        timed(run)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        best_time = min(times)
+        result.update({
+            "operations": operations,
+            "best_time": best_time,
+            "median_time": statistics.median(times),
+            "throughput": operations / best_time if best_time > 0 else float("inf"),
+            "peak_memory": peak_memory,
+        })
+    except Exception as error:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        result["status"] = "error"
+        result["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+    return result
+
+
+def environment():
+    import numpy
+
+    try:
+        import mesa
+        mesa_version = mesa.__version__
+    except ImportError:
+        mesa_version = None
+    return {"python": sys.version.split()[0], "platform": platform.platform(), "numpy": numpy.__version__,
+            "mesa": mesa_version, "date": datetime.now().isoformat(timespec="seconds")}
+
+
+def run_suite(names: list, institution_counts: list, volumes: list, repeats: int = 3, seed: int = 0, verbose: bool = True):
+    results = []
+    for name in names:
+        for num_institutions in institution_counts:
+            for volume in volumes:
+                result = run_benchmark(name, num_institutions, volume, repeats, seed)
+                results.append(result)
+                if verbose:
+                    print(format_result(result))
+    return {"environment": environment(), "results": results}
+
+
+def format_result(result: dict):
+    label = f"{result['benchmark']:<20} institutions={result['num_institutions']:<6} volume={result['volume']:<8}"
+    if result["status"] != "ok":
+        return f"{label} ERROR {result['error']}"
+    return f"{label} {result['throughput']:>12.0f} ops/s  best {result['best_time']:.4f}s  peak {result['peak_memory'] / 1e6:.1f} MB"
+
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE):
+    """Compares the results against a baseline run of the same benchmarks. A benchmark regressed when its
+    throughput dropped or its peak memory grew by more than tolerance. Returns a comparison row per benchmark."""
+    key = lambda result: (result["benchmark"], result["num_institutions"], result["volume"])
+    baseline_results = {key(result): result for result in baseline["results"] if result["status"] == "ok"}
+    comparisons = []
+    for result in results["results"]:
+        base = baseline_results.get(key(result))
+        if base is None or result["status"] != "ok":
+            continue
+        throughput_ratio = result["throughput"] / base["throughput"] if base["throughput"] else float("inf")
+        memory_ratio = result["peak_memory"] / base["peak_memory"] if base["peak_memory"] else 1.0
+        comparisons.append({
+            "benchmark": result["benchmark"],
+            "num_institutions": result["num_institutions"],
+            "volume": result["volume"],
+            "throughput_ratio": throughput_ratio,
+            "memory_ratio": memory_ratio,
+            "regression": throughput_ratio < 1 - tolerance or memory_ratio > 1 + tolerance,
+        })
+    return comparisons
+
+
+def save_results(filename: str, results: dict):
+    with open(filename, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+
+
+def load_results(filename: str):
+    with open(filename) as results_file:
+        return json.load(results_file)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the hot paths of the settlement simulator.")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--institutions", nargs="+", type=int, default=[10, 100], help="institution counts")
+    parser.add_argument("--volume", nargs="+", type=int, default=[1000, 10000], help="instructions or operations per benchmark")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="json file with the results")
+    parser.add_argument("--baseline", default=None, help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative drop in throughput or growth in memory")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.benchmarks, args.institutions, args.volume, args.repeats, args.seed)
+    save_results(args.output, results)
+    print(f"Results saved to {args.output}")
+
+    if args.baseline is not None:
+        comparisons = compare(results, load_results(args.baseline), args.tolerance)
+        for comparison in comparisons:
+            flag = "REGRESSION" if comparison["regression"] else "ok"
+            print(f"{comparison['benchmark']:<20} institutions={comparison['num_institutions']:<6} volume={comparison['volume']:<8} "
+                  f"throughput x{comparison['throughput_ratio']:.2f}  memory x{comparison['memory_ratio']:.2f}  {flag}")
+        #non-zero exit code so a regression fails a CI job
+        return 1 if any(comparison["regression"] for comparison in comparisons) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+import io
+import itertools
+import os
+import pickle
+from dataclasses import dataclass
+
+import numpy as np
+
+import EventLogger
+import Instrumentation
+
+CHECKPOINT_VERSION = 2
+
+
+@dataclass
+class CheckpointConfig:
+    """Checkpoint settings of a model: without directory no checkpoints are written, otherwise one every
+    interval steps (default the end of every business day), incremental ones with a full one every full_every."""
+    directory: str = None
+    interval: int = None
+    incremental: bool = True
+    full_every: int = 10
+
+
+def tracked_arrays(model):
+    #the column arrays of the ledger and the instruction store, they are stored apart from the rest of the state
+    arrays = {}
+    if model.ledger is not None:
+        for name in ("balance", "creditLimit", "usedCredit", "typeCode"):
+            arrays[f"ledger.{name}"] = getattr(model.ledger, name)
+    for name in model.instruction_store.NUMERIC_COLUMNS:
+        arrays[f"instruction_store.{name}"] = getattr(model.instruction_store, name)
+    return arrays
+
+
+def tracked_sequences(model):
+    """The append-only lists and dicts of the model: the archive tables and partial settlements, the log and metrics records kept in memory
+    and the steps of the balance history. They are stored apart from the rest of the state like the arrays,
+    so an incremental checkpoint only has to keep what was appended to them since the previous checkpoint.
+    Logs kept in a deque (max_entries) are bounded and stay in the pickled state."""
+    sequences = {}
+    if model.archive is not None:
+        for table in (model.archive.instructions, model.archive.transactions):
+            for field, column in table.columns.items():
+                sequences[f"archive.{table.name}.{field}"] = column
+            sequences[f"archive.{table.name}.lookup"] = table.lookup
+    table = model.partial_settlements.records
+    for field, column in table.columns.items():
+        sequences[f"{table.name}.{field}"] = column
+    sequences[f"{table.name}.lookup"] = table.lookup
+    for log, sinks in (("event_log", model.event_logger.event_sinks), ("activity_log", model.event_logger.activity_sinks)):
+        for index, sink in enumerate(sinks):
+            if isinstance(sink, EventLogger.MemoryLogSink):
+                for field, column in sink.columns.items():
+                    if isinstance(column, list):
+                        sequences[f"{log}.{index}.{field}"] = column
+    for owner in ("metrics", "instrumentation"):
+        for index, sink in enumerate(getattr(getattr(model, owner), "sinks", None) or []):
+            if isinstance(sink, Instrumentation.MemorySink):
+                sequences[f"{owner}.{index}.steps"] = sink.steps
+                sequences[f"{owner}.{index}.days"] = sink.days
+    if model.balance_history is not None:
+        sequences["balance_history.steps"] = model.balance_history.steps
+    return sequences
+
+
+class StatePickler(pickle.Pickler):
+    """Pickles the model with the tracked arrays and sequences replaced by their names and the checkpointer left out."""
+
+    def __init__(self, file, arrays: dict, sequences: dict, checkpointer):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.array_names = {id(array): name for name, array in arrays.items()}
+        self.sequence_names = {id(sequence): name for name, sequence in sequences.items()}
+        self.checkpointer = checkpointer
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray):
+            return self.array_names.get(id(obj))
+        if isinstance(obj, (list, dict)):
+            return self.sequence_names.get(id(obj))
+        if obj is not None and obj is self.checkpointer:
+            return "checkpointer"
+        return None
+
+
+class StateUnpickler(pickle.Unpickler):
+    def __init__(self, file, arrays: dict, sequences: dict, checkpointer):
+        super().__init__(file)
+        self.arrays = arrays
+        self.sequences = sequences
+        self.checkpointer = checkpointer
+
+    def persistent_load(self, pid):
+        if pid == "checkpointer":
+            return self.checkpointer
+        if pid in self.sequences:
+            return self.sequences[pid]
+        return self.arrays[pid]
+
+
+class Checkpointer:
+    """Writes checkpoints of the full state of a SettlementModel: accounts, institutions, instructions,
+    transactions, the event queue, the random generators, the clock and the step counter.
+
+    Every checkpoint is one binary file. The model is pickled with its column arrays (ledger and
+    instruction store) and its append-only sequences (archive, in-memory logs and records) taken out,
+    they are stored next to it. An incremental checkpoint only keeps the rows of the arrays that
+    changed and the items appended to the sequences since the previous checkpoint and points to that
+    checkpoint as its base, every full_every-th checkpoint is a full one so chains stay short.
+    To find the changed rows the checkpointer keeps a copy of the arrays of the last checkpoint,
+    for the sequences it keeps their length."""
+
+    def __init__(self, directory: str, incremental: bool = True, full_every: int = 10):
+        self.directory = directory
+        self.incremental = incremental
+        self.full_every = full_every
+        self.previous_file = None
+        self.previous_arrays = None
+        #name -> (sequence, length) at the last checkpoint, a sequence that got replaced (e.g. a spilled archive chunk) is stored in full
+        self.previous_sequences = None
+        self.chain_length = 0
+        self.saved = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, model, filename: str = None):
+        #writes a checkpoint of the model after its current step and returns the filename
+        if filename is None:
+            filename = os.path.join(self.directory, f"checkpoint-{model.steps:08d}.ckpt")
+        arrays = tracked_arrays(model)
+        incremental = self.incremental and self.previous_arrays is not None and self.chain_length < self.full_every
+        stored = {}
+        for name, array in arrays.items():
+            if incremental and name in self.previous_arrays:
+                stored[name] = array_diff(self.previous_arrays[name], array)
+            else:
+                stored[name] = array
+
+        #buffered log entries are written first, otherwise a restored run would write them again
+        model.event_logger.flush()
+        sequences = tracked_sequences(model)
+        stored_sequences = {}
+        for name, sequence in sequences.items():
+            previous = self.previous_sequences.get(name) if incremental else None
+            if previous is not None and previous[0] is sequence and len(sequence) >= previous[1]:
+                stored_sequences[name] = sequence_diff(previous[1], sequence)
+            else:
+                stored_sequences[name] = sequence
+
+        state = io.BytesIO()
+        StatePickler(state, arrays, sequences, model.checkpointer).dump(model)
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "step": model.steps,
+            "base": os.path.basename(self.previous_file) if incremental else None,
+            "arrays": stored,
+            "sequences": stored_sequences,
+            "state": state.getvalue(),
+        }
+        with open(filename, "wb") as checkpoint_file:
+            pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.previous_file = filename
+        self.previous_arrays = {name: array.copy() for name, array in arrays.items()}
+        self.previous_sequences = {name: (sequence, len(sequence)) for name, sequence in sequences.items()}
+        self.chain_length = self.chain_length + 1 if incremental else 0
+        self.saved += 1
+        return filename
+
+
+def array_diff(previous: np.ndarray, current: np.ndarray):
+    #(length, rows, values) of the rows that differ, rows added by growing the array are always included
+    common = min(len(previous), len(current))
+    changed = np.flatnonzero(previous[:common] != current[:common])
+    rows = np.concatenate((changed, np.arange(common, len(current))))
+    return (len(current), rows, current[rows])
+
+
+def apply_diff(base: np.ndarray, diff: tuple):
+    length, rows, values = diff
+    array = np.zeros(length, dtype=base.dtype)
+    common = min(len(base), length)
+    array[:common] = base[:common]
+    array[rows] = values
+    return array
+
+
+def sequence_diff(length: int, sequence):
+    #(previous length, appended items) of a list or dict that only grew since the previous checkpoint
+    if isinstance(sequence, dict):
+        return (length, list(itertools.islice(sequence.items(), length, None)))
+    return (length, sequence[length:])
+
+
+def apply_sequence_diff(base, diff: tuple):
+    length, appended = diff
+    if isinstance(base, dict):
+        sequence = dict(itertools.islice(base.items(), length))
+        sequence.update(appended)
+        return sequence
+    return base[:length] + appended
+
+
+def read_checkpoint(filename: str):
+    with open(filename, "rb") as checkpoint_file:
+        checkpoint = pickle.load(checkpoint_file)
+    if checkpoint["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint {filename} has version {checkpoint['version']}, expected {CHECKPOINT_VERSION}")
+    return checkpoint
+
+
+def load_arrays(filename: str, checkpoint: dict = None):
+    #full arrays and sequences of a checkpoint, following the chain of incremental checkpoints back to the last full one
+    if checkpoint is None:
+        checkpoint = read_checkpoint(filename)
+    if checkpoint["base"] is None:
+        return checkpoint["arrays"], checkpoint["sequences"]
+    base_arrays, base_sequences = load_arrays(os.path.join(os.path.dirname(filename), checkpoint["base"]))
+    arrays = {}
+    for name, stored in checkpoint["arrays"].items():
+        arrays[name] = apply_diff(base_arrays[name], stored) if isinstance(stored, tuple) else stored
+    sequences = {}
+    for name, stored in checkpoint["sequences"].items():
+        sequences[name] = apply_sequence_diff(base_sequences[name], stored) if isinstance(stored, tuple) else stored
+    return arrays, sequences
+
+
+def restore(filename: str, checkpointer: Checkpointer = None):
+    """Rebuilds the model from a checkpoint, it continues with the step after the checkpoint.
+    The checkpointer of the restored model is replaced by checkpointer if one is given, which
+    allows a what-if branch to write its checkpoints to another directory."""
+    checkpoint = read_checkpoint(filename)
+    arrays, sequences = load_arrays(filename, checkpoint)
+    if checkpointer is None:
+        #the restored model keeps checkpointing to the same directory, starting with a full checkpoint
+        checkpointer = Checkpointer(os.path.dirname(filename) or ".")
+    return StateUnpickler(io.BytesIO(checkpoint["state"]), arrays, sequences, checkpointer).load()
+
+
+def save(model, filename: str = None):
+    #checkpoint through the checkpointer of the model, a model without one gets a single full checkpoint
+    if model.checkpointer is not None:
+        return model.checkpointer.save(model, filename)
+    if filename is None:
+        raise ValueError("A model without a checkpoint directory needs a filename for its checkpoint")
+    return Checkpointer(os.path.dirname(filename) or ".", incremental=False).save(model, filename)
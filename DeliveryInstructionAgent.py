@@ -1,12 +1,21 @@
+from __future__ import annotations
 from datetime import datetime
+from typing import TYPE_CHECKING
 
 import InstructionAgent
-import SettlementModel
-import InstitutionAgent
-import Account
-import TransactionAgent
+import EventLogger
+
+#modules only used in annotations, importing them at runtime would make the imports circular
+if TYPE_CHECKING:
+    import SettlementModel
+    import InstitutionAgent
+    import Account
+    import TransactionAgent
+
+class DeliveryInstructionAgent(InstructionAgent.InstructionAgent):
+    direction = "delivery"
+    __slots__ = ()
 
-class DeliveryInstructionAgent(InstructionAgent):
     def __init__(self, model: SettlementModel, uniqueID: str, motherID: str, institution: InstitutionAgent, securitiesAccount: Account, cashAccount: Account, securityType: str, amount: float, isChild: bool, status: str, linkcode: str, creation_time: datetime ,linkedTransaction: TransactionAgent = None):
         super().__init__(
             model=model,
@@ -24,30 +33,4 @@ class DeliveryInstructionAgent(InstructionAgent):
             creation_time=creation_time
         )
         # logging ( don't know why is_transaction = True)
-        self.model.log_event(f"Delivery instruction with ID {uniqueID} created by institution {institution} for {securityType} for amount {amount}", self.uniqueID, is_transaction = True)
-
-    def createDeliveryChildren(self):
-        available_securities = self.securitiesAccount.checkBalance(self.amount, self.securityType)
-
-        #takes the minimum of available securities of deliverer and available cash of seller
-        available_to_settle = min(self.securitiesAccount.checkBalance(self.amount, self.securityType),
-                                  self.linkedTransaction.cashAccount.checkBalance(self.amount, self.securityType)
-                                  )
-
-        if available_securities > 0:
-            #create delivery children instructions
-
-            #instant matching and settlement of first child not yet possible, because receipt_child_1 does not yet exist
-            delivery_child_1 = DeliveryInstructionAgent.DeliveryInstructionAgent(self.model, f"{self.uniqueID}_1", self.uniqueID,
-                                                self.institution, self.securitiesAccount, self.cashAccount,
-                                                self.securityType, available_to_settle, True, "Validated", f"{self.linkcode}_1", datetime.now(), None
-                                                )
-            delivery_child_2 = DeliveryInstructionAgent.DeliveryInstructionAgent(self.model, f"{self.uniqueID}_2", self.uniqueID,
-                                                self.institution, self.securitiesAccount, self.cashAccount,
-                                                self.securityType, self.amount - available_to_settle, True, "Validated", f"{self.linkcode}_2", datetime.now(), None
-                                                )
-            #add child instructions to the model
-            self.model.schedule.add(delivery_child_1)
-            self.model.schedule.add(delivery_child_2)
-
-            return delivery_child_1, delivery_child_2
\ No newline at end of file
+        self.model.record_event(EventLogger.EventType.INSTRUCTION_CREATED, self.uniqueID, ref=institution.institutionID, amount=amount, security=securityType, text="Delivery")
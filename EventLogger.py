@@ -0,0 +1,341 @@
+import csv
+import json
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+
+#verbosity levels for printing log entries to the console
+QUIET = 0   #nothing is printed
+ERRORS = 1  #only error messages
+EVENTS = 2  #errors and transaction events (is_transaction = True)
+ALL = 3     #every log entry, also account activity
+
+FIELDNAMES = ['Timestamp', 'Agent ID', 'Event']
+
+
+class EventType(IntEnum):
+    #type of a log record, the readable text of a record is rendered from the template of its type
+    MESSAGE = 0
+    ERROR_MESSAGE = 1
+    ACCOUNT_CREATED = 2
+    CASH_ADDED = 3
+    SECURITIES_ADDED = 4
+    CASH_DEDUCTED = 5
+    SECURITIES_DEDUCTED = 6
+    WRONG_ASSET_TYPE = 7
+    INSTRUCTION_CREATED = 8
+    INSTRUCTION_VALIDATED = 9
+    MATCH_ATTEMPT = 10
+    MATCH_FAILED = 11
+    INSTRUCTION_MATCHED = 12
+    WRONG_STATE = 13
+    INSTRUCTION_SETTLED = 14
+    INSTRUCTION_TIMEOUT = 15
+    INSTRUCTION_PARTIAL = 16
+    TRANSACTION_CREATED = 17
+    SETTLE_ATTEMPT = 18
+    TRANSACTION_SETTLED = 19
+    SETTLED_IN_BATCH = 20
+    NO_ASSETS = 21
+    AMOUNTS_MISMATCH = 22
+    PARTIALLY_SETTLED = 23
+    TRANSACTION_TIMEOUT = 24
+    TRANSACTION_PARTIAL = 25
+
+
+#typed fields of a record: the agent, a reference to another agent or account, the amount of the event,
+#balance and used credit after the event, the security type and a free text field
+RECORD_FIELDS = ("timestamp", "agent_id", "event_type", "ref", "amount", "balance", "credit", "security", "text")
+#columns of the exported logs: the readable columns followed by the typed fields
+EXPORT_FIELDS = FIELDNAMES + ['Event Type', 'Reference', 'Amount', 'Balance', 'Credit', 'Security Type']
+
+TEMPLATES = {
+    EventType.MESSAGE: "{text}",
+    EventType.ERROR_MESSAGE: "{text}",
+    EventType.ACCOUNT_CREATED: "Account {id} of type {security} created with balance {balance} and credit limit {credit}",
+    EventType.CASH_ADDED: "Account {id} added {amount} cash. Total cash amount: {balance}, total credit amount: {credit}",
+    EventType.SECURITIES_ADDED: "Account {id} added {amount} securities of type {security}. New amount: {balance}",
+    EventType.CASH_DEDUCTED: "Account {id} deducted {amount} cash. Total cash amount: {balance}, total credit amount: {credit}",
+    EventType.SECURITIES_DEDUCTED: "Account {id} deducted {amount} securities of type {security}. New amount: {balance}",
+    EventType.WRONG_ASSET_TYPE: "ERROR: account {id} doesn't allow to {text} this type of assets",
+    EventType.INSTRUCTION_CREATED: "{text} instruction with ID {id} created by institution {ref} for {security} for amount {amount}",
+    EventType.INSTRUCTION_VALIDATED: "Instruction {id} validated.",
+    EventType.MATCH_ATTEMPT: "Instruction {id} attempting to match",
+    EventType.MATCH_FAILED: "ERROR: Instruction {id} failed to match, no matching instruction found",
+    EventType.INSTRUCTION_MATCHED: "Instruction {id} matched with instruction {ref} in transaction {text}",
+    EventType.WRONG_STATE: "Error: Instruction {id} in wrong state, impossible to match",
+    EventType.INSTRUCTION_SETTLED: "Instruction {id} settled",
+    EventType.INSTRUCTION_TIMEOUT: "Instruction {id} cancelled due to timeout.",
+    EventType.INSTRUCTION_PARTIAL: "Instruction {id} cancelled due to partial settlement.",
+    EventType.TRANSACTION_CREATED: "Transaction {id} created from account {ref} to account {text}",
+    EventType.SETTLE_ATTEMPT: "Transaction {id} attempting to settle.",
+    EventType.TRANSACTION_SETTLED: "Transaction {id} settled fully.",
+    EventType.SETTLED_IN_BATCH: "Transaction {id} settled fully in batch.",
+    EventType.NO_ASSETS: "Error: Transaction {id} failed due to no cash or securities available",
+    EventType.AMOUNTS_MISMATCH: "ERROR: Transaction {id} cancelled, transferred amounts don't match.",
+    EventType.PARTIALLY_SETTLED: "Transaction {id} partially settled. {text}",
+    EventType.TRANSACTION_TIMEOUT: "Transaction {id} cancelled due to timeout.",
+    EventType.TRANSACTION_PARTIAL: "Transaction {id} cancelled due to partial settlement.",
+}
+
+#types that are printed at verbosity ERRORS
+ERROR_TYPES = frozenset({EventType.ERROR_MESSAGE, EventType.WRONG_ASSET_TYPE, EventType.MATCH_FAILED,
+                         EventType.WRONG_STATE, EventType.NO_ASSETS, EventType.AMOUNTS_MISMATCH})
+#types that only go to the activity log, the other types are transaction events
+#(for free text messages is_transaction is given by the caller)
+ACTIVITY_TYPES = frozenset({EventType.ACCOUNT_CREATED, EventType.CASH_ADDED, EventType.SECURITIES_ADDED,
+                            EventType.CASH_DEDUCTED, EventType.SECURITIES_DEDUCTED, EventType.WRONG_ASSET_TYPE})
+
+
+def render(record: tuple):
+    #readable text of a record, only built when the record is printed or exported
+    timestamp, agent_id, event_type, ref, amount, balance, credit, security, text = record
+    return TEMPLATES[event_type].format(id=agent_id, ref=ref, amount=amount, balance=balance, credit=credit, security=security, text=text)
+
+
+def export_row(record: tuple):
+    #values of a record in the order of EXPORT_FIELDS
+    timestamp, agent_id, event_type, ref, amount, balance, credit, security, text = record
+    return [timestamp, agent_id, render(record), EventType(event_type).name, ref, amount, balance, credit, security]
+
+
+class LogSink:
+    """Base class for the destinations of log records. Records are handed over in batches
+    as tuples in the order of RECORD_FIELDS."""
+
+    def write(self, records: list):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class MemoryLogSink(LogSink):
+    #keeps the records in columns, only the last max_entries if given; the readable entries are rendered when read
+    def __init__(self, max_entries: int = None):
+        self.columns = {field: deque(maxlen=max_entries) if max_entries else [] for field in RECORD_FIELDS}
+
+    def __len__(self):
+        return len(self.columns["timestamp"])
+
+    def write(self, records: list):
+        for field, values in zip(RECORD_FIELDS, zip(*records)):
+            self.columns[field].extend(values)
+
+    def records(self):
+        return zip(*(self.columns[field] for field in RECORD_FIELDS))
+
+    @property
+    def entries(self):
+        return [dict(zip(FIELDNAMES, (record[0], record[1], render(record)))) for record in self.records()]
+
+    def export_rows(self):
+        return [export_row(record) for record in self.records()]
+
+
+class CSVLogSink(LogSink):
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_FIELDS)
+
+    def write(self, records: list):
+        self.writer.writerows(export_row(record) for record in records)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __getstate__(self):
+        #a checkpointed sink keeps its filename, a restored one appends to the same file
+        return {"filename": self.filename}
+
+    def __setstate__(self, state):
+        self.filename = state["filename"]
+        self.file = open(self.filename, 'a', newline='')
+        self.writer = csv.writer(self.file)
+
+
+class JSONLLogSink(LogSink):
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = open(filename, 'w')
+
+    def write(self, records: list):
+        self.file.writelines(json.dumps(dict(zip(EXPORT_FIELDS, export_row(record)))) + "\n" for record in records)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __getstate__(self):
+        return {"filename": self.filename}
+
+    def __setstate__(self, state):
+        self.filename = state["filename"]
+        self.file = open(self.filename, 'a')
+
+
+class ParquetLogSink(LogSink):
+    #every batch becomes a row group with typed columns, pyarrow is only needed when this sink is used
+    NUMERIC = ('Amount', 'Balance', 'Credit')
+
+    def __init__(self, filename: str):
+        import pyarrow
+        import pyarrow.parquet
+
+        self.filename = filename
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.float64() if name in self.NUMERIC else pyarrow.string()) for name in EXPORT_FIELDS])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write(self, records: list):
+        columns = []
+        for name, column in zip(EXPORT_FIELDS, zip(*(export_row(record) for record in records))):
+            convert = float if name in self.NUMERIC else str
+            columns.append([None if value is None else convert(value) for value in column])
+        self.writer.write_table(self.pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+    def __getstate__(self):
+        #a parquet file can't be appended to once it is closed
+        raise TypeError("Parquet log sinks can't be checkpointed, use the csv or jsonl log format")
+
+
+SINK_TYPES = {"csv": CSVLogSink, "jsonl": JSONLLogSink, "parquet": ParquetLogSink}
+
+
+def create_file_sink(filename: str, log_format: str = "csv"):
+    if log_format not in SINK_TYPES:
+        raise ValueError(f"Unknown log format {log_format}, choose from {list(SINK_TYPES)}")
+    return SINK_TYPES[log_format](filename)
+
+
+@dataclass
+class LogConfig:
+    """Logging settings of a model. Without directory the log is kept in memory (keep=False drops it),
+    with a directory it is streamed to event_log and activity_log files in format (csv, jsonl or parquet)."""
+    verbosity: int = ALL
+    directory: str = None
+    format: str = "csv"
+    buffer_size: int = 10000
+    dedup: str = "hash"
+    keep: bool = True
+
+
+class EventLogger:
+    """Buffers log records and hands them to the sinks in batches.
+
+    A record is a tuple of typed fields (RECORD_FIELDS): logging an event builds no text, the readable
+    message is rendered from the template of the event type when the record gets printed or exported.
+    Transaction events go to the event sinks (deduplicated), every record goes to the activity sinks.
+    Duplicates can only have the same timestamp, so the dedup set only holds the records of the
+    current timestamp and memory stays bounded by the buffer size."""
+
+    def __init__(self, event_sinks: list = None, activity_sinks: list = None, buffer_size: int = 10000, dedup: str = "hash", verbosity: int = ALL):
+        if dedup not in ("hash", None):
+            raise ValueError("dedup has to be 'hash' or None")
+        self.event_sinks = event_sinks if event_sinks is not None else []
+        self.activity_sinks = activity_sinks if activity_sinks is not None else []
+        self.buffer_size = buffer_size
+        self.dedup = dedup
+        self.verbosity = verbosity
+
+        self.event_buffer = []
+        self.activity_buffer = []
+        self.current_timestamp = None
+        self.seen_events = set()
+        self.seen_activities = set()
+
+    def record(self, timestamp: str, event_type: EventType, agent_id, ref=None, amount=None, balance=None, credit=None, security=None, text=None, is_transaction: bool = None):
+        #is_transaction follows from the event type, only free text messages have to pass it
+        if is_transaction is None:
+            is_transaction = event_type not in ACTIVITY_TYPES
+        entry = (timestamp, agent_id, event_type, ref, amount, balance, credit, security, text)
+
+        if self.dedup is not None:
+            if timestamp != self.current_timestamp:
+                #timestamps only move forward, older entries can't be duplicated anymore
+                self.current_timestamp = timestamp
+                self.seen_events.clear()
+                self.seen_activities.clear()
+            seen = self.seen_events if is_transaction else self.seen_activities
+            is_new = entry not in seen
+            seen.add(entry)
+        else:
+            is_new = True
+
+        if is_new and self.verbosity and self.should_print(event_type, is_transaction):
+            print(f"{timestamp} | Agent ID: {agent_id} | {render(entry)}")
+
+        if is_transaction and is_new:
+            self.event_buffer.append(entry)
+            if len(self.event_buffer) >= self.buffer_size:
+                self.flush_events()
+
+        self.activity_buffer.append(entry)
+        if len(self.activity_buffer) >= self.buffer_size:
+            self.flush_activities()
+
+    def log(self, timestamp: str, agent_id, message: str, is_transaction: bool = True):
+        #free text message, a message starting with "error" is an error message
+        event_type = EventType.ERROR_MESSAGE if message[:5].lower() == "error" else EventType.MESSAGE
+        self.record(timestamp, event_type, agent_id, text=message, is_transaction=is_transaction)
+
+    def should_print(self, event_type: EventType, is_transaction: bool):
+        if self.verbosity >= ALL:
+            return True
+        if event_type in ERROR_TYPES:
+            return True
+        return self.verbosity >= EVENTS and is_transaction
+
+    def flush_events(self):
+        if self.event_buffer:
+            for sink in self.event_sinks:
+                sink.write(self.event_buffer)
+            self.event_buffer = []
+
+    def flush_activities(self):
+        if self.activity_buffer:
+            for sink in self.activity_sinks:
+                sink.write(self.activity_buffer)
+            self.activity_buffer = []
+
+    def flush(self):
+        self.flush_events()
+        self.flush_activities()
+        for sink in self.event_sinks + self.activity_sinks:
+            sink.flush()
+
+    def close(self):
+        self.flush()
+        for sink in self.event_sinks + self.activity_sinks:
+            sink.close()
+
+    def memory_sink(self, is_transaction: bool = True):
+        #memory sink of the event or activity log, None if that log isn't kept in memory
+        self.flush()
+        for sink in (self.event_sinks if is_transaction else self.activity_sinks):
+            if isinstance(sink, MemoryLogSink):
+                return sink
+        return None
+
+    def export_rows(self, is_transaction: bool = True):
+        #typed rows (EXPORT_FIELDS) kept by the memory sinks, used by save_log of the model
+        sink = self.memory_sink(is_transaction)
+        return sink.export_rows() if sink is not None else []
+
+    def memory_entries(self, is_transaction: bool = True):
+        #entries kept by the memory sinks, used for the event_log and activity_log of the model
+        sink = self.memory_sink(is_transaction)
+        return sink.entries if sink is not None else []
@@ -0,0 +1,53 @@
+import heapq
+
+#kinds of events on the queue
+ARRIVAL = "arrival"          #instruction arrives at its creation_time and becomes Pending
+VALIDATION = "validation"    #instruction gets validated after the validation delay
+MATCHING = "matching"        #validated instruction looks for its counter instruction
+SETTLEMENT = "settlement"    #matched transaction attempts to settle, also used for retries
+#timeouts are kept on the timing wheel of TimingWheel.TimeoutManager
+
+EVENT_KINDS = (ARRIVAL, VALIDATION, MATCHING, SETTLEMENT)
+
+
+class EventScheduler:
+    """Priority queue of timestamped events on the simulated clock.
+
+    Events are (time, kind, target) and get handed to the handler registered for their kind.
+    run_until only pops the events that are due, so the cost of a step is proportional to the
+    number of due events and not to the number of agents. Events with the same time are handled
+    in the order they were scheduled, so a run is deterministic."""
+
+    def __init__(self):
+        self.queue = []
+        #events with the same time keep the order they were scheduled in
+        self.sequence = 0
+        self.handlers = {}
+        self.processed = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def register(self, kind: str, handler):
+        #handler is called as handler(target, time) when an event of this kind is due
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown event kind {kind}, choose from {list(EVENT_KINDS)}")
+        self.handlers[kind] = handler
+
+    def schedule(self, time, kind: str, target):
+        heapq.heappush(self.queue, (time, self.sequence, kind, target))
+        self.sequence += 1
+
+    def next_time(self):
+        #time of the next event, or None if the queue is empty
+        return self.queue[0][0] if self.queue else None
+
+    def run_until(self, now):
+        #handles all events with time <= now, also the ones that get scheduled while handling, returns how many were handled
+        handled = 0
+        while self.queue and self.queue[0][0] <= now:
+            time, _, kind, target = heapq.heappop(self.queue)
+            self.handlers[kind](target, time)
+            handled += 1
+        self.processed += handled
+        return handled
@@ -0,0 +1,105 @@
+import numpy as np
+import BatchSettlement
+
+
+class GridlockResolver:
+    """Finds a large subset of the queued Matched transactions that can settle together on their net positions.
+
+    Transactions that are blocked on their own can often settle when the incoming legs of other
+    transactions are counted. Starting from all queued transactions, the net position of every account
+    (available amount + incoming legs - outgoing legs) is computed. For every account in deficit the
+    outgoing transactions with the lowest priority are removed until the deficit is covered, and this
+    repeats until no account is in deficit, or the accounts left in deficit have no selected outgoing legs
+    (they were short before the batch, the selected transactions only pay into them). Every iteration
+    removes at least one transaction and is a handful of vectorized operations, so it scales to tens of
+    thousands of queued transactions."""
+
+    def __init__(self, model, order_policy: str = "fifo", tolerance: float = 1e-9):
+        self.model = model
+        self.order_policy = order_policy
+        self.tolerance = tolerance
+        #totals over all runs
+        self.runs = 0
+        self.total_settled = 0
+        self.total_unlocked_value = 0.0
+
+    def net_positions(self, arrays: dict, selected):
+        #available amount of every ledger slot after all legs of the selected transactions
+        ledger = self.model.ledger
+        amounts = np.where(selected, arrays["amount"], 0.0)
+        size = ledger.size
+        inflow = (np.bincount(arrays["receiver_securities"], weights=amounts, minlength=size)
+                  + np.bincount(arrays["deliverer_cash"], weights=amounts, minlength=size))
+        outflow = (np.bincount(arrays["deliverer_securities"], weights=amounts, minlength=size)
+                   + np.bincount(arrays["receiver_cash"], weights=amounts, minlength=size))
+        return ledger.available() + inflow - outflow
+
+    def resolve(self, arrays: dict, order):
+        #returns the mask of transactions that can settle together and the number of iterations it took
+        count = len(arrays["amount"])
+        #rank 0 is settled first, the highest rank is removed first
+        rank = np.empty(count, dtype=np.int64)
+        rank[order] = np.arange(count)
+        selected = arrays["eligible"].copy()
+
+        #every transaction has two outgoing legs: securities of the deliverer and cash of the receiver
+        leg_slots = np.concatenate((arrays["deliverer_securities"], arrays["receiver_cash"]))
+        leg_positions = np.concatenate((np.arange(count), np.arange(count)))
+        leg_amounts = np.concatenate((arrays["amount"], arrays["amount"]))
+
+        iterations = 0
+        while True:
+            iterations += 1
+            net = self.net_positions(arrays, selected)
+            deficit = np.maximum(-net, 0.0)
+            deficit[deficit <= self.tolerance] = 0.0
+            if not deficit.any():
+                return selected, iterations
+
+            #outgoing legs of selected transactions on accounts in deficit, lowest priority first per account
+            candidate = selected[leg_positions] & (deficit[leg_slots] > 0)
+            slots = leg_slots[candidate]
+            positions = leg_positions[candidate]
+            amounts = leg_amounts[candidate]
+            legs_order = np.lexsort((-rank[positions], slots))
+            slots = slots[legs_order]
+            positions = positions[legs_order]
+            amounts = amounts[legs_order]
+
+            #remove legs until the removed outflow of the account covers its deficit
+            removed_before = self.model.ledger.running_totals(slots, amounts) - amounts
+            remove = removed_before < deficit[slots] - self.tolerance
+            if not remove.any():
+                #no selected transaction takes anything out of the accounts in deficit, removing more can't help them
+                return selected, iterations
+            selected[positions[remove]] = False
+
+    def run(self):
+        ledger = self.model.ledger
+        queued = [transaction for transaction in self.model.transactions if transaction.status == "Matched"]
+        if ledger is None or not queued:
+            return {"queued": len(queued), "settled": 0, "settled_value": 0.0, "unlocked_value": 0.0, "iterations": 0}
+
+        arrays = BatchSettlement.transaction_arrays(queued, ledger)
+        order = BatchSettlement.order_transactions(arrays, self.order_policy)
+
+        #transactions that are covered on their own, without offsetting
+        individually_covered = np.zeros(len(queued), dtype=bool)
+        individually_covered[BatchSettlement.select_covered(ledger, arrays, order)] = True
+
+        selected, iterations = self.resolve(arrays, order)
+        positions = order[selected[order]]
+
+        #incoming legs are posted first, so the outgoing legs never go through an intermediate deficit
+        BatchSettlement.post_legs(ledger, arrays, positions, inflows_first=True)
+        for position in positions:
+            queued[position].settle_in_batch()
+
+        settled_value = float(arrays["amount"][positions].sum())
+        unlocked_value = float(arrays["amount"][selected & ~individually_covered].sum())
+        self.runs += 1
+        self.total_settled += len(positions)
+        self.total_unlocked_value += unlocked_value
+        #logging
+        self.model.log_event(f"Gridlock resolution settled {len(positions)} of {len(queued)} queued transactions for a value of {settled_value}, unlocking {unlocked_value} in {iterations} iterations", "gridlock", is_transaction = True)
+        return {"queued": len(queued), "settled": len(positions), "settled_value": settled_value, "unlocked_value": unlocked_value, "iterations": iterations}
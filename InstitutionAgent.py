@@ -1,39 +1,52 @@
 #InstitutionAgent
+from __future__ import annotations
 import time
-from random import random
-from datetime import datetime
-import SettlementModel
+from typing import TYPE_CHECKING
 from mesa import Agent, Model
 import ReceiptInstructionAgent
-import InstructionAgent
 import DeliveryInstructionAgent
 import Account
 
+#modules only used in annotations, importing them at runtime would make the imports circular
+if TYPE_CHECKING:
+    import SettlementModel
+
 
 
 
 class InstitutionAgent(Agent):
 
-    def __init__(self, model:SettlementModel, institutionID:str, accounts:list[Account] = [],allowPartial:bool = True):
+    def __init__(self, model:SettlementModel, institutionID:str, accounts:list[Account] = None,allowPartial:bool = True):
         super().__init__(model)
 
         self.institutionID = institutionID
-        self.accounts = accounts
+        self.accounts = accounts if accounts is not None else []
         self.allowPartial = allowPartial
 
+        #accounts are looked up by type through the registry of the model
+        for account in self.accounts:
+            self.model.account_registry.add(self, account)
+
     def opt_out_partial(self):
         if not self.allowPartial:
-            print("Institution Already opted out, cannot opt out again")
+            #logging
+            self.model.log_event(f"Error: institution {self.institutionID} already opted out of partial settlement, cannot opt out again", self.institutionID, is_transaction = False)
         else:
-            self.allowPartiala = False
-            print("Institution opted out of partial settlement")
+            self.allowPartial = False
+            #logging
+            self.model.log_event(f"Institution {self.institutionID} opted out of partial settlement", self.institutionID, is_transaction = False)
 
     def opt_in_partial(self):
         if self.allowPartial:
-            print("Institution Already opted in, cannot opt in again")
+            #logging
+            self.model.log_event(f"Error: institution {self.institutionID} already opted in to partial settlement, cannot opt in again", self.institutionID, is_transaction = False)
         else:
-            self.allow_partial = True
-            print("Institution opted in of partial settlements")
+            self.allowPartial = True
+            #logging
+            self.model.log_event(f"Institution {self.institutionID} opted in to partial settlement", self.institutionID, is_transaction = False)
+            if self.model.wait_list is not None:
+                #waiting transactions can settle partially from now on
+                self.model.wait_list.wake_institution(self)
 
     def check_partial_allowed(self):
         if self.allowPartial == True:
@@ -42,33 +55,36 @@ class InstitutionAgent(Agent):
             return False
 
     def getSecurityAccounts(self, securityType:str):
-        security_accounts = []
-        for account in self.accounts:
-            if account.accountType == securityType:
-                security_accounts.append(account)
-
-        return security_accounts
+        #list kept by the account registry, it shouldn't be changed by the caller
+        return self.model.account_registry.get_accounts(self, securityType)
 
     def create_instruction(self):
-        instruction_type = random.choice(['delivery', 'receipt'])
-        cash_account = self.getSecurityAccounts(self, securityType= "Cash")
-        random_security = random.choice(["Bond-A", "Bond-B", "Bond-C", "Bond-D"])
-        security_account = self.getSecurityAccounts(self, securityType= random_security)
-        amount = round(random.uniform(100, 10000), 2)
+        registry = self.model.account_registry
+        instruction_type = self.random.choice(['delivery', 'receipt'])
+        #only securities this institution holds, traded with another institution that holds them as well
+        security_types = registry.get_security_types(self)
+        if not security_types:
+            return
+        random_security = self.random.choice(security_types)
+        other_institution = registry.sample_counterparty(self, random_security, self.random)
+        if other_institution is None:
+            return
+        cash_account = self.getSecurityAccounts(securityType= "Cash")[0]
+        security_account = self.random.choice(self.getSecurityAccounts(securityType= random_security))
+        amount = round(self.random.uniform(100, 10000), 2)
         model = self.model
         linkedTransaction = None
-        uniqueID = len(self.model.instructions) + 1
-        otherID = len(self.model.instructions) + 2
+        uniqueID = self.model.new_instruction_id()
+        otherID = self.model.new_instruction_id()
         motherID = "mother"
         institution = self
-        other_institution = random.choice([inst for inst in self.model.institutions if inst != self])
         securityType = random_security
-        other_institution_cash_account= other_institution.getSecurityAccounts(securityType= "Cash")
-        other_institution_security_account = other_institution.getSecurityAccounts(securityType=securityType)
+        other_institution_cash_account= other_institution.getSecurityAccounts(securityType= "Cash")[0]
+        other_institution_security_account = self.random.choice(other_institution.getSecurityAccounts(securityType=securityType))
         isChild = False
         status = "Exists"
-        linkcode = "LINK-"+ uniqueID + "L" + otherID
-        instruction_creation_time = datetime.now()
+        linkcode = f"LINK-{uniqueID}L{otherID}"
+        instruction_creation_time = self.model.simulated_time()
         counter_instruction_creation_time = self.model.random_timestamp()
 
         if instruction_type == 'delivery':
@@ -91,21 +107,25 @@ class InstitutionAgent(Agent):
         return
 
 
-    def create_account(self):
-        #not really relevant so far
-        return
+    def create_account(self, accountType: str, balance: float, creditLimit: float = 0):
+        #opens a new account for this institution and registers it in the model
+        new_account = Account.Account.open(model=self.model, accountID=self.model.generate_account_id(), accountType=accountType, balance=balance, creditLimit=creditLimit, ledger=self.model.ledger)
+        self.accounts.append(new_account)
+        self.model.accounts.append(new_account)
+        self.model.account_registry.add(self, new_account)
+        return new_account
 
     def step(self):
 
         #if selected create an instruction and with low probability allow/ disallow partial settlements
 
-        if random.random() <0.5:
+        if self.random.random() <0.5:
             self.create_instruction()
-        if random.random() <0.05:
+        if self.random.random() <0.05:
             self.create_cancelation_instruction()
 
-        if random.random() < 0.01:
-            if self.allow_partial:
+        if self.random.random() < 0.01:
+            if self.allowPartial:
                 self.opt_out_partial()
             else:
                 self.opt_in_partial()
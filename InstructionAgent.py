@@ -1,13 +1,45 @@
+from __future__ import annotations
 from datetime import datetime
-from mesa import Agent
+from typing import TYPE_CHECKING
 import TransactionAgent
-import SettlementModel
-import InstitutionAgent
-import Account
-
-class InstructionAgent (Agent):
-    def __init__(self, model: SettlementModel, uniqueID: str, motherID: str, institution: InstitutionAgent, securitiesAccount: Account, cashAccount: Account, securityType: str, amount: float, isChild: bool, status: str, linkcode: str, creation_time: datetime= datetime.now(), linkedTransaction: TransactionAgent = None):
-        super().__init__(model)
+import EventScheduler
+import InstructionStore
+import EventLogger
+import Archive
+
+#modules only used in annotations, importing them at runtime would make the imports circular
+if TYPE_CHECKING:
+    import SettlementModel
+    import InstitutionAgent
+    import Account
+
+class InstructionAgent:
+    #"delivery" or "receipt", set by the subclasses and used as key in the matching index
+    direction = None
+
+    #the state of an instruction lives in a row of model.instruction_store, the agent is a handle on that row.
+    #instructions act through the event scheduler and are kept in model.instructions, they aren't registered as mesa
+    #agents: the registration and the __dict__ of a mesa agent would cost more than the whole row of the store
+    __slots__ = ("model", "row", "timer")
+
+    uniqueID = InstructionStore.ObjectColumn("uniqueID")
+    motherID = InstructionStore.ObjectColumn("motherID")
+    institution = InstructionStore.CodeColumn("institution", "institution")
+    securitiesAccount = InstructionStore.CodeColumn("securities_account", "account")
+    cashAccount = InstructionStore.CodeColumn("cash_account", "account")
+    securityType = InstructionStore.CodeColumn("security_code", "security")
+    amount = InstructionStore.NumberColumn("amount")
+    isChild = InstructionStore.NumberColumn("is_child")
+    #number of partial settlements the instruction went through, its uniqueID and linkcode stay the same
+    generation = InstructionStore.NumberColumn("generation")
+    status = InstructionStore.CodeColumn("status_code", "status")
+    linkcode = InstructionStore.ObjectColumn("linkcode")
+    creation_time = InstructionStore.TimeColumn("creation_time")
+    linkedTransaction = InstructionStore.ObjectColumn("linkedTransaction")
+
+    def __init__(self, model: SettlementModel, uniqueID: str, motherID: str, institution: InstitutionAgent, securitiesAccount: Account, cashAccount: Account, securityType: str, amount: float, isChild: bool, status: str, linkcode: str, creation_time: datetime = None, linkedTransaction: TransactionAgent = None):
+        self.model = model
+        self.row = model.instruction_store.allocate(self.direction)
         self.uniqueID = uniqueID
         self.motherID = motherID
         self.institution = institution
@@ -16,11 +48,23 @@ class InstructionAgent (Agent):
         self.securityType = securityType
         self.amount = amount
         self.isChild = isChild
+        self.generation = 0
         self.status = status
         self.linkcode = linkcode
-        self.creation_time = creation_time# track creation time for timeout
+        self.creation_time = creation_time if creation_time is not None else model.simulated_time() # track creation time for timeout
         self.linkedTransaction = linkedTransaction
-
+        #timer of the timeout of the current status, None if the status has no timeout
+        self.timer = None
+
+        #register in the matching index of the model so the counter instruction can find it by linkcode
+        self.model.matching_index.add(self)
+        if self.model.metrics is not None:
+            self.model.metrics.instruction_created(self)
+        #new instructions arrive at their creation time, children are created as Validated and get matched right away
+        if self.status == "Exists":
+            self.model.scheduler.schedule(self.creation_time, EventScheduler.ARRIVAL, self)
+        if self.model.timeouts is not None:
+            self.model.timeouts.track_instruction(self)
 
 #getter methods
     def get_model(self):
@@ -76,13 +120,36 @@ class InstructionAgent (Agent):
         return self.creation_time
 
     def set_status(self, new_status: str):
+        old_status = self.status
+        was_terminal = Archive.is_terminal(old_status)
         self.status = new_status
+        if self.model.metrics is not None:
+            self.model.metrics.instruction_status(old_status, new_status)
+        if self.model.live_feed is not None:
+            self.model.live_feed.instruction_status(self, new_status)
+        #matched, settled and cancelled instructions leave the matching index
+        self.model.matching_index.update(self)
+        #settled and cancelled instructions get archived at the next archival stage
+        if self.model.archive is not None and not was_terminal and Archive.is_terminal(new_status):
+            self.model.terminal_instructions.append(self)
+        #the timeout of the new status replaces the one of the old status
+        if self.model.timeouts is not None:
+            self.model.timeouts.track_instruction(self)
+
+    def is_archived(self):
+        return self.row is None
+
+    def remove(self):
+        #takes the archived instruction out of the model and frees its row in the instruction store
+        self.model.matching_index.remove(self)
+        self.model.instruction_store.release(self.row)
+        self.row = None
 
     def insert_instruction(self):
         # TODO: is this just changing state from exists to pending?
-        if self.creation_time < datetime.now():
+        if self.creation_time <= self.model.simulated_time():
             if self.status == 'Exists':
-                self.status = 'Pending'
+                self.set_status('Pending')
         pass
 
     def validate(self):
@@ -91,42 +158,30 @@ class InstructionAgent (Agent):
             self.set_status('Validated')
 
             #logging
-            self.model.log_event(f"Instruction {self.uniqueID} validated.", self.uniqueID, is_transaction = True)
+            self.model.record_event(EventLogger.EventType.INSTRUCTION_VALIDATED, self.uniqueID)
 
     def match(self):
     #matches this instruction with the other instruction with same linkcode
     #creates transactionAgent with the 2 instructions
         #logging
-        self.model.log_event(f"Instruction {self.uniqueID} attempting to match", self.uniqueID, is_transaction = True)
+        self.model.record_event(EventLogger.EventType.MATCH_ATTEMPT, self.uniqueID)
         if self.status == 'Validated':
-            #find other instruction with same linkcode:
-            other_instruction = None
-            for agent in self.model.agents:
-                if (
-                    isinstance(agent, InstructionAgent) #checks if it is an InstructionAgent
-                    and agent.uniqueID != self.uniqueID #checks if it is not itself
-                    and agent.linkcode == self.linkcode #checks if linkcodes match
-                    and agent.status == 'Validated' #checks status of other instruction
-                ):
-                    if( #check if both instructions are of opposite type
-                        isinstance(self, DeliveryInstructionAgent) and isinstance(agent, ReceiptInstructionAgent)
-                    ) or (
-                        isinstance(self, ReceiptInstructionAgent) and isinstance(agent, DeliveryInstructionAgent)
-                    ):
-                        other_instruction = agent
-                        break
-            else:
+            #find other instruction with same linkcode and opposite direction:
+            other_instruction = self.model.matching_index.find_counterpart(self)
+            if other_instruction is None:
                 #logging
-                self.model.log_event(f"ERROR: Instruction {self.uniqueID} failed to match, no matching instruction found", self.uniqueID, is_transaction = True)
+                self.model.record_event(EventLogger.EventType.MATCH_FAILED, self.uniqueID)
+                return None
 
             #create transaction
-            transaction = TransactionAgent(
+            transaction = TransactionAgent.TransactionAgent(
                 model = self.model,
                 transactionID = f"{self.uniqueID}_{other_instruction.uniqueID}",
-                deliverer = self if isinstance(self, DeliveryInstructionAgent) else other_instruction,
-                receiver = self if isinstance(self, ReceiptInstructionAgent) else other_instruction,
+                deliverer = self if self.direction == "delivery" else other_instruction,
+                receiver = self if self.direction == "receipt" else other_instruction,
                 status = "Matched"
             )
+            self.model.transactions.append(transaction)
 
             #link transaction to both instructions:
             self.linkedTransaction = transaction
@@ -137,31 +192,39 @@ class InstructionAgent (Agent):
             other_instruction.set_status("Matched")
 
             #logging
-            self.model.log_event(f"Instruction {self.uniqueID} matched with instruction {self.linkedTransaction.get_uniqueID}", self.uniqueID, is_transaction = True)
+            self.model.record_event(EventLogger.EventType.INSTRUCTION_MATCHED, self.uniqueID, ref=other_instruction.uniqueID, text=transaction.transactionID)
             return transaction
 
         else:
-            self.model.log_event(f"Error: Instruction {self.uniqueID} in wrong state, impossible to match", self.uniqueID, is_transaction = True)
+            self.model.record_event(EventLogger.EventType.WRONG_STATE, self.uniqueID)
 
     def settle(self):
     #only to change state. Actual settlement logic is in TransactionAgent
         if self.status == "Matched":
             self.set_status('Settled')
             #logging
-            self.model.log_event(f"Instruction {self.uniqueID} settled", self.uniqueID, is_transaction = True)
+            self.model.record_event(EventLogger.EventType.INSTRUCTION_SETTLED, self.uniqueID)
 
     def cancel_timout(self):
         #method to cancel instruction due to timeout
-        # TODO
+        self.set_status("Cancelled due to timeout")
         # logging
-        self.model.log_event(f"Instruction {self.uniqueID} cancelled due to timeout.", self.uniqueID, is_transaction=True)
+        self.model.record_event(EventLogger.EventType.INSTRUCTION_TIMEOUT, self.uniqueID)
         pass
 
-    def cancel_partial(self):
-        #method to cancel instruction due to partial settlement.
-        #this instruction gets cancelled, but children get created
-        self.status = "Cancelled due to partial settlement"
-        #logging
-        self.model.log_event(f"Instruction {self.uniqueID} cancelled due to partial settlement.", self.uniqueID, is_transaction = True)
+    def timeout(self):
+        #called by the timeout manager when the timeout of the current status passed
+        if self.status == "Matched" and self.linkedTransaction is not None:
+            #a matched instruction can only be cancelled together with its transaction
+            self.linkedTransaction.cancel_timeout()
+        else:
+            self.cancel_timout()
+
+    def continue_as_child(self, settled_amount: float):
+        #after a partial settlement the instruction continues with the remaining amount in its next generation,
+        #it keeps its uniqueID and linkcode, the settled parts are recorded in model.partial_settlements
+        self.generation = self.generation + 1
+        self.isChild = True
+        self.amount = self.amount - settled_amount
 
 
@@ -0,0 +1,213 @@
+import sys
+import numpy as np
+from datetime import timedelta
+
+#statuses get fixed codes, statuses that are not in this list get the next free code when they are first used
+STATUSES = ["Exists", "Pending", "Validated", "Matched", "Settled",
+            "Cancelled due to partial settlement", "Cancelled due to timeout", "Cancelled due to error"]
+
+DIRECTIONS = [None, "delivery", "receipt"]
+
+#target memory per live instruction: its row in the store (typed columns, object columns and their strings) and its
+#slotted handle, as tracemalloc sees it; at this size a million live instructions take a few hundred MB
+TARGET_BYTES_PER_INSTRUCTION = 256
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+class CodeTable:
+    #maps values (security types, statuses, accounts, institutions) to small integer codes and back
+    def __init__(self, values: list = None):
+        self.values = []
+        self.codes = {}
+        for value in values or []:
+            self.code(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+
+class InstructionStore:
+    """Keeps the state of all instructions in typed column arrays, an instruction agent is a handle on its row.
+
+    Amounts, creation times (microseconds since simulation start), child flags and generations are stored directly,
+    security types, statuses, directions, accounts and institutions as integer codes. Only the ids,
+    linkcodes and linked transactions stay Python objects. Rows of released instructions are reused."""
+
+    NUMERIC_COLUMNS = {
+        "amount": np.float64,
+        "security_code": np.int16,
+        "status_code": np.int8,
+        "direction_code": np.int8,
+        "securities_account": np.int32,
+        "cash_account": np.int32,
+        "institution": np.int32,
+        "creation_time": np.int64,
+        "is_child": np.bool_,
+        "generation": np.int32,
+    }
+    OBJECT_COLUMNS = ("uniqueID", "motherID", "linkcode", "linkedTransaction")
+
+    def __init__(self, simulation_start, capacity: int = 1024):
+        self.simulation_start = simulation_start
+        self.size = 0
+        self.free_rows = []
+        for name, dtype in self.NUMERIC_COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        for name in self.OBJECT_COLUMNS:
+            setattr(self, name, [None] * capacity)
+        self.tables = {
+            "security": CodeTable(),
+            "status": CodeTable(STATUSES),
+            "direction": CodeTable(DIRECTIONS),
+            "account": CodeTable([None]),
+            "institution": CodeTable([None]),
+        }
+
+    def __len__(self):
+        #number of live instructions
+        return self.size - len(self.free_rows)
+
+    @property
+    def capacity(self):
+        return len(self.amount)
+
+    def allocate(self, direction: str = None):
+        #returns a row for a new instruction, a released row if there is one
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow(2 * self.capacity)
+            row = self.size
+            self.size += 1
+        self.direction_code[row] = self.tables["direction"].code(direction)
+        return row
+
+    def release(self, row: int):
+        #frees the row of an instruction that left the model, the object columns drop their references
+        for name in self.OBJECT_COLUMNS:
+            getattr(self, name)[row] = None
+        self.free_rows.append(row)
+
+    def grow(self, capacity: int):
+        for name in self.NUMERIC_COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        for name in self.OBJECT_COLUMNS:
+            getattr(self, name).extend([None] * (capacity - len(getattr(self, name))))
+
+    def status_counts(self):
+        #number of live instructions per status, counted on the status column
+        live = np.ones(self.size, dtype=bool)
+        live[self.free_rows] = False
+        counts = np.bincount(self.status_code[:self.size][live], minlength=len(self.tables["status"]))
+        return {status: int(counts[code]) for code, status in enumerate(self.tables["status"].values) if counts[code]}
+
+    def memory_usage(self, instructions: list = None):
+        """Measures the bytes used by the store: typed columns, object column slots and the id and linkcode strings,
+        and with the live instruction agents (model.instructions) also the agent objects (slots only, no __dict__).
+        store_bytes_per_instruction is compared against TARGET_BYTES_PER_INSTRUCTION, bytes_per_instruction
+        is the whole cost of a live instruction."""
+        numeric = sum(getattr(self, name).nbytes for name in self.NUMERIC_COLUMNS)
+        object_slots = sum(sys.getsizeof(getattr(self, name)) for name in self.OBJECT_COLUMNS)
+        strings = 0
+        for name in ("uniqueID", "motherID", "linkcode"):
+            strings += sum(sys.getsizeof(value) for value in getattr(self, name)[:self.size] if value is not None)
+        agents = 0
+        for instruction in instructions or []:
+            agents += sys.getsizeof(instruction)
+        store = numeric + object_slots + strings
+        total = store + agents
+        live = len(self)
+        return {
+            "instructions": live,
+            "capacity": self.capacity,
+            "numeric_bytes": numeric,
+            "object_bytes": object_slots + strings,
+            "agent_bytes": agents,
+            "total_bytes": total,
+            "store_bytes_per_instruction": store / live if live else 0.0,
+            "bytes_per_instruction": total / live if live else 0.0,
+            "target_bytes_per_instruction": TARGET_BYTES_PER_INSTRUCTION,
+        }
+
+
+def live_row(instruction):
+    #row of the instruction in the store, an archived instruction gave its row back and its state is in the archive
+    row = instruction.row
+    if row is None:
+        raise RuntimeError(f"{type(instruction).__name__} is archived, its state is in model.archive")
+    return row
+
+
+class NumberColumn:
+    #instruction attribute stored directly in a typed column of the store
+    def __init__(self, column: str):
+        self.column = column
+
+    def __get__(self, instruction, owner=None):
+        if instruction is None:
+            return self
+        #item(row) gives the Python value without making a numpy scalar first
+        return getattr(instruction.model.instruction_store, self.column).item(live_row(instruction))
+
+    def __set__(self, instruction, value):
+        getattr(instruction.model.instruction_store, self.column)[live_row(instruction)] = value
+
+
+class CodeColumn:
+    #instruction attribute stored as the code of its value in one of the code tables
+    def __init__(self, column: str, table: str):
+        self.column = column
+        self.table = table
+
+    def __get__(self, instruction, owner=None):
+        if instruction is None:
+            return self
+        store = instruction.model.instruction_store
+        return store.tables[self.table].values[getattr(store, self.column).item(live_row(instruction))]
+
+    def __set__(self, instruction, value):
+        store = instruction.model.instruction_store
+        getattr(store, self.column)[live_row(instruction)] = store.tables[self.table].code(value)
+
+
+class ObjectColumn:
+    #instruction attribute kept as a Python object in a list column
+    def __init__(self, column: str):
+        self.column = column
+
+    def __get__(self, instruction, owner=None):
+        if instruction is None:
+            return self
+        return getattr(instruction.model.instruction_store, self.column)[live_row(instruction)]
+
+    def __set__(self, instruction, value):
+        getattr(instruction.model.instruction_store, self.column)[live_row(instruction)] = value
+
+
+class TimeColumn:
+    #datetime stored as microseconds since the start of the simulation
+    def __init__(self, column: str):
+        self.column = column
+
+    def __get__(self, instruction, owner=None):
+        if instruction is None:
+            return self
+        store = instruction.model.instruction_store
+        return store.simulation_start + getattr(store, self.column).item(live_row(instruction)) * MICROSECOND
+
+    def __set__(self, instruction, value):
+        store = instruction.model.instruction_store
+        getattr(store, self.column)[live_row(instruction)] = (value - store.simulation_start) // MICROSECOND
@@ -0,0 +1,323 @@
+import cProfile
+import csv
+import json
+import time
+from contextlib import nullcontext
+
+#phases of a step: instruction creation, the scheduler handlers, the partial settlement path,
+#the end of day stages, balance history snapshots, logging and checkpoints
+PHASES = ["creation", "arrival", "validation", "matching", "settlement", "partial", "timeout",
+          "batch", "gridlock", "archive", "history", "checkpoint", "logging"]
+
+
+def record_fields():
+    #columns of the step and day records
+    fields = ["step", "day", "wall_time"]
+    for phase in PHASES:
+        fields += [f"{phase}_calls", f"{phase}_time"]
+    return fields
+
+
+class InstrumentationSink:
+    """Base class for the destinations of the instrumentation records, every step and every business day produce one."""
+
+    def begin_step(self, step: int):
+        pass
+
+    def write_step(self, record: dict):
+        pass
+
+    def write_day(self, record: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySink(InstrumentationSink):
+    #keeps the day records, and the step records if keep_steps is set
+    def __init__(self, keep_steps: bool = False):
+        self.keep_steps = keep_steps
+        self.steps = []
+        self.days = []
+
+    def write_step(self, record: dict):
+        if self.keep_steps:
+            self.steps.append(record)
+
+    def write_day(self, record: dict):
+        self.days.append(record)
+
+
+class CSVSink(InstrumentationSink):
+    #time series with one row per step or per business day (level), fieldnames default to the instrumentation records
+    def __init__(self, filename: str, level: str = "step", fieldnames: list = None):
+        self.filename = filename
+        self.level = level
+        self.fieldnames = fieldnames if fieldnames is not None else record_fields()
+        self.file = open(filename, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+        self.writer.writeheader()
+
+    def write_step(self, record: dict):
+        if self.level == "step":
+            self.writer.writerow(record)
+
+    def write_day(self, record: dict):
+        if self.level == "day":
+            self.writer.writerow(record)
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __getstate__(self):
+        #a checkpointed sink keeps its filename, a restored one appends to the same file
+        return {"filename": self.filename, "level": self.level, "fieldnames": self.fieldnames}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.file = open(self.filename, "a", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames)
+
+
+class JSONLSink(InstrumentationSink):
+    def __init__(self, filename: str, level: str = "step"):
+        self.filename = filename
+        self.level = level
+        self.file = open(filename, "w")
+
+    def write_step(self, record: dict):
+        if self.level == "step":
+            self.file.write(json.dumps(record) + "\n")
+
+    def write_day(self, record: dict):
+        if self.level == "day":
+            self.file.write(json.dumps(record) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __getstate__(self):
+        return {"filename": self.filename, "level": self.level}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.file = open(self.filename, "a")
+
+
+class ProfilerSink(InstrumentationSink):
+    """Profiles the steps start_step up to stop_step (not included) and writes the statistics to filename.
+    profiler is "cprofile" (deterministic, pstats file) or "pyinstrument" (sampling, html report), pyinstrument
+    is only imported when it is used."""
+
+    def __init__(self, start_step: int, stop_step: int, filename: str, profiler: str = "cprofile"):
+        if profiler not in ("cprofile", "pyinstrument"):
+            raise ValueError("profiler has to be 'cprofile' or 'pyinstrument'")
+        self.start_step = start_step
+        self.stop_step = stop_step
+        self.filename = filename
+        self.profiler = profiler
+        self.active = None
+
+    def begin_step(self, step: int):
+        if step == self.start_step and self.active is None:
+            if self.profiler == "cprofile":
+                self.active = cProfile.Profile()
+                self.active.enable()
+            else:
+                import pyinstrument
+                self.active = pyinstrument.Profiler()
+                self.active.start()
+        elif step == self.stop_step:
+            self.stop()
+
+    def stop(self):
+        if self.active is None:
+            return
+        if self.profiler == "cprofile":
+            self.active.disable()
+            self.active.dump_stats(self.filename)
+        else:
+            self.active.stop()
+            with open(self.filename, "w") as report_file:
+                report_file.write(self.active.output_html())
+        self.active = None
+
+    def close(self):
+        #a window that is still open at the end of the run is written as well
+        self.stop()
+
+    def __getstate__(self):
+        #a profile in progress isn't part of a checkpoint
+        state = self.__dict__.copy()
+        state["active"] = None
+        return state
+
+
+class TimedCall:
+    #wraps a function so its calls are timed as a phase, picklable as long as the function is
+    def __init__(self, instrumentation, phase: str, function):
+        self.instrumentation = instrumentation
+        self.phase = phase
+        self.function = function
+
+    def __call__(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        instrumentation.enter(self.phase)
+        try:
+            return self.function(*args, **kwargs)
+        finally:
+            instrumentation.exit(self.phase)
+
+
+class PhaseTimer:
+    #context manager for a block of code that is timed as a phase
+    def __init__(self, instrumentation, phase: str):
+        self.instrumentation = instrumentation
+        self.phase = phase
+
+    def __enter__(self):
+        self.instrumentation.enter(self.phase)
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.exit(self.phase)
+
+
+class Instrumentation:
+    """Counts the calls and measures the time of every phase of a step.
+
+    Phases can be nested (e.g. logging inside settlement), the time of a phase only includes the time
+    not spent in the phases nested in it, so the phase times of a step add up to at most its wall time.
+    At the end of every step the counters go to the sinks as a step record, at the end of every
+    business day the summed step records go to the sinks as a day record."""
+
+    enabled = True
+
+    def __init__(self, sinks: list = None):
+        self.sinks = sinks if sinks is not None else [MemorySink()]
+        self.stack = []
+        self.mark = 0.0
+        self.step_calls = dict.fromkeys(PHASES, 0)
+        self.step_times = dict.fromkeys(PHASES, 0.0)
+        self.day_record = None
+        self.total_calls = dict.fromkeys(PHASES, 0)
+        self.total_times = dict.fromkeys(PHASES, 0.0)
+        self.total_wall_time = 0.0
+        self.steps = 0
+        self.days = []
+        self.step_start = None
+
+    def __getstate__(self):
+        #a checkpoint is taken inside a step, the restored model starts with the next step
+        state = self.__dict__.copy()
+        state["stack"] = []
+        state["step_calls"] = dict.fromkeys(PHASES, 0)
+        state["step_times"] = dict.fromkeys(PHASES, 0.0)
+        return state
+
+    def wrap(self, phase: str, function):
+        return TimedCall(self, phase, function)
+
+    def phase(self, phase: str):
+        return PhaseTimer(self, phase)
+
+    def enter(self, phase: str):
+        now = time.perf_counter()
+        if self.stack:
+            #the phase that is interrupted gets the time until now
+            self.step_times[self.stack[-1]] += now - self.mark
+        self.stack.append(phase)
+        self.mark = now
+
+    def exit(self, phase: str):
+        now = time.perf_counter()
+        self.step_times[phase] += now - self.mark
+        self.step_calls[phase] += 1
+        self.stack.pop()
+        self.mark = now
+
+    def begin_step(self, step: int):
+        for sink in self.sinks:
+            sink.begin_step(step)
+        self.step_start = time.perf_counter()
+
+    def end_step(self, step: int, day: int, end_of_day: bool):
+        wall_time = time.perf_counter() - self.step_start
+        record = {"step": step, "day": day, "wall_time": wall_time}
+        for phase in PHASES:
+            record[f"{phase}_calls"] = self.step_calls[phase]
+            record[f"{phase}_time"] = self.step_times[phase]
+            self.total_calls[phase] += self.step_calls[phase]
+            self.total_times[phase] += self.step_times[phase]
+            self.step_calls[phase] = 0
+            self.step_times[phase] = 0.0
+        self.total_wall_time += wall_time
+        self.steps += 1
+        for sink in self.sinks:
+            sink.write_step(record)
+
+        if self.day_record is None:
+            self.day_record = dict(record)
+        else:
+            for field, value in record.items():
+                if field not in ("step", "day"):
+                    self.day_record[field] += value
+        if end_of_day:
+            #the day record carries the last step of the day
+            self.day_record["step"] = step
+            self.days.append({"day": day, "wall_time": self.day_record["wall_time"]})
+            for sink in self.sinks:
+                sink.write_day(self.day_record)
+            self.day_record = None
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def summary(self):
+        #totals per phase over the whole run
+        return {phase: {"calls": self.total_calls[phase], "time": self.total_times[phase]} for phase in PHASES}
+
+    def report(self):
+        """Readable end of run report: calls, time and share of every phase, and the wall time per business day."""
+        lines = [f"{'Phase':<12}{'Calls':>12}{'Time (s)':>12}{'Share':>9}{'us/call':>11}"]
+        for phase in sorted(PHASES, key=lambda phase: -self.total_times[phase]):
+            calls = self.total_calls[phase]
+            if not calls:
+                continue
+            phase_time = self.total_times[phase]
+            share = phase_time / self.total_wall_time if self.total_wall_time else 0.0
+            lines.append(f"{phase:<12}{calls:>12}{phase_time:>12.3f}{share:>9.1%}{1e6 * phase_time / calls:>11.1f}")
+        tracked = sum(self.total_times.values())
+        lines.append(f"{'untracked':<12}{'':>12}{self.total_wall_time - tracked:>12.3f}")
+        per_step = 1e3 * self.total_wall_time / self.steps if self.steps else 0.0
+        lines.append(f"{self.steps} steps in {self.total_wall_time:.3f} s ({per_step:.2f} ms per step)")
+        for day in self.days:
+            lines.append(f"  day {day['day']}: {day['wall_time']:.3f} s")
+        return "\n".join(lines)
+
+
+class NullInstrumentation:
+    #used when instrumentation is off: handlers are registered unwrapped and phases are a shared no-op context
+    enabled = False
+    null_phase = nullcontext()
+
+    def wrap(self, phase: str, function):
+        return function
+
+    def phase(self, phase: str):
+        return self.null_phase
+
+    def begin_step(self, step: int):
+        pass
+
+    def end_step(self, step: int, day: int, end_of_day: bool):
+        pass
+
+    def close(self):
+        pass
+
+    def report(self):
+        return "Instrumentation is off"
@@ -0,0 +1,136 @@
+import numpy as np
+
+#type code of cash accounts, securities types get the next codes when they are first seen
+CASH_CODE = 0
+
+
+class Ledger:
+    """Stores balance, creditLimit and usedCredit of all accounts in contiguous arrays indexed by account slot.
+
+    The batched operations apply the same rules as Account.checkBalance, addBalance and deductBalance:
+    cash accounts can go below zero up to their credit limit (balance is used first, then credit),
+    incoming cash first repays used credit, securities accounts can't go below zero and an account
+    only accepts assets of its own type. Items of one batch that hit the same slot are applied in order."""
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self.balance = np.zeros(capacity, dtype=np.float64)
+        self.creditLimit = np.zeros(capacity, dtype=np.float64)
+        self.usedCredit = np.zeros(capacity, dtype=np.float64)
+        self.typeCode = np.zeros(capacity, dtype=np.int16)
+        self.type_codes = {"Cash": CASH_CODE}
+        self.type_names = ["Cash"]
+
+    def __len__(self):
+        return self.size
+
+    def get_type_code(self, accountType: str):
+        #returns the code of an account type, registers the type if it is new
+        code = self.type_codes.get(accountType)
+        if code is None:
+            code = len(self.type_names)
+            self.type_codes[accountType] = code
+            self.type_names.append(accountType)
+        return code
+
+    def add_account(self, accountType: str, balance: float, creditLimit: float = 0, usedCredit: float = 0):
+        #reserves a slot for a new account and returns it
+        if self.size == len(self.balance):
+            self.grow(2 * len(self.balance))
+        slot = self.size
+        self.balance[slot] = balance
+        self.creditLimit[slot] = creditLimit
+        self.usedCredit[slot] = usedCredit
+        self.typeCode[slot] = self.get_type_code(accountType)
+        self.size += 1
+        return slot
+
+    def add_accounts(self, accountTypes, balances, creditLimits):
+        #reserves slots for a batch of accounts and returns them as an array
+        count = len(balances)
+        if self.size + count > len(self.balance):
+            self.grow(max(2 * len(self.balance), self.size + count))
+        slots = np.arange(self.size, self.size + count)
+        self.balance[slots] = balances
+        self.creditLimit[slots] = creditLimits
+        self.usedCredit[slots] = 0
+        self.typeCode[slots] = [self.get_type_code(accountType) for accountType in accountTypes]
+        self.size += count
+        return slots
+
+    def grow(self, capacity: int):
+        for name in ("balance", "creditLimit", "usedCredit", "typeCode"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def type_codes_for(self, securityTypes, count: int):
+        #accepts a single type name or code, or an array of codes
+        if isinstance(securityTypes, str):
+            return np.full(count, self.get_type_code(securityTypes), dtype=np.int16)
+        return np.broadcast_to(np.asarray(securityTypes, dtype=np.int16), (count,))
+
+    def available(self, slots=None):
+        #amount that can be deducted: balance plus unused credit for cash, balance for securities
+        if slots is None:
+            slots = slice(0, self.size)
+        return self.balance[slots] + self.creditLimit[slots] - self.usedCredit[slots]
+
+    def running_totals(self, slots, amounts):
+        #cumulative amount per slot in batch order, so repeated slots see the earlier items of the batch
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        cumulative = np.cumsum(amounts[order])
+        starts = np.empty(len(slots), dtype=bool)
+        starts[:1] = True
+        starts[1:] = sorted_slots[1:] != sorted_slots[:-1]
+        group_base = np.maximum.accumulate(np.where(starts, cumulative - amounts[order], 0.0))
+        totals = np.empty(len(slots), dtype=np.float64)
+        totals[order] = cumulative - group_base
+        return totals
+
+    def check(self, slots, amounts, securityTypes, cumulative: bool = False):
+        #batched checkBalance, with cumulative=True every item also has to cover the earlier items on its slot
+        slots = np.asarray(slots, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        codes = self.type_codes_for(securityTypes, len(slots))
+        needed = self.running_totals(slots, amounts) if cumulative else amounts
+        return (self.typeCode[slots] == codes) & (self.available(slots) >= needed)
+
+    def deduct(self, slots, amounts, securityTypes):
+        #batched deductBalance, returns the deducted amount per item
+        slots = np.asarray(slots, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        codes = self.type_codes_for(securityTypes, len(slots))
+        amounts = np.where(self.typeCode[slots] == codes, amounts, 0.0)
+
+        #every item gets what is left after the earlier items on the same slot
+        available = self.available(slots)
+        totals = self.running_totals(slots, amounts)
+        deducted = np.minimum(totals, available) - np.minimum(totals - amounts, available)
+
+        #cash is taken from the balance first, the rest from credit
+        total_per_slot = np.bincount(slots, weights=deducted, minlength=self.size)
+        touched = np.flatnonzero(total_per_slot)
+        total = total_per_slot[touched]
+        from_balance = np.minimum(total, np.maximum(self.balance[touched], 0.0))
+        self.balance[touched] -= from_balance
+        self.usedCredit[touched] += total - from_balance
+        return deducted
+
+    def add(self, slots, amounts, securityTypes):
+        #batched addBalance, returns the added amount per item
+        slots = np.asarray(slots, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        codes = self.type_codes_for(securityTypes, len(slots))
+        added = np.where(self.typeCode[slots] == codes, amounts, 0.0)
+
+        #incoming cash first repays used credit, the rest goes to the balance
+        total_per_slot = np.bincount(slots, weights=added, minlength=self.size)
+        touched = np.flatnonzero(total_per_slot)
+        total = total_per_slot[touched]
+        repaid = np.minimum(total, self.usedCredit[touched])
+        self.usedCredit[touched] -= repaid
+        self.balance[touched] += total - repaid
+        return added
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+import Archive
+import TraceReplay
+
+#statuses of instructions waiting to be matched and waiting to be settled
+MATCHING_STATUSES = ("Exists", "Pending", "Validated")
+SETTLEMENT_STATUSES = ("Matched",)
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def decode_record(line, simulation_start):
+    """Decodes one instruction of the feed: a JSON object with the fields of TraceReplay.TRACE_FIELDS,
+    arrival_time is optional (a live instruction arrives when it gets injected)."""
+    raw = json.loads(line)
+    if not isinstance(raw, dict):
+        raise ValueError("a feed record has to be a JSON object")
+    raw.setdefault("arrival_time", 0)
+    return TraceReplay.parse_record(raw, simulation_start)
+
+
+@dataclass
+class FeedConfig:
+    #options of LiveFeed for a model with the live workload, see LiveFeed for their meaning
+    batch_size: int = 1000
+    queue_size: int = 10000
+    max_matching_backlog: int = 50000
+    max_settlement_backlog: int = 50000
+    resume_ratio: float = 0.8
+    latency_window: int = 100000
+
+
+class LiveFeed:
+    """Ingestion front end that takes instructions from an external feed while the model runs as a long lived engine.
+
+    Readers (a TCP or unix socket, a named pipe or submit from the same process) decode the instructions
+    and put them on a bounded queue. The engine loop (run) takes at most batch_size of them before every
+    step, they get created in the creation phase of the step with the current simulated time as arrival.
+
+    Backpressure: after every step the matching backlog (Exists, Pending and Validated instructions) and the
+    settlement backlog (Matched instructions) are compared to their thresholds. When one is exceeded no
+    new batches are taken and the readers stop reading until both are back under resume_ratio of their
+    threshold, so the feed is pushed back through the socket or pipe buffers (and submit waits). The bounded
+    queue does the same when the engine can't keep up with the injection.
+
+    Latency is the wall clock time from decoding an instruction to its settlement, the last latency_window
+    samples are kept for the percentiles. Instructions that get cancelled drop out, partially settled ones give
+    their sample when the rest settles."""
+
+    def __init__(self, model, batch_size: int = 1000, queue_size: int = 10000, max_matching_backlog: int = 50000,
+                 max_settlement_backlog: int = 50000, resume_ratio: float = 0.8, latency_window: int = 100000):
+        self.model = model
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.max_matching_backlog = max_matching_backlog
+        self.max_settlement_backlog = max_settlement_backlog
+        self.resume_ratio = resume_ratio
+        self.institutions = {institution.institutionID: institution for institution in model.participants}
+
+        #decoded records taken from the queue, created in the next step
+        self.pending = []
+        #instruction -> wall clock time it was decoded
+        self.ingest_times = {}
+        self.latencies = deque(maxlen=latency_window)
+        self.received = 0
+        self.rejected = 0
+        self.injected = 0
+        self.skipped = 0
+        self.settled = 0
+        self.paused = False
+        self.pauses = 0
+        self.paused_since = None
+        self.paused_time = 0.0
+        self.stopped = False
+        self.setup_async()
+
+    def setup_async(self):
+        #queue and flow control of the readers, made again when a checkpointed feed is restored
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.accepting = asyncio.Event()
+        if not self.paused:
+            self.accepting.set()
+        self.servers = []
+
+    def __getstate__(self):
+        #records still on the queue move to pending, the asyncio objects belong to the running event loop
+        state = self.__dict__.copy()
+        queued = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+        for record in queued:
+            self.queue.put_nowait(record)
+        #wall clock times don't carry over to another process
+        state["pending"] = [{key: value for key, value in record.items() if key != "ingest_time"} for record in self.pending + queued]
+        state["ingest_times"] = {}
+        state["paused_since"] = None
+        for name in ("queue", "accepting", "servers"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.setup_async()
+
+    #readers
+
+    def decode(self, line):
+        #decoded record with its ingest time, None (logged) if the line is not a valid instruction
+        try:
+            record = decode_record(line, self.model.simulation_start)
+        except (ValueError, KeyError, TypeError) as error:
+            self.rejected += 1
+            #logging
+            self.model.log_event(f"ERROR: feed record rejected: {error}", "feed", is_transaction = True)
+            return None
+        record["ingest_time"] = time.perf_counter()
+        self.received += 1
+        return record
+
+    async def submit(self, record):
+        #in-process feed: takes a record (dict or JSON line) and waits while the engine applies backpressure
+        await self.accepting.wait()
+        record = self.decode(json.dumps(record) if isinstance(record, dict) else record)
+        if record is not None:
+            await self.queue.put(record)
+
+    async def consume(self, reader: asyncio.StreamReader):
+        #reads JSON lines until the end of the stream, stops reading while the engine is paused
+        while not self.stopped:
+            await self.accepting.wait()
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            record = self.decode(line)
+            if record is not None:
+                await self.queue.put(record)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            await self.consume(reader)
+        finally:
+            writer.close()
+
+    async def start_server(self, host: str = "127.0.0.1", port: int = 0):
+        #TCP feed, every connection sends JSON lines; port 0 picks a free port (server.sockets[0].getsockname())
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.servers.append(server)
+        return server
+
+    async def start_unix_server(self, path: str):
+        server = await asyncio.start_unix_server(self.handle_connection, path)
+        self.servers.append(server)
+        return server
+
+    async def read_pipe(self, path: str):
+        #named pipe feed, reads until the writer closes the pipe
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        pipe = os.fdopen(os.open(path, os.O_RDONLY | os.O_NONBLOCK), "rb", buffering=0)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        try:
+            await self.consume(reader)
+        finally:
+            transport.close()
+
+    #engine
+
+    def take_batch(self):
+        #moves at most batch_size records from the queue to pending
+        while len(self.pending) < self.batch_size and not self.queue.empty():
+            self.pending.append(self.queue.get_nowait())
+
+    def inject_pending(self, now):
+        #called in the creation phase of the step, returns how many instructions were created
+        injected = 0
+        for record in self.pending:
+            record["arrival_time"] = now
+            instruction = TraceReplay.create_instruction(self.model, self.institutions, record, "feed")
+            if instruction is None:
+                self.skipped += 1
+                continue
+            if "ingest_time" in record:
+                self.ingest_times[instruction] = record["ingest_time"]
+            injected += 1
+        self.pending = []
+        self.injected += injected
+        return injected
+
+    def instruction_status(self, instruction, new_status: str):
+        #called by InstructionAgent.set_status, a settled feed instruction gives a latency sample
+        if new_status == "Settled":
+            ingest_time = self.ingest_times.pop(instruction, None)
+            if ingest_time is not None:
+                self.latencies.append(time.perf_counter() - ingest_time)
+                self.settled += 1
+        elif Archive.is_terminal(new_status):
+            self.ingest_times.pop(instruction, None)
+
+    def backlog(self):
+        #instructions per status from the metrics aggregator, only counted on the store when the metrics are off
+        metrics = self.model.metrics
+        counts = metrics.instruction_statuses if metrics is not None else self.model.instruction_store.status_counts()
+        return (sum(counts.get(status, 0) for status in MATCHING_STATUSES),
+                sum(counts.get(status, 0) for status in SETTLEMENT_STATUSES))
+
+    def update_backpressure(self):
+        #pauses the readers when a backlog is over its threshold, resumes them when both are under resume_ratio of it
+        matching, settlement = self.backlog()
+        if not self.paused and (matching > self.max_matching_backlog or settlement > self.max_settlement_backlog):
+            self.paused = True
+            self.pauses += 1
+            self.paused_since = time.perf_counter()
+            self.accepting.clear()
+            #logging
+            self.model.log_event(f"Feed paused, matching backlog {matching}, settlement backlog {settlement}", "feed", is_transaction = False)
+        elif self.paused and matching <= self.resume_ratio * self.max_matching_backlog and settlement <= self.resume_ratio * self.max_settlement_backlog:
+            self.paused = False
+            if self.paused_since is not None:
+                self.paused_time += time.perf_counter() - self.paused_since
+            self.paused_since = None
+            self.accepting.set()
+            #logging
+            self.model.log_event(f"Feed resumed, matching backlog {matching}, settlement backlog {settlement}", "feed", is_transaction = False)
+
+    async def run(self, steps: int = None, step_interval: float = 0.0):
+        """Engine loop: takes a batch from the queue, runs a step and updates the backpressure, steps times
+        or until stop. step_interval is the wall clock time between steps, the readers run in between."""
+        done = 0
+        self.stopped = False
+        while not self.stopped and (steps is None or done < steps):
+            if not self.paused:
+                self.take_batch()
+            self.model.step()
+            self.update_backpressure()
+            done += 1
+            await asyncio.sleep(step_interval)
+        return done
+
+    def stop(self):
+        self.stopped = True
+        for server in self.servers:
+            server.close()
+        #readers waiting for the engine get released and see the stop
+        self.accepting.set()
+
+    def latency_percentiles(self):
+        #ingest to settle latency in seconds at LATENCY_PERCENTILES, None without samples
+        if not self.latencies:
+            return {f"p{percentile}": None for percentile in LATENCY_PERCENTILES}
+        values = np.percentile(np.fromiter(self.latencies, dtype=np.float64), LATENCY_PERCENTILES)
+        return {f"p{percentile}": float(value) for percentile, value in zip(LATENCY_PERCENTILES, values)}
+
+    def stats(self):
+        matching, settlement = self.backlog()
+        paused_time = self.paused_time + (time.perf_counter() - self.paused_since if self.paused_since is not None else 0.0)
+        stats = {
+            "received": self.received,
+            "rejected": self.rejected,
+            "injected": self.injected,
+            "skipped": self.skipped,
+            "settled": self.settled,
+            "queued": self.queue.qsize() + len(self.pending),
+            "matching_backlog": matching,
+            "settlement_backlog": settlement,
+            "paused": self.paused,
+            "pauses": self.pauses,
+            "paused_time": paused_time,
+            "latency_samples": len(self.latencies),
+        }
+        stats.update(self.latency_percentiles())
+        return stats
@@ -0,0 +1,58 @@
+#MatchingIndex
+
+# direction of an instruction -> direction of the instruction it has to be matched with
+COUNTERPART_DIRECTION = {"delivery": "receipt", "receipt": "delivery"}
+
+# statuses in which an instruction can still be matched, all other statuses remove it from the index
+OPEN_STATUSES = ("Exists", "Pending", "Validated")
+
+
+class MatchingIndex:
+    """Keeps the open instructions keyed by linkcode and direction, so that
+    finding the counter instruction is a dictionary lookup instead of a scan over all agents."""
+
+    def __init__(self):
+        # linkcode -> {"delivery": instruction, "receipt": instruction}
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def add(self, instruction):
+        #registers an instruction under its linkcode, called on creation. A linkcode has at most one open instruction
+        #per direction, a second one would hide the first from matching
+        entry = self.index.setdefault(instruction.linkcode, {})
+        registered = entry.get(instruction.direction)
+        if registered is not None and registered is not instruction:
+            raise ValueError(f"linkcode {instruction.linkcode} already has an open {instruction.direction} instruction {registered.uniqueID}")
+        entry[instruction.direction] = instruction
+
+    def has_open(self, linkcode, direction: str):
+        #whether an open instruction of the direction is registered under the linkcode
+        entry = self.index.get(linkcode)
+        return entry is not None and direction in entry
+
+    def remove(self, instruction):
+        #removes an instruction once it got matched, settled or cancelled
+        entry = self.index.get(instruction.linkcode)
+        if entry is not None and entry.get(instruction.direction) is instruction:
+            del entry[instruction.direction]
+            if not entry:
+                del self.index[instruction.linkcode]
+
+    def update(self, instruction):
+        #keeps the index in line with a status change of the instruction
+        if instruction.status in OPEN_STATUSES:
+            self.add(instruction)
+        else:
+            self.remove(instruction)
+
+    def find_counterpart(self, instruction):
+        #returns the validated instruction of the opposite direction with the same linkcode, or None
+        entry = self.index.get(instruction.linkcode)
+        if entry is None:
+            return None
+        other_instruction = entry.get(COUNTERPART_DIRECTION.get(instruction.direction))
+        if other_instruction is not None and other_instruction.status == "Validated":
+            return other_instruction
+        return None
@@ -0,0 +1,163 @@
+from collections import Counter
+from dataclasses import dataclass
+
+#flows: counted at every state transition, the step and day records hold what happened during that step or day
+FLOW_FIELDS = [
+    "instructions_created", "children_created", "instructions_validated", "instructions_matched", "instructions_settled",
+    "instructions_cancelled_timeout", "instructions_cancelled_partial", "instructions_cancelled_error",
+    "transactions_created", "matched_value", "transactions_settled", "settled_value", "partial_settlements",
+    "transactions_cancelled_timeout", "transactions_cancelled_error",
+]
+#levels: size of the queues at the end of the step or day
+LEVEL_FIELDS = ["instructions_open", "instructions_queued", "transactions_queued", "settlement_efficiency"]
+
+#status an instruction or transaction moves to -> flow it counts for
+INSTRUCTION_TRANSITIONS = {
+    "Validated": "instructions_validated",
+    "Matched": "instructions_matched",
+    "Settled": "instructions_settled",
+    "Cancelled due to timeout": "instructions_cancelled_timeout",
+    "Cancelled due to partial settlement": "instructions_cancelled_partial",
+    "Cancelled due to error": "instructions_cancelled_error",
+}
+TRANSACTION_TRANSITIONS = {
+    "Settled": "transactions_settled",
+    "Cancelled due to partial settlement": "partial_settlements",
+    "Cancelled due to timeout": "transactions_cancelled_timeout",
+    "Cancelled due to error": "transactions_cancelled_error",
+}
+OPEN_STATUSES = ("Exists", "Pending", "Validated")
+
+
+@dataclass
+class MetricsConfig:
+    #KPI settings of a model: with directory the step and day series are also written there as csv or jsonl
+    enabled: bool = True
+    directory: str = None
+    format: str = "csv"
+
+
+class Metrics:
+    """KPIs of the run, updated at every state transition of instructions and transactions.
+
+    The agents report their creation and every status change, the aggregator keeps running counters
+    (flows), the number of instructions per status and the number of queued transactions, so the memory
+    doesn't grow with the run. At the end of every step the flows of the step and the queue levels go to
+    the sinks as a step record, at the end of every business day the same for the whole day."""
+
+    def __init__(self, security_types: list, sinks: list = None):
+        self.security_types = list(security_types)
+        self.sinks = sinks if sinks is not None else []
+        self.counters = dict.fromkeys(FLOW_FIELDS, 0)
+        self.settled_value_by_type = dict.fromkeys(self.security_types, 0.0)
+        self.instruction_statuses = Counter()
+        self.transactions_queued = 0
+        #totals at the start of the current step and day, the records are the difference
+        self.step_start = self.flows()
+        self.day_start = self.flows()
+
+    def fields(self):
+        #columns of the step and day records
+        return ["step", "day"] + FLOW_FIELDS + [f"settled_value_{security_type}" for security_type in self.security_types] + LEVEL_FIELDS
+
+    def instruction_created(self, instruction):
+        self.counters["instructions_created"] += 1
+        if instruction.isChild:
+            self.counters["children_created"] += 1
+        self.instruction_statuses[instruction.status] += 1
+
+    def instruction_status(self, old_status: str, new_status: str):
+        self.instruction_statuses[old_status] -= 1
+        self.instruction_statuses[new_status] += 1
+        flow = INSTRUCTION_TRANSITIONS.get(new_status)
+        if flow is not None:
+            self.counters[flow] += 1
+
+    def transaction_created(self, transaction):
+        self.counters["transactions_created"] += 1
+        self.counters["matched_value"] += transaction.deliverer.amount
+        if transaction.status == "Matched":
+            self.transactions_queued += 1
+
+    def transaction_status(self, transaction, old_status: str, new_status: str):
+        if old_status == "Matched":
+            self.transactions_queued -= 1
+        if new_status == "Matched":
+            self.transactions_queued += 1
+        flow = TRANSACTION_TRANSITIONS.get(new_status)
+        if flow is not None:
+            self.counters[flow] += 1
+        if new_status == "Settled":
+            amount = transaction.deliverer.amount
+            security_type = transaction.deliverer.securityType
+            self.counters["settled_value"] += amount
+            self.settled_value_by_type[security_type] = self.settled_value_by_type.get(security_type, 0.0) + amount
+
+    def partial_settlement(self, transaction, settled_amount: float):
+        #a partial settlement in place counts like a split into children: the current generation of the instructions and the
+        #transaction as cancelled for partial settlement, a settled part (two instructions and a transaction settled with
+        #settled_amount) and the next generation as created, four instructions and two transactions. The agents keep their status
+        self.counters["partial_settlements"] += 1
+        self.counters["instructions_created"] += 4
+        self.counters["children_created"] += 4
+        self.counters["transactions_created"] += 2
+        self.counters["instructions_cancelled_partial"] += 2
+        self.counters["instructions_settled"] += 2
+        self.counters["transactions_settled"] += 1
+        security_type = transaction.deliverer.securityType
+        self.counters["settled_value"] += settled_amount
+        self.settled_value_by_type[security_type] = self.settled_value_by_type.get(security_type, 0.0) + settled_amount
+
+    def settlement_efficiency(self):
+        #share of the matched value that settled
+        matched_value = self.counters["matched_value"]
+        return self.counters["settled_value"] / matched_value if matched_value else 0.0
+
+    def flows(self):
+        #running totals of all flows, with the settled value per security type
+        totals = dict(self.counters)
+        for security_type, value in self.settled_value_by_type.items():
+            totals[f"settled_value_{security_type}"] = value
+        return totals
+
+    def levels(self):
+        return {
+            "instructions_open": sum(self.instruction_statuses[status] for status in OPEN_STATUSES),
+            "instructions_queued": self.instruction_statuses["Matched"],
+            "transactions_queued": self.transactions_queued,
+            "settlement_efficiency": self.settlement_efficiency(),
+        }
+
+    def end_step(self, step: int, day: int, end_of_day: bool):
+        totals = self.flows()
+        levels = self.levels()
+        record = {"step": step, "day": day}
+        record.update({field: value - self.step_start.get(field, 0) for field, value in totals.items()})
+        record.update(levels)
+        self.step_start = totals
+        for sink in self.sinks:
+            sink.write_step(record)
+        if end_of_day:
+            record = {"step": step, "day": day}
+            record.update({field: value - self.day_start.get(field, 0) for field, value in totals.items()})
+            record.update(levels)
+            self.day_start = totals
+            for sink in self.sinks:
+                sink.write_day(record)
+
+    def summary(self):
+        #totals of the run, the same keys as SettlementModel.summary_metrics
+        created = self.counters["instructions_created"]
+        settled = self.counters["instructions_settled"]
+        return {
+            "instructions_created": created,
+            "instructions_settled": settled,
+            "settlement_rate": settled / created if created else 0.0,
+            "transactions_created": self.counters["transactions_created"],
+            "transactions_settled": self.counters["transactions_settled"],
+            "settled_value": self.counters["settled_value"],
+        }
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
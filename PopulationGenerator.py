@@ -0,0 +1,68 @@
+import os
+import numpy as np
+
+COUNTRY_CODES = ["DE", "FR", "NL", "GB"]
+
+#number of digits after the country code and check digits, 10 digits leave room for far more accounts than generate_iban
+BBAN_DIGITS = 10
+
+
+def generate_account_ids(rng: np.random.Generator, count: int, digits: int = BBAN_DIGITS):
+    """Draws count unique IBAN-like ids (country code, 2 check digits, digits digits) in vectorized batches.
+    Every id is a number in the space of all possible ids, duplicates are dropped and drawn again."""
+    bban_space = 10 ** digits
+    space = len(COUNTRY_CODES) * 90 * bban_space
+    numbers = np.empty(0, dtype=np.int64)
+    while len(numbers) < count:
+        draws = rng.integers(0, space, size=count - len(numbers), dtype=np.int64)
+        combined = np.concatenate((numbers, draws))
+        #keep the first occurrence of every number, in the order they were drawn
+        _, first = np.unique(combined, return_index=True)
+        numbers = combined[np.sort(first)]
+    countries = numbers // (90 * bban_space)
+    check_digits = (numbers // bban_space) % 90 + 10
+    bbans = numbers % bban_space
+    return np.array([f"{COUNTRY_CODES[country]}{check}{bban:0{digits}d}" for country, check, bban in zip(countries.tolist(), check_digits.tolist(), bbans.tolist())])
+
+
+def generate_population(rng: np.random.Generator, num_institutions: int, min_total_accounts: int, max_total_accounts: int, bond_types: list,
+                        balance_range: tuple = (5000, 200000), credit_range: tuple = (100000, 500000)):
+    """Draws all institutions and accounts at once, with the same distributions as SettlementModel.generate_data:
+    every institution gets one cash account with a credit limit followed by securities accounts of random bond types.
+    Returns a dict of arrays with one entry per account."""
+    account_counts = rng.integers(min_total_accounts, max_total_accounts + 1, size=num_institutions)
+    total = int(account_counts.sum())
+    institution = np.repeat(np.arange(num_institutions), account_counts)
+    #the first account of every institution is its cash account
+    first_positions = np.concatenate(([0], np.cumsum(account_counts)[:-1]))
+    is_cash = np.zeros(total, dtype=bool)
+    is_cash[first_positions] = True
+
+    bond_choice = rng.integers(0, len(bond_types), size=total)
+    account_type = np.where(is_cash, "Cash", np.array(bond_types)[bond_choice])
+    balance = np.round(rng.uniform(balance_range[0], balance_range[1], size=total), 2)
+    credit_limit = np.where(is_cash, np.round(rng.uniform(credit_range[0], credit_range[1], size=total), 2), 0.0)
+
+    return {
+        "institution": institution,
+        "accountID": generate_account_ids(rng, total),
+        "accountType": account_type,
+        "balance": balance,
+        "creditLimit": credit_limit,
+    }
+
+
+def save_population(filename: str, population: dict):
+    np.savez_compressed(filename, **population)
+
+
+def load_population(filename: str):
+    if not os.path.exists(filename):
+        filename = filename + ".npz"
+    with np.load(filename, allow_pickle=False) as snapshot:
+        return {name: snapshot[name] for name in snapshot.files}
+
+
+def snapshot_exists(filename: str):
+    #np.savez adds .npz to the filename if it doesn't end with it
+    return os.path.exists(filename) or os.path.exists(filename + ".npz")
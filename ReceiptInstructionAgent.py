@@ -1,13 +1,22 @@
+from __future__ import annotations
 from datetime import datetime
+from typing import TYPE_CHECKING
 
 import InstructionAgent
-import SettlementModel
-import InstitutionAgent
-import Account
-import TransactionAgent
+import EventLogger
 
+#modules only used in annotations, importing them at runtime would make the imports circular
+if TYPE_CHECKING:
+    import SettlementModel
+    import InstitutionAgent
+    import Account
+    import TransactionAgent
+
+
+class ReceiptInstructionAgent(InstructionAgent.InstructionAgent):
+    direction = "receipt"
+    __slots__ = ()
 
-class ReceiptInstructionAgent(InstructionAgent):
     def __init__(self, model: SettlementModel, uniqueID: str, motherID: str, institution: InstitutionAgent,
                  securitiesAccount: Account, cashAccount: Account, securityType: str, amount: float, isChild: bool,
                  status: str, linkcode: str, creation_time: datetime, linkedTransaction: TransactionAgent = None):
@@ -27,34 +36,4 @@ class ReceiptInstructionAgent(InstructionAgent):
             creation_time=creation_time
         )
         # logging ( don't know why is_transaction = True)
-        self.model.log_event(
-            f"Receipt instruction with ID {uniqueID} created by institution {institution} for {securityType} for amount {amount}",
-            self.uniqueID, is_transaction=True)
-
-    def createReceiptChildren(self):
-        available_cash = self.cashAccount.checkBalance(self.amount, self.securityType)
-
-        # takes the minimum of available securities of deliverer and available cash of seller
-        available_to_settle = min(self.linkedTransaction.securitiesAccount.checkBalance(self.amount, self.securityType),
-                                  self.cashAccount.checkBalance(self.amount, self.securityType)
-                                  )
-
-        if available_cash > 0:
-            # create delivery children instructions
-
-            # instant matching and settlement of first child not yet possible, because receipt_child_1 does not yet exist
-            receipt_child_1 = ReceiptInstructionAgent.ReceiptInstructionAgent(self.model, f"{self.uniqueID}_1", self.uniqueID,
-                                                self.institution, self.securitiesAccount, self.cashAccount,
-                                                self.securityType, available_to_settle, True, "Validated",
-                                                f"{self.linkcode}_1", creation_time=datetime.now(), TransactionAgent=None
-                                                )
-            receipt_child_2 = ReceiptInstructionAgent.ReceiptInstructionAgent(self.model, f"{self.uniqueID}_2", self.uniqueID,
-                                                self.institution, self.securitiesAccount, self.cashAccount,
-                                                self.securityType, self.amount - available_to_settle, True,
-                                                "Validated", f"{self.linkcode}_2", creation_time=datetime.now(), TransactionAgent = None
-                                                )
-            # add child instructions to the model
-            self.model.schedule.add(receipt_child_1)
-            self.model.schedule.add(receipt_child_2)
-
-            return receipt_child_1, receipt_child_2
+        self.model.record_event(EventLogger.EventType.INSTRUCTION_CREATED, self.uniqueID, ref=institution.institutionID, amount=amount, security=securityType, text="Receipt")
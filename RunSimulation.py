@@ -0,0 +1,275 @@
+import time
+
+#start of the process as far as this runner can see it, the cold start is measured from here
+STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+#model parameters that take a timedelta, given in seconds on the command line and in config files
+TIMEDELTA_PARAMETERS = ("validation_delay", "settlement_retry_interval", "instruction_timeout", "transaction_timeout")
+VERBOSITY_LEVELS = {"quiet": 0, "errors": 1, "events": 2, "all": 3}
+#options of the run itself, every other key of a config file is a model parameter
+RUN_OPTIONS = ("steps", "summary", "event_log", "activity_log", "startup_budget", "feed_host", "feed_port", "feed_socket", "feed_pipe", "step_interval")
+#run options that give the source of the live workload
+FEED_OPTIONS = ("feed_port", "feed_socket", "feed_pipe")
+#model parameters that take a config object, given as a table of its fields (e.g. [log] in toml), as dotted names (log.verbosity)
+#or as the flat names below, which set one field of a group
+CONFIG_GROUPS = ("log", "batch", "feed", "checkpoints", "metrics")
+GROUPED_PARAMETERS = {
+    "log_verbosity": ("log", "verbosity"),
+    "log_dir": ("log", "directory"),
+    "log_format": ("log", "format"),
+    "log_buffer_size": ("log", "buffer_size"),
+    "log_dedup": ("log", "dedup"),
+    "keep_log": ("log", "keep"),
+    "batch_order": ("batch", "order"),
+    "settlement_shards": ("batch", "shards"),
+    "resolve_gridlock": ("batch", "resolve_gridlock"),
+    "feed_batch_size": ("feed", "batch_size"),
+    "feed_queue_size": ("feed", "queue_size"),
+    "feed_max_matching_backlog": ("feed", "max_matching_backlog"),
+    "feed_max_settlement_backlog": ("feed", "max_settlement_backlog"),
+    "checkpoint_dir": ("checkpoints", "directory"),
+    "checkpoint_interval": ("checkpoints", "interval"),
+    "checkpoint_incremental": ("checkpoints", "incremental"),
+    "metrics": ("metrics", "enabled"),
+    "metrics_dir": ("metrics", "directory"),
+    "metrics_format": ("metrics", "format"),
+}
+#flag -> model parameter
+PARAMETER_FLAGS = {
+    "institutions": "num_institutions",
+    "days": "simulation_duration_days",
+    "steps_per_day": "steps_per_day",
+    "seed": "seed",
+    "log_dir": "log.directory",
+    "log_format": "log.format",
+    "metrics_dir": "metrics.directory",
+    "metrics_format": "metrics.format",
+    "checkpoint_dir": "checkpoints.directory",
+    "archive_dir": "archive_dir",
+    "balance_history_dir": "balance_history_dir",
+    "population": "population",
+    "population_snapshot": "population_snapshot",
+    "workload": "workload",
+    "trace": "trace_path",
+    "shards": "batch.shards",
+    "verbosity": "log.verbosity",
+}
+
+
+def load_config(filename: str):
+    #json or toml file with model parameters and run options
+    if filename.endswith(".toml"):
+        import tomllib
+
+        with open(filename, "rb") as config_file:
+            return tomllib.load(config_file)
+    with open(filename) as config_file:
+        return json.load(config_file)
+
+
+def parse_value(value: str):
+    #value of --set, json if it parses (numbers, booleans, lists, objects), else the plain string
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def group_parameters(parameters: dict):
+    #collects the settings of every config group in one dict of its fields, the flat and dotted names win over a table
+    grouped = {}
+    for name, value in parameters.items():
+        if name in CONFIG_GROUPS and isinstance(value, dict):
+            grouped.setdefault(name, {}).update(value)
+    for name, value in parameters.items():
+        if name in CONFIG_GROUPS and isinstance(value, dict):
+            continue
+        if name in GROUPED_PARAMETERS:
+            group, field = GROUPED_PARAMETERS[name]
+        elif "." in name:
+            group, field = name.split(".", 1)
+            if group not in CONFIG_GROUPS:
+                raise ValueError(f"Unknown settings group {group}, choose from {list(CONFIG_GROUPS)}")
+        else:
+            grouped[name] = value
+            continue
+        grouped.setdefault(group, {})[field] = value
+    return grouped
+
+
+def convert_parameters(parameters: dict):
+    """Turns parameters as they come from a config file or the command line into the types of the model:
+    settings of a subsystem into a dict per config group, seconds into timedeltas, ISO dates into datetimes,
+    verbosity names into levels and lists into tuples."""
+    parameters = group_parameters(parameters)
+    for name in TIMEDELTA_PARAMETERS:
+        if isinstance(parameters.get(name), (int, float)):
+            parameters[name] = timedelta(seconds=parameters[name])
+    if parameters.get("instruction_timeouts") is not None:
+        parameters["instruction_timeouts"] = {status: timedelta(seconds=timeout) if isinstance(timeout, (int, float)) else timeout
+                                              for status, timeout in parameters["instruction_timeouts"].items()}
+    if isinstance(parameters.get("simulation_start"), str):
+        parameters["simulation_start"] = datetime.fromisoformat(parameters["simulation_start"])
+    log = parameters.get("log", {})
+    if isinstance(log.get("verbosity"), str):
+        log["verbosity"] = VERBOSITY_LEVELS[log["verbosity"].lower()]
+    if parameters.get("profile_steps") is not None:
+        parameters["profile_steps"] = tuple(parameters["profile_steps"])
+    return parameters
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Runs the settlement model without prompts, from a config file and/or flags (flags win).")
+    parser.add_argument("--config", default=None, help="json or toml file with model parameters and run options")
+    parser.add_argument("--institutions", type=int)
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--steps-per-day", type=int)
+    parser.add_argument("--steps", type=int, help="steps to run, default days * steps per day")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--log-dir", help="directory the event and activity logs are streamed to")
+    parser.add_argument("--log-format", choices=["csv", "jsonl", "parquet"])
+    parser.add_argument("--event-log", help="csv file the event log is exported to at the end (keeps the log in memory)")
+    parser.add_argument("--activity-log", help="csv file the activity log is exported to at the end (keeps the log in memory)")
+    parser.add_argument("--metrics-dir")
+    parser.add_argument("--metrics-format", choices=["csv", "jsonl"])
+    parser.add_argument("--checkpoint-dir")
+    parser.add_argument("--archive-dir")
+    parser.add_argument("--balance-history-dir", help="directory for the memory mapped balance history of all accounts")
+    parser.add_argument("--population", choices=["random", "bulk"])
+    parser.add_argument("--population-snapshot")
+    parser.add_argument("--workload", choices=["random", "replay", "live"])
+    parser.add_argument("--trace", help="trace file for the replay workload")
+    parser.add_argument("--feed-host", help="address the TCP feed of the live workload listens on, default 127.0.0.1")
+    parser.add_argument("--feed-port", type=int, help="TCP port of the live workload, JSON lines per connection")
+    parser.add_argument("--feed-socket", help="unix socket of the live workload, JSON lines per connection")
+    parser.add_argument("--feed-pipe", help="named pipe of the live workload, read until the writer closes it")
+    parser.add_argument("--step-interval", type=float, help="wall clock seconds between the steps of the live workload")
+    parser.add_argument("--shards", type=int, help="worker processes of the batch settlement")
+    parser.add_argument("--use-ledger", action="store_true", default=None)
+    parser.add_argument("--verbosity", choices=list(VERBOSITY_LEVELS))
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="any other model parameter (log.buffer_size for a field of a config group), the value is parsed as json")
+    parser.add_argument("--summary", help="json file for the summary, default stdout")
+    parser.add_argument("--startup-budget", type=float, help="seconds the start up (imports and model construction) may take")
+    return parser
+
+
+def settings(args):
+    #model parameters and run options of the config file, overridden by the flags
+    config = load_config(args.config) if args.config is not None else {}
+    options = {name: config.pop(name) for name in RUN_OPTIONS if name in config}
+    parameters = config
+    for flag, name in PARAMETER_FLAGS.items():
+        value = getattr(args, flag)
+        if value is not None:
+            parameters[name] = value
+    if args.use_ledger:
+        parameters["use_ledger"] = True
+    for assignment in args.set:
+        name, separator, value = assignment.partition("=")
+        if not separator:
+            raise ValueError(f"--set takes NAME=VALUE, got {assignment}")
+        parameters[name.strip()] = parse_value(value)
+    for name in RUN_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            options[name] = value
+    if "trace_path" in parameters:
+        parameters.setdefault("workload", "replay")
+    if any(name in options for name in FEED_OPTIONS):
+        parameters.setdefault("workload", "live")
+    if parameters.get("workload") == "live" and not any(name in options for name in FEED_OPTIONS):
+        raise ValueError("a live workload needs a feed: --feed-port, --feed-socket or --feed-pipe")
+    parameters = convert_parameters(parameters)
+    #headless runs print nothing and only keep the log in memory when it gets exported at the end
+    log = parameters.setdefault("log", {})
+    log.setdefault("verbosity", VERBOSITY_LEVELS["quiet"])
+    log.setdefault("keep", "event_log" in options or "activity_log" in options)
+    return parameters, options
+
+
+async def serve_feed(feed, steps: int, options: dict):
+    #the readers of the live workload run next to the engine loop of the feed until the steps are done
+    import asyncio
+
+    if options.get("feed_port") is not None:
+        await feed.start_server(options.get("feed_host", "127.0.0.1"), options["feed_port"])
+    if options.get("feed_socket") is not None:
+        await feed.start_unix_server(options["feed_socket"])
+    readers = [asyncio.create_task(feed.read_pipe(options["feed_pipe"]))] if options.get("feed_pipe") is not None else []
+    try:
+        return await feed.run(steps, options.get("step_interval", 0.0))
+    finally:
+        feed.stop()
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+
+
+def run(parameters: dict, options: dict):
+    """Builds the model, runs it and returns the summary: the metrics of the run, the start up time
+    (from the start of this module to a constructed model) and the wall time of the steps.
+    A live workload runs the steps in the engine loop of its feed and adds the feed stats to the summary."""
+    #the model modules (and mesa) are the heavy part of the start up, they load only once the settings are valid
+    import SettlementModel
+
+    model = SettlementModel.SettlementModel(**parameters)
+    startup_time = time.perf_counter() - STARTED
+    steps = options.get("steps")
+    if steps is None:
+        steps = model.simulation_duration_days * model.steps_per_day
+
+    start = time.perf_counter()
+    try:
+        if model.live_feed is not None:
+            import asyncio
+
+            asyncio.run(serve_feed(model.live_feed, steps, options))
+        else:
+            for _ in range(steps):
+                model.step()
+        if model.log_dir is not None or "event_log" in options or "activity_log" in options:
+            model.save_log(options.get("event_log"), options.get("activity_log"))
+    finally:
+        model.close()
+    summary = {"steps": model.steps, "startup_time": startup_time, "wall_time": time.perf_counter() - start}
+    summary.update(model.summary_metrics())
+    if model.live_feed is not None:
+        summary["feed"] = model.live_feed.stats()
+    budget = options.get("startup_budget")
+    if budget is not None:
+        summary["startup_budget"] = budget
+        summary["over_budget"] = startup_time > budget
+    return summary
+
+
+def main(argv: list = None):
+    args = build_parser().parse_args(argv)
+    try:
+        parameters, options = settings(args)
+    except (ValueError, KeyError, OSError) as error:
+        print(f"Invalid settings: {error}", file=sys.stderr)
+        return 2
+
+    summary = run(parameters, options)
+    if summary.get("over_budget"):
+        print(f"Start up took {summary['startup_time']:.3f} s, over the budget of {summary['startup_budget']:.3f} s", file=sys.stderr)
+    if options.get("summary") is not None:
+        directory = os.path.dirname(options["summary"])
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(options["summary"], "w") as summary_file:
+            json.dump(summary, summary_file, indent=2, default=str)
+    else:
+        print(json.dumps(summary, default=str))
+    #an exceeded budget fails the run, so a scheduler notices a slow start
+    return 1 if summary.get("over_budget") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,143 +1,517 @@
 from mesa import Model
 from datetime import datetime, timedelta
-import pandas as pd
+from functools import partial
+import os
 import InstitutionAgent
 import Account
+import MatchingIndex
+import EventLogger
+import Ledger
+import BatchSettlement
+import ShardedSettlement
+import GridlockResolver
+import EventScheduler
+import InstructionStore
+import Archive
+import AccountRegistry
+import PopulationGenerator
+import TraceReplay
+import LiveFeed
+import Checkpoint
+import Instrumentation
+import WaitList
+import TimingWheel
+import Metrics
+import BalanceHistory
 import random
+import numpy as np
 
-def generate_iban():
+#default start of the simulated clock, fixed so that runs with the same seed are identical
+SIMULATION_START = datetime(2025, 1, 1)
+
+def generate_iban(rng: random.Random = random):
     """Generate a simple IBAN-like string.
     Example: 'DE45' + 16 digits.
     """
-    country_code = random.choice(["DE", "FR", "NL", "GB"])
-    check_digits = str(random.randint(10, 99))
-    bban = ''.join(random.choices("0123456789", k=5))
+    country_code = rng.choice(["DE", "FR", "NL", "GB"])
+    check_digits = str(rng.randint(10, 99))
+    bban = ''.join(rng.choices("0123456789", k=5))
     return f"{country_code}{check_digits}{bban}"
 
 
+def make_config(config_class, value):
+    #settings of a subsystem: a config object, a dict of its fields (e.g. from a config file) or None for the defaults
+    if value is None:
+        return config_class()
+    if isinstance(value, dict):
+        return config_class(**value)
+    return value
+
+
 class SettlementModel(Model):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, num_institutions: int = 5, min_total_accounts: int = 2, max_total_accounts: int = 6, simulation_duration_days: int = 10, steps_per_day: int = 500, allow_partial: bool = True,
+                 log: EventLogger.LogConfig = None, use_ledger: bool = False, batch: BatchSettlement.BatchConfig = None,
+                 validation_delay: timedelta = timedelta(seconds=1), settlement_retry: str = "waitlist", settlement_retry_interval: timedelta = None,
+                 instruction_timeout: timedelta = None, instruction_timeouts: dict = None, transaction_timeout: timedelta = None,
+                 archive: bool = True, archive_interval: int = None, archive_dir: str = None, archive_chunk_size: int = 100000,
+                 population: str = "random", population_snapshot: str = None,
+                 workload: str = "random", trace_path: str = None, trace_format: str = None, feed: LiveFeed.FeedConfig = None,
+                 checkpoints: Checkpoint.CheckpointConfig = None, metrics: Metrics.MetricsConfig = None,
+                 balance_history_dir: str = None, balance_history_interval = 1,
+                 instrument: bool = False, instrumentation_dir: str = None, instrumentation_format: str = "csv", profile_steps: tuple = None, profiler: str = "cprofile",
+                 seed: int = None, simulation_start: datetime = SIMULATION_START):
+        #self.random (and self.rng) is the only source of randomness, seeded so runs can be reproduced
+        super().__init__(seed=seed)
+        #the logging, batch, live feed, checkpoint and metrics settings come as config objects (or dicts of their fields)
+        log = make_config(EventLogger.LogConfig, log)
+        batch = make_config(BatchSettlement.BatchConfig, batch)
+        feed = make_config(LiveFeed.FeedConfig, feed)
+        checkpoints = make_config(Checkpoint.CheckpointConfig, checkpoints)
+        metrics = make_config(Metrics.MetricsConfig, metrics)
 
         #parameters of the model
-        self.num_institutions = 5
-        self.min_total_accounts = 2
-        self.max_total_accounts = 6
-        self.simulation_duration_days = 10
+        self.num_institutions = num_institutions
+        self.min_total_accounts = min_total_accounts
+        self.max_total_accounts = max_total_accounts
+        self.simulation_duration_days = simulation_duration_days
         self.bond_types = ["Bond-A", "Bond-B", "Bond-C", "Bond-D"]
-        self.steps_per_day = 500 #random chosen
+        self.steps_per_day = steps_per_day #random chosen
+        self.allow_partial = allow_partial
 
 
-        self.simulation_start = datetime.now()
+        self.simulation_start = simulation_start
+        #simulated time that passes with every step
+        self.step_duration = timedelta(days=1) / self.steps_per_day
+        #log timestamp of the current step, only formatted once per step
+        self.timestamp_step = None
+        self.timestamp = None
         self.participants = []
         self.accounts = []
+        #accounts per (institution, type) and holders per type, used when instructions get created
+        self.account_registry = AccountRegistry.AccountRegistry()
         self.instructions = []
+        #columnar state of all instructions, the instruction agents are handles on its rows
+        self.instruction_store = InstructionStore.InstructionStore(self.simulation_start)
+        #next id of a generated instruction, a plain integer so it is checkpointed like any other attribute
+        self.next_instruction_id = 1
+        #settled and cancelled instructions and transactions move to the archive every archive_interval steps (default once a day),
+        #so model.agents, model.instructions and model.transactions only hold live work
+        self.archive = Archive.Archive(spill_dir=archive_dir, chunk_size=archive_chunk_size) if archive else None
+        self.archive_interval = archive_interval if archive_interval is not None else self.steps_per_day
+        #one record per partial settlement, kept with and without the archive
+        self.partial_settlements = Archive.PartialSettlements(spill_dir=archive_dir, chunk_size=archive_chunk_size)
+        self.terminal_instructions = []
+        self.terminal_transactions = []
         self.transactions = []
-        self.event_log = []
-        self.activity_log = []
-        self.generate_data()
+        #optional array-backed storage of all account balances, accounts become views on their ledger slot
+        self.ledger = Ledger.Ledger() if use_ledger else None
+        #end of business day settlement of all matched transactions, vectorized when the ledger is used
+        #with batch.shards > 1 it is spread over worker processes by security type, on the ledger in shared memory
+        if batch.shards > 1:
+            if self.ledger is None:
+                raise ValueError("sharded settlement needs the ledger, set use_ledger=True")
+            self.batch_settlement = ShardedSettlement.ShardedSettlement(self, shards=batch.shards, order_policy=batch.order)
+        else:
+            self.batch_settlement = BatchSettlement.BatchSettlement(self, order_policy=batch.order)
+        #multilateral offsetting of the transactions still queued after the batch, needs the ledger
+        self.gridlock_resolver = GridlockResolver.GridlockResolver(self, order_policy=batch.order) if batch.resolve_gridlock else None
+        #open instructions keyed by linkcode and direction, used by InstructionAgent.match
+        self.matching_index = MatchingIndex.MatchingIndex()
+        #logging: without log.directory the log is kept in memory and written by save_log,
+        #with a directory it is streamed in batches to files while the run is in progress, with log.keep=False it is dropped
+        self.log_dir = log.directory
+        self.log_format = log.format
+        if log.directory is None and not log.keep:
+            event_sinks = []
+            activity_sinks = []
+        elif log.directory is None:
+            event_sinks = [EventLogger.MemoryLogSink()]
+            activity_sinks = [EventLogger.MemoryLogSink()]
+        else:
+            os.makedirs(log.directory, exist_ok=True)
+            event_sinks = [EventLogger.create_file_sink(os.path.join(log.directory, f"event_log.{log.format}"), log.format)]
+            activity_sinks = [EventLogger.create_file_sink(os.path.join(log.directory, f"activity_log.{log.format}"), log.format)]
+        self.event_logger = EventLogger.EventLogger(event_sinks=event_sinks, activity_sinks=activity_sinks, buffer_size=log.buffer_size, dedup=log.dedup, verbosity=log.verbosity)
+
+        #KPIs updated at every state transition, with metrics.directory the step and day series are written there
+        if metrics.enabled:
+            metrics_sinks = [Instrumentation.MemorySink()]
+            self.metrics = Metrics.Metrics(self.bond_types, metrics_sinks)
+            if metrics.directory is not None:
+                os.makedirs(metrics.directory, exist_ok=True)
+                if metrics.format == "csv":
+                    metrics_sinks.append(Instrumentation.CSVSink(os.path.join(metrics.directory, "metrics_steps.csv"), level="step", fieldnames=self.metrics.fields()))
+                    metrics_sinks.append(Instrumentation.CSVSink(os.path.join(metrics.directory, "metrics_days.csv"), level="day", fieldnames=self.metrics.fields()))
+                else:
+                    metrics_sinks.append(Instrumentation.JSONLSink(os.path.join(metrics.directory, "metrics_steps.jsonl"), level="step"))
+                    metrics_sinks.append(Instrumentation.JSONLSink(os.path.join(metrics.directory, "metrics_days.jsonl"), level="day"))
+        else:
+            self.metrics = None
+
+        #per phase counters and timings of every step and business day, with instrument=False the handlers aren't wrapped at all
+        #with instrumentation_dir the step and day series are written there, profile_steps=(start, stop) profiles a window of steps
+        if instrument or instrumentation_dir is not None or profile_steps is not None:
+            instrumentation_sinks = [Instrumentation.MemorySink()]
+            if instrumentation_dir is not None:
+                os.makedirs(instrumentation_dir, exist_ok=True)
+                sink_type = {"csv": Instrumentation.CSVSink, "jsonl": Instrumentation.JSONLSink}[instrumentation_format]
+                instrumentation_sinks.append(sink_type(os.path.join(instrumentation_dir, f"steps.{instrumentation_format}"), level="step"))
+                instrumentation_sinks.append(sink_type(os.path.join(instrumentation_dir, f"days.{instrumentation_format}"), level="day"))
+            if profile_steps is not None:
+                extension = "prof" if profiler == "cprofile" else "html"
+                profile_file = os.path.join(instrumentation_dir or ".", f"profile-{profile_steps[0]}-{profile_steps[1]}.{extension}")
+                instrumentation_sinks.append(Instrumentation.ProfilerSink(profile_steps[0], profile_steps[1], profile_file, profiler))
+            self.instrumentation = Instrumentation.Instrumentation(instrumentation_sinks)
+            self.log_event = self.instrumentation.wrap("logging", partial(SettlementModel.log_event, self))
+            self.record_event = self.instrumentation.wrap("logging", partial(SettlementModel.record_event, self))
+        else:
+            self.instrumentation = Instrumentation.NullInstrumentation()
+
+        #event driven lifecycle of instructions and transactions on the simulated clock
+        self.validation_delay = validation_delay
+        self.settlement_retry_interval = settlement_retry_interval if settlement_retry_interval is not None else self.step_duration
+        #"waitlist" parks transactions that are short on cash or securities until their account receives enough,
+        #"poll" retries them every settlement_retry_interval
+        if settlement_retry not in ("waitlist", "poll"):
+            raise ValueError("settlement_retry has to be 'waitlist' or 'poll'")
+        self.wait_list = WaitList.WaitList(self) if settlement_retry == "waitlist" else None
+        self.scheduler = EventScheduler.EventScheduler()
+        self.scheduler.register(EventScheduler.ARRIVAL, self.instrumentation.wrap("arrival", self.handle_arrival))
+        self.scheduler.register(EventScheduler.VALIDATION, self.instrumentation.wrap("validation", self.handle_validation))
+        self.scheduler.register(EventScheduler.MATCHING, self.instrumentation.wrap("matching", self.handle_matching))
+        self.scheduler.register(EventScheduler.SETTLEMENT, self.instrumentation.wrap("settlement", self.handle_settlement))
+
+        #timeouts per status, counted from the creation time: instruction_timeout applies to all unmatched statuses,
+        #instruction_timeouts sets them per status (e.g. {"Validated": timedelta(hours=2)}) and transaction_timeout cancels unsettled transactions
+        instruction_timeouts = dict(instruction_timeouts) if instruction_timeouts is not None else {}
+        if instruction_timeout is not None:
+            for status in MatchingIndex.OPEN_STATUSES:
+                instruction_timeouts.setdefault(status, instruction_timeout)
+        transaction_timeouts = {"Matched": transaction_timeout} if transaction_timeout is not None else {}
+        self.timeouts = TimingWheel.TimeoutManager(self, instruction_timeouts, transaction_timeouts) if instruction_timeouts or transaction_timeouts else None
+
+        #"random" builds the institutions one by one, "bulk" draws the whole population at once,
+        #a population snapshot is loaded if it exists and written after bulk generation otherwise
+        if population not in ("random", "bulk"):
+            raise ValueError("population has to be 'random' or 'bulk'")
+        if population == "bulk" or population_snapshot is not None:
+            self.generate_data_bulk(population_snapshot)
+        else:
+            self.generate_data()
+
+        #"random" lets the institutions create instructions, "replay" streams them from the trace at trace_path,
+        #"live" takes them from an external feed through model.live_feed (see LiveFeed.run)
+        if workload not in ("random", "replay", "live"):
+            raise ValueError("workload has to be 'random', 'replay' or 'live'")
+        if workload == "replay" and trace_path is None:
+            raise ValueError("a replay workload needs a trace_path")
+        self.workload = workload
+        self.trace_replay = TraceReplay.TraceReplay(self, trace_path, trace_format) if workload == "replay" else None
+        self.live_feed = LiveFeed.LiveFeed(self, batch_size=feed.batch_size, queue_size=feed.queue_size, max_matching_backlog=feed.max_matching_backlog,
+                                           max_settlement_backlog=feed.max_settlement_backlog, resume_ratio=feed.resume_ratio,
+                                           latency_window=feed.latency_window) if workload == "live" else None
+
+        #snapshots of the balance, credit limit and used credit of every account in memory mapped files in balance_history_dir,
+        #every balance_history_interval steps ("day" for one per business day), the first one of the generated population
+        if balance_history_dir is not None:
+            interval = self.steps_per_day if balance_history_interval == "day" else balance_history_interval
+            expected_snapshots = self.simulation_duration_days * self.steps_per_day // interval + 1
+            self.balance_history = BalanceHistory.BalanceHistory(self, balance_history_dir, interval, expected_snapshots)
+            self.balance_history.record(self.steps)
+        else:
+            self.balance_history = None
+
+        #checkpoints of the full state, by default at the end of every business day
+        self.checkpoint_interval = checkpoints.interval if checkpoints.interval is not None else self.steps_per_day
+        self.checkpointer = Checkpoint.Checkpointer(checkpoints.directory, incremental=checkpoints.incremental,
+                                                    full_every=checkpoints.full_every) if checkpoints.directory is not None else None
+
+    def simulated_time(self):
+        #time on the simulated clock at the current step
+        return self.simulation_start + self.steps * self.step_duration
 
     def random_timestamp(self):
         simulation_end = self.simulation_start + timedelta(days=self.simulation_duration_days)
         delta = simulation_end - self.simulation_start
-        random_seconds = random.uniform(0, delta.total_seconds())
+        random_seconds = self.random.uniform(0, delta.total_seconds())
         random_time = self.simulation_start + timedelta(seconds=random_seconds)
         return random_time  # Now returns a datetime object
 
-    def log_event(self, message, agent_id, is_transaction=True):
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_entry = {'Timestamp': timestamp, 'Agent ID': agent_id, 'Event': message}
+    @property
+    def event_log(self):
+        return self.event_logger.memory_entries(is_transaction=True)
 
-        if is_transaction:
-            if log_entry not in self.event_log:
-                print(f"{timestamp} | Agent ID: {log_entry['Agent ID']} | {message}")
-                self.event_log.append(log_entry)  # Ensures no duplicates
-        else:
-            if log_entry not in self.activity_log:
-                print(f"{timestamp} | Agent ID: {log_entry['Agent ID']} | {message}")
-                  # Ensures no duplicates
+    @property
+    def activity_log(self):
+        return self.event_logger.memory_entries(is_transaction=False)
 
-        self.activity_log.append(log_entry)
+    def current_timestamp(self):
+        #the formatted timestamp only changes once per step
+        if self.timestamp_step != self.steps:
+            self.timestamp_step = self.steps
+            self.timestamp = self.simulated_time().strftime('%Y-%m-%d %H:%M:%S')
+        return self.timestamp
+
+    def log_event(self, message, agent_id, is_transaction=True):
+        #free text message, the events of the agents are logged as typed records with record_event
+        self.event_logger.log(self.current_timestamp(), agent_id, message, is_transaction)
+
+    def record_event(self, event_type, agent_id, ref=None, amount=None, balance=None, credit=None, security=None, text=None):
+        self.event_logger.record(self.current_timestamp(), event_type, agent_id, ref, amount, balance, credit, security, text)
 
     def save_log(self, filename=None, activity_filename=None):
+        if self.log_dir is not None:
+            #log got streamed to log_dir during the run, only the remaining buffer has to be written
+            self.event_logger.close()
+            if self.event_logger.verbosity:
+                print(f"Activity log saved to {self.event_logger.activity_sinks[0].filename}")
+                print(f"Event Log saved to {self.event_logger.event_sinks[0].filename}")
+            return
+        #pandas is only needed for this export, so it isn't loaded for runs that don't use it
+        import pandas as pd
+
         if filename is None:
             filename = "event_log.csv"  # Default filename
-        df = pd.DataFrame(self.event_log)
+        df = pd.DataFrame(self.event_logger.export_rows(is_transaction=True), columns=EventLogger.EXPORT_FIELDS)
         df.to_csv(filename, index=False)
         if activity_filename is None:
             activity_filename = "activity_log.csv"
-        df_activity = pd.DataFrame(self.activity_log)
+        df_activity = pd.DataFrame(self.event_logger.export_rows(is_transaction=False), columns=EventLogger.EXPORT_FIELDS)
         df_activity.to_csv(activity_filename, index=False)
-        print(f"Activity log saved to {activity_filename}")
-        print(f"Event Log saved to {filename}")
+        if self.event_logger.verbosity:
+            print(f"Activity log saved to {activity_filename}")
+            print(f"Event Log saved to {filename}")
+
+    def generate_account_id(self):
+        return generate_iban(self.random)
 
     def generate_data(self):
         for i in range(1, self.num_institutions+ 1):
             inst_id = f"INST-{i}"
             inst_accounts = []
-            total_accounts = random.randint(self.min_total_accounts, self.max_total_accounts)
+            total_accounts = self.random.randint(self.min_total_accounts, self.max_total_accounts)
             #generate cash account => there has to be at least 1 cash account
-            new_cash_accountID = generate_iban()
+            new_cash_accountID = self.generate_account_id()
             new_cash_accountType = "Cash"
-            new_cash_balance =  round(random.uniform(5000, 200000), 2)
-            new_cash_creditLimit = round(random.uniform(100000, 500000), 2)
-            new_cash_Account = Account.Account(accountID=new_cash_accountID, accountType= new_cash_accountType, balance= new_cash_balance, creditLimit=new_cash_creditLimit)
+            new_cash_balance =  round(self.random.uniform(5000, 200000), 2)
+            new_cash_creditLimit = round(self.random.uniform(100000, 500000), 2)
+            new_cash_Account = Account.Account.open(model=self, accountID=new_cash_accountID, accountType= new_cash_accountType, balance= new_cash_balance, creditLimit=new_cash_creditLimit, ledger=self.ledger)
             inst_accounts.append(new_cash_Account)
             self.accounts.append(new_cash_Account)
             for _ in range(total_accounts - 1):
-                new_security_accountID = generate_iban()
-                new_security_accountType = random.choice(self.bond_types)
-                new_security_balance = round(random.uniform(5000, 200000), 2)
+                new_security_accountID = self.generate_account_id()
+                new_security_accountType = self.random.choice(self.bond_types)
+                new_security_balance = round(self.random.uniform(5000, 200000), 2)
                 new_security_creditLimit = 0
-                new_security_Account = Account.Account(accountID=new_security_accountID, accountType= new_security_accountType, balance= new_security_balance, creditLimit= new_security_creditLimit)
+                new_security_Account = Account.Account.open(model=self, accountID=new_security_accountID, accountType= new_security_accountType, balance= new_security_balance, creditLimit= new_security_creditLimit, ledger=self.ledger)
                 inst_accounts.append(new_security_Account)
                 self.accounts.append(new_security_Account)
-            new_institution = InstitutionAgent.InstitutionAgent(institutionID= inst_id, accounts= inst_accounts, model=self, allowPartial=True)
+            new_institution = InstitutionAgent.InstitutionAgent(institutionID= inst_id, accounts= inst_accounts, model=self, allowPartial=self.allow_partial)
             self.participants.append(new_institution)
 
 
 
 
-    def step(self):
-        print(f"Running simulation step {self.steps}...")
-        #shuffles all agents and then executes their step module once for all of them
-        self.agents.shuffle_do("step")
-        print(len(self.agents) + "Agents executed their step module")
-
-
-        #this has to be implemented later
-       # if self.steps % self.steps_per_day == 0:
-        #    print(f"\n=== End of Business Day (Step {self.steps}) Batch Processing ===")
-         #   self.agents.shuffle_do("batch_run")
-          #  print("=== End of Batch Processing ===\n")
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def new_instruction_id(self):
+        #ids come from a counter, model.instructions shrinks when terminal instructions get archived
+        uniqueID = self.next_instruction_id
+        self.next_instruction_id += 1
+        return uniqueID
+
+    def reserve_instruction_id(self, uniqueID):
+        #an integer id from outside (trace, live feed) moves the counter past it, so generated ids don't collide with it
+        if isinstance(uniqueID, int) and uniqueID >= self.next_instruction_id:
+            self.next_instruction_id = uniqueID + 1
+
+    def summary_metrics(self):
+        #end of run summary of the instructions and transactions, kept up to date by the metrics aggregator if it is on
+        if self.metrics is not None:
+            return self.metrics.summary()
+        settled_instructions = sum(1 for instruction in self.instructions if instruction.status == "Settled")
+        settled_transactions = [transaction for transaction in self.transactions if transaction.status == "Settled"]
+        instructions_created = len(self.instructions)
+        transactions_created = len(self.transactions)
+        settled_value = sum(transaction.deliverer.amount for transaction in settled_transactions)
+        transactions_settled = len(settled_transactions)
+        #every partial settlement counts like a split into children, as in Metrics.partial_settlement
+        partial_settlements = len(self.partial_settlements)
+        instructions_created += 4 * partial_settlements
+        settled_instructions += 2 * partial_settlements
+        transactions_created += 2 * partial_settlements
+        transactions_settled += partial_settlements
+        settled_value += self.partial_settlements.settled_value
+        if self.archive is not None:
+            instructions_created += len(self.archive.instructions)
+            settled_instructions += self.archive.instruction_statuses["Settled"]
+            transactions_created += len(self.archive.transactions)
+            transactions_settled += self.archive.transaction_statuses["Settled"]
+            settled_value += self.archive.settled_value
+        return {
+            "instructions_created": instructions_created,
+            "instructions_settled": settled_instructions,
+            "settlement_rate": settled_instructions / instructions_created if instructions_created else 0.0,
+            "transactions_created": transactions_created,
+            "transactions_settled": transactions_settled,
+            "settled_value": settled_value,
+        }
+
+    def archive_terminal(self):
+        #moves the instructions and transactions that became terminal since the last call to the archive
+        if not self.terminal_instructions and not self.terminal_transactions:
+            return 0
+        archived_time = self.simulated_time().isoformat()
+        #transactions first, their records read the ids of the instructions
+        for transaction in self.terminal_transactions:
+            self.archive.archive_transaction(transaction, archived_time)
+            transaction.remove()
+        for instruction in self.terminal_instructions:
+            self.archive.archive_instruction(instruction, archived_time)
+            instruction.remove()
+        archived = len(self.terminal_instructions) + len(self.terminal_transactions)
+        if self.terminal_transactions:
+            archived_transactions = set(self.terminal_transactions)
+            self.transactions = [transaction for transaction in self.transactions if transaction not in archived_transactions]
+        if self.terminal_instructions:
+            self.instructions = [instruction for instruction in self.instructions if not instruction.is_archived()]
+        self.terminal_instructions = []
+        self.terminal_transactions = []
+        return archived
+
+    def handle_arrival(self, instruction, time):
+        if instruction.is_archived():
+            return
+        instruction.insert_instruction()
+        if instruction.status == "Pending":
+            self.scheduler.schedule(time + self.validation_delay, EventScheduler.VALIDATION, instruction)
+
+    def handle_validation(self, instruction, time):
+        if instruction.is_archived():
+            return
+        instruction.validate()
+        if instruction.status == "Validated":
+            self.scheduler.schedule(time, EventScheduler.MATCHING, instruction)
+
+    def handle_matching(self, instruction, time):
+        #if the counter instruction isn't validated yet, it will match with this one when it is
+        if instruction.is_archived() or instruction.status != "Validated" or self.matching_index.find_counterpart(instruction) is None:
+            return
+        transaction = instruction.match()
+        if transaction is not None:
+            self.scheduler.schedule(time, EventScheduler.SETTLEMENT, transaction)
+
+    def handle_settlement(self, transaction, time):
+        if transaction.status != "Matched":
+            return
+        transaction.settle()
+        if transaction.status == "Matched":
+            #not enough cash or securities: wait for the account that is short, or try again later
+            if self.wait_list is None or not self.wait_list.park(transaction):
+                self.scheduler.schedule(time + self.settlement_retry_interval, EventScheduler.SETTLEMENT, transaction)
+
+    def generate_data_bulk(self, snapshot: str = None):
+        if snapshot is not None and PopulationGenerator.snapshot_exists(snapshot):
+            population = PopulationGenerator.load_population(snapshot)
+        else:
+            population = PopulationGenerator.generate_population(self.rng, self.num_institutions, self.min_total_accounts, self.max_total_accounts, self.bond_types)
+            if snapshot is not None:
+                PopulationGenerator.save_population(snapshot, population)
+
+        account_ids = population["accountID"].tolist()
+        account_types = population["accountType"].tolist()
+        balances = population["balance"].tolist()
+        credit_limits = population["creditLimit"].tolist()
+        slots = self.ledger.add_accounts(account_types, population["balance"], population["creditLimit"]).tolist() if self.ledger is not None else [None] * len(account_ids)
+
+        accounts = [Account.Account.open(model=self, accountID=account_id, accountType=account_type, balance=balance, creditLimit=credit_limit, ledger=self.ledger, slot=slot, log_creation=False)
+                    for account_id, account_type, balance, credit_limit, slot in zip(account_ids, account_types, balances, credit_limits, slots)]
+        self.accounts.extend(accounts)
+
+        #accounts of an institution are consecutive
+        institution = population["institution"]
+        boundaries = np.flatnonzero(np.diff(institution)) + 1
+        starts = [0] + boundaries.tolist()
+        ends = boundaries.tolist() + [len(accounts)]
+        for start, end in zip(starts, ends):
+            new_institution = InstitutionAgent.InstitutionAgent(institutionID= f"INST-{int(institution[start]) + 1}", accounts= accounts[start:end], model=self, allowPartial=self.allow_partial)
+            self.participants.append(new_institution)
 
+        #logging
+        self.log_event(f"Population of {len(self.participants)} institutions and {len(accounts)} accounts generated in bulk", "population", is_transaction = False)
 
+    def step(self):
+        now = self.simulated_time()
+        end_of_day = self.steps % self.steps_per_day == 0
+        instrumentation = self.instrumentation
+        instrumentation.begin_step(self.steps)
+        if self.event_logger.verbosity:
+            print(f"Running simulation step {self.steps}...")
+        #institutions create new instructions (or the trace delivers them), instructions and transactions only act when one of their events is due
+        with instrumentation.phase("creation"):
+            if self.trace_replay is not None:
+                self.trace_replay.inject_due(now)
+            elif self.live_feed is not None:
+                self.live_feed.inject_pending(now)
+            else:
+                self.agents_by_type[InstitutionAgent.InstitutionAgent].shuffle_do("step")
+        handled = self.scheduler.run_until(now)
+        if self.timeouts is not None:
+            with instrumentation.phase("timeout"):
+                self.timeouts.expire(self.steps)
+        if self.event_logger.verbosity:
+            print(f"{handled} events handled, {len(self.scheduler)} events scheduled")
+
+        if end_of_day:
+            if self.event_logger.verbosity:
+                print(f"\n=== End of Business Day (Step {self.steps}) Batch Processing ===")
+            with instrumentation.phase("batch"):
+                self.batch_settlement.run()
+            if self.gridlock_resolver is not None and self.ledger is not None:
+                with instrumentation.phase("gridlock"):
+                    self.gridlock_resolver.run()
+            if self.wait_list is not None:
+                #the batch posts to the accounts directly, waiting transactions get checked against the new balances
+                self.wait_list.recheck()
+            if self.event_logger.verbosity:
+                print("=== End of Batch Processing ===\n")
+
+        if self.archive is not None and self.steps % self.archive_interval == 0:
+            with instrumentation.phase("archive"):
+                self.archive_terminal()
+
+        if self.balance_history is not None:
+            with instrumentation.phase("history"):
+                self.balance_history.record_due(self.steps)
+
+        if self.checkpointer is not None and self.steps % self.checkpoint_interval == 0:
+            with instrumentation.phase("checkpoint"):
+                self.checkpoint()
+
+        day = (self.steps - 1) // self.steps_per_day + 1
+        if self.metrics is not None:
+            self.metrics.end_step(self.steps, day, end_of_day)
+        instrumentation.end_step(self.steps, day, end_of_day)
+
+    def close(self):
+        #flushes and closes the log, metrics and instrumentation sinks and stops the settlement workers, at the end of a run
+        self.event_logger.close()
+        if self.metrics is not None:
+            self.metrics.close()
+        self.instrumentation.close()
+        if self.balance_history is not None:
+            self.balance_history.close()
+        if isinstance(self.batch_settlement, ShardedSettlement.ShardedSettlement):
+            self.batch_settlement.close()
+
+    def checkpoint(self, filename: str = None):
+        #writes a checkpoint of the state after this step, Checkpoint.restore continues the run from it
+        filename = Checkpoint.save(self, filename)
+        #logging
+        self.log_event(f"Checkpoint written to {filename}", "checkpoint", is_transaction = False)
+        return filename
 
 
 if __name__ == "__main__":
-    print("Starting simulation...")
-    log_path = input("Enter the path to save the log (press Enter for default): ")
-    if not log_path.strip():
-        log_path = "event_log.csv"
-    model = SettlementModel()
-    for _ in range(100):
-        model.step()
-    print("Final Event Log:")
-    for event in model.event_log:
-        print(event)
-    print("Saving final event log...")
-    model.save_log(log_path)
+    #headless run without prompts, see RunSimulation.py for the options
+    import sys
+    import RunSimulation
+    sys.exit(RunSimulation.main())
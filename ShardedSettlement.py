@@ -0,0 +1,228 @@
+import multiprocessing
+import traceback
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import BatchSettlement
+import Ledger
+
+#ledger columns that live in shared memory
+LEDGER_COLUMNS = ("balance", "creditLimit", "usedCredit", "typeCode")
+#transaction arrays a shard needs to post its securities legs
+SECURITIES_LEGS = ("deliverer_securities", "receiver_securities", "security_code", "amount")
+
+
+def unlink_blocks(blocks: list):
+    for block in blocks:
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedLedger:
+    """Moves the arrays of a Ledger to shared memory, so worker processes read and post on the same balances.
+
+    The ledger keeps working as before, its arrays are just backed by shared memory blocks. When the
+    ledger grows it gets new (private) arrays, export notices that and moves them again. Blocks that
+    were replaced are only unlinked, numpy arrays of the model can still point into them.
+    retired holds the blocks the finalizer unlinks, those of the current arrays."""
+
+    def __init__(self):
+        self.blocks = {}
+        self.arrays = {}
+        self.retired = []
+        self.finalizer = weakref.finalize(self, unlink_blocks, self.retired)
+
+    def is_shared(self, ledger):
+        return bool(self.arrays) and all(getattr(ledger, name) is self.arrays[name] for name in LEDGER_COLUMNS)
+
+    def export(self, ledger):
+        #makes sure the ledger arrays are in shared memory and returns the handle the workers attach with
+        if not self.is_shared(ledger):
+            unlink_blocks(self.blocks.values())
+            #the finalizer holds on to the list, it is emptied in place
+            self.retired.clear()
+            self.blocks = {}
+            self.arrays = {}
+            for name in LEDGER_COLUMNS:
+                old = getattr(ledger, name)
+                block = shared_memory.SharedMemory(create=True, size=max(old.nbytes, 1))
+                array = np.ndarray(old.shape, dtype=old.dtype, buffer=block.buf)
+                array[:] = old
+                self.blocks[name] = block
+                self.arrays[name] = array
+                self.retired.append(block)
+                setattr(ledger, name, array)
+        return {
+            "names": {name: block.name for name, block in self.blocks.items()},
+            "dtypes": {name: array.dtype.str for name, array in self.arrays.items()},
+            "capacity": len(ledger.balance),
+            "size": ledger.size,
+        }
+
+    def __getstate__(self):
+        #a checkpoint keeps the ledger values, a restored model exports them again
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+
+class LedgerView:
+    #ledger of a worker process on the shared memory blocks of the model ledger
+    def __init__(self, handle: dict):
+        self.names = handle["names"]
+        self.blocks = []
+        arrays = {}
+        for name, block_name in self.names.items():
+            #the blocks are unlinked by the model process, the worker only maps them
+            block = shared_memory.SharedMemory(name=block_name)
+            self.blocks.append(block)
+            arrays[name] = np.ndarray((handle["capacity"],), dtype=np.dtype(handle["dtypes"][name]), buffer=block.buf)
+        self.ledger = Ledger.Ledger(capacity=0)
+        for name in LEDGER_COLUMNS:
+            setattr(self.ledger, name, arrays[name])
+        self.ledger.size = handle["size"]
+
+
+def post_securities(view: LedgerView, legs: dict):
+    """Posts the securities legs of the settling transactions of one shard. The accounts of a security type
+    are only written by the worker of its shard, so the shards post in parallel without locks."""
+    view.ledger.deduct(legs["deliverer_securities"], legs["amount"], legs["security_code"])
+    view.ledger.add(legs["receiver_securities"], legs["amount"], legs["security_code"])
+    return len(legs["amount"])
+
+
+def shard_worker(shard: int, connection):
+    #loop of a worker process: posts the legs of its shard until it gets None
+    view = None
+    connection.send(("ready", shard))
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        handle, legs = task
+        try:
+            if view is None or view.names != handle["names"]:
+                view = LedgerView(handle)
+            view.ledger.size = handle["size"]
+            connection.send(("ok", post_securities(view, legs)))
+        except Exception:
+            connection.send(("error", traceback.format_exc()))
+    connection.close()
+
+
+class ShardedSettlement:
+    """Batch settlement of the Matched transactions spread over worker processes, one shard per group of security types.
+
+    The transactions that settle are selected like in BatchSettlement, by one pass over all of them in the order
+    of the ordering policy, so the outcome is the same for any number of shards. A transaction can only be
+    taken once the cash of its receiver is known to cover it, and cash accounts are shared by all security
+    types, so that pass can't be split by shard. Every shard owns the securities accounts of its security types:
+    their legs are posted by the worker of that shard, in parallel with the other shards. The cash legs are
+    posted by the model process once the workers are done.
+
+    For now sharding is about keeping the result right on the shared ledger, not about speed: the selection
+    runs in the model process and the securities postings are too cheap to win back the cost of the workers.
+
+    The ledger lives in shared memory, the model and the event driven settlement keep using it directly.
+    The workers are started at the first run and stopped by close (or when the model process exits)."""
+
+    def __init__(self, model, shards: int = 2, order_policy: str = "fifo", start_method: str = None):
+        if order_policy not in BatchSettlement.ORDER_POLICIES:
+            raise ValueError(f"Unknown ordering policy {order_policy}, choose from {list(BatchSettlement.ORDER_POLICIES)}")
+        if shards < 1:
+            raise ValueError("shards has to be at least 1")
+        self.model = model
+        self.shards = shards
+        self.order_policy = order_policy
+        self.start_method = start_method
+        #security type -> shard, the types of the model are spread round robin, new types are added when they are first seen
+        self.partition = {security_type: index % shards for index, security_type in enumerate(model.bond_types)}
+        self.shared_ledger = SharedLedger()
+        self.workers = None
+        self.connections = None
+
+    def shard_of(self, security_type: str):
+        return self.partition.setdefault(security_type, len(self.partition) % self.shards)
+
+    def start(self):
+        context = multiprocessing.get_context(self.start_method)
+        self.workers = []
+        self.connections = []
+        for shard in range(self.shards):
+            parent_end, worker_end = context.Pipe()
+            worker = context.Process(target=shard_worker, args=(shard, worker_end), daemon=True)
+            worker.start()
+            worker_end.close()
+            self.workers.append(worker)
+            self.connections.append(parent_end)
+        #the workers are ready once they imported their modules, if one of them doesn't get there none are kept
+        try:
+            for connection in self.connections:
+                connection.recv()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.workers is None:
+            return
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.workers = None
+        self.connections = None
+
+    def run(self):
+        matched = [transaction for transaction in self.model.transactions if transaction.status == "Matched"]
+        if not matched:
+            return {"matched": 0, "settled": 0, "settled_value": 0.0}
+
+        ledger = self.model.ledger
+        arrays = BatchSettlement.transaction_arrays(matched, ledger)
+        order = BatchSettlement.order_transactions(arrays, self.order_policy)
+        selected = BatchSettlement.select_covered(ledger, arrays, order)
+        #cash has no shard, a transaction belongs to the shard of its security type
+        shard_by_code = np.array([0] + [self.shard_of(name) for name in ledger.type_names[Ledger.CASH_CODE + 1:]], dtype=np.int64)
+        shard_of_selected = shard_by_code[arrays["security_code"][selected]]
+
+        handle = self.shared_ledger.export(ledger)
+        if self.workers is None:
+            self.start()
+
+        #every shard posts the securities legs of its selected transactions, the model process the cash legs
+        for shard, connection in enumerate(self.connections):
+            shard_positions = selected[shard_of_selected == shard]
+            connection.send((handle, {key: arrays[key][shard_positions] for key in SECURITIES_LEGS}))
+        replies = [connection.recv() for connection in self.connections]
+        errors = [reply[1] for reply in replies if reply[0] == "error"]
+        if errors:
+            raise RuntimeError("sharded settlement failed:\n" + "\n".join(errors))
+        amounts = arrays["amount"][selected]
+        ledger.deduct(arrays["receiver_cash"][selected], amounts, "Cash")
+        ledger.add(arrays["deliverer_cash"][selected], amounts, "Cash")
+
+        for position in selected:
+            matched[position].settle_in_batch()
+
+        settled_value = float(arrays["amount"][selected].sum())
+        #logging
+        self.model.log_event(f"Sharded batch settlement settled {len(selected)} of {len(matched)} matched transactions over {self.shards} shards for a value of {settled_value}", "batch", is_transaction = True)
+        return {"matched": len(matched), "settled": len(selected), "settled_value": settled_value}
+
+    def __getstate__(self):
+        #worker processes and shared memory belong to the running process, a restored model starts its own
+        state = self.__dict__.copy()
+        state.update(workers=None, connections=None)
+        return state
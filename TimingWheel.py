@@ -0,0 +1,148 @@
+import math
+import Archive
+
+#bits per level of the wheel: 256 slots per level, 4 levels cover 2^32 ticks
+SLOT_BITS = 8
+LEVELS = 4
+
+
+class Timer:
+    #handle of a timer on the wheel, kept by the agent so the timer can be cancelled in constant time
+    __slots__ = ("deadline", "target", "level", "slot")
+
+    def __init__(self, deadline: int, target):
+        self.deadline = deadline
+        self.target = target
+        self.level = None
+        self.slot = None
+
+
+class TimingWheel:
+    """Hierarchical timing wheel on integer ticks.
+
+    Level 0 has a slot per tick, every higher level has slots that span all slots of the level below.
+    A timer goes to the lowest level that reaches its deadline and moves down a level (cascades) when
+    the wheel reaches the start of its slot. Adding and cancelling a timer is constant time and advancing
+    a tick only touches the timers that are due or cascade, so the cost doesn't depend on the number
+    of timers that are still running."""
+
+    def __init__(self, now: int = 0):
+        self.now = now
+        self.size = 1 << SLOT_BITS
+        self.mask = self.size - 1
+        #every slot is a dict used as an ordered set, so timers expire in the order they were added
+        self.slots = [[{} for _ in range(self.size)] for _ in range(LEVELS)]
+        #timers with a deadline that already passed, they expire with the next tick
+        self.overdue = {}
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, deadline: int, target):
+        timer = Timer(deadline, target)
+        self.place(timer)
+        self.count += 1
+        return timer
+
+    def place(self, timer: Timer):
+        delta = timer.deadline - self.now
+        if delta <= 0:
+            timer.level, timer.slot = -1, None
+            self.overdue[timer] = None
+            return
+        level = 0
+        while level < LEVELS - 1 and delta >= 1 << (SLOT_BITS * (level + 1)):
+            level += 1
+        slot = (timer.deadline >> (SLOT_BITS * level)) & self.mask
+        timer.level, timer.slot = level, slot
+        self.slots[level][slot][timer] = None
+
+    def cancel(self, timer: Timer):
+        if timer.level is None:
+            return
+        if timer.level == -1:
+            del self.overdue[timer]
+        else:
+            del self.slots[timer.level][timer.slot][timer]
+        timer.level = None
+        self.count -= 1
+
+    def advance(self, to: int):
+        #moves the wheel to tick to and returns the targets of the timers that expired, in deadline order
+        expired = []
+        if self.overdue:
+            expired.extend(self.pop_expired(self.overdue))
+            self.overdue = {}
+        while self.now < to:
+            self.now += 1
+            #at the start of a slot of a higher level its timers cascade down
+            level = 1
+            while level < LEVELS and (self.now & ((1 << (SLOT_BITS * level)) - 1)) == 0:
+                index = (self.now >> (SLOT_BITS * level)) & self.mask
+                cascading = self.slots[level][index]
+                self.slots[level][index] = {}
+                for timer in cascading:
+                    self.place(timer)
+                level += 1
+            slot = self.slots[0][self.now & self.mask]
+            if slot:
+                self.slots[0][self.now & self.mask] = {}
+                expired.extend(self.pop_expired(slot))
+            if self.overdue:
+                #timers that cascaded to a deadline that is now
+                expired.extend(self.pop_expired(self.overdue))
+                self.overdue = {}
+        return expired
+
+    def pop_expired(self, timers: dict):
+        targets = []
+        for timer in timers:
+            timer.level = None
+            targets.append(timer.target)
+        self.count -= len(targets)
+        return targets
+
+
+class TimeoutManager:
+    """Timeouts of instructions and transactions per status, on a timing wheel with one tick per step.
+
+    An agent in a status with a timeout has a timer at creation_time + timeout of that status. Every status
+    change (set_status) replaces the timer, so agents that get matched, settled or cancelled
+    drop their timer and only the agents that really expire are touched."""
+
+    def __init__(self, model, instruction_timeouts: dict = None, transaction_timeouts: dict = None):
+        self.model = model
+        self.instruction_timeouts = instruction_timeouts or {}
+        self.transaction_timeouts = transaction_timeouts or {}
+        self.wheel = TimingWheel(now=model.steps)
+        self.expired = 0
+
+    def deadline_tick(self, deadline):
+        #first step at which the simulated time reached the deadline
+        return math.ceil((deadline - self.model.simulation_start) / self.model.step_duration)
+
+    def track(self, agent, timeouts: dict):
+        #(re)sets the timer of the agent for its current status
+        if agent.timer is not None:
+            self.wheel.cancel(agent.timer)
+            agent.timer = None
+        timeout = timeouts.get(agent.status)
+        if timeout is not None and not Archive.is_terminal(agent.status):
+            agent.timer = self.wheel.add(self.deadline_tick(agent.creation_time + timeout), agent)
+
+    def track_instruction(self, instruction):
+        self.track(instruction, self.instruction_timeouts)
+
+    def track_transaction(self, transaction):
+        self.track(transaction, self.transaction_timeouts)
+
+    def expire(self, step: int):
+        #cancels the instructions and transactions whose timeout passed, returns how many got cancelled
+        expired = 0
+        for agent in self.wheel.advance(step):
+            agent.timer = None
+            agent.timeout()
+            expired += 1
+        self.expired += expired
+        return expired
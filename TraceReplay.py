@@ -0,0 +1,187 @@
+import csv
+import itertools
+import json
+import os
+from datetime import datetime, timedelta, timezone
+import DeliveryInstructionAgent
+import ReceiptInstructionAgent
+
+#columns of a trace, one row per instruction; uniqueID is optional and drawn from the model counter if missing
+#arrival_time is an ISO datetime or the number of seconds since the start of the simulation, datetimes with a
+#timezone are converted to the timezone of the simulation start (UTC if the simulation start is naive)
+TRACE_FIELDS = ["arrival_time", "direction", "linkcode", "institutionID", "securityType", "amount", "uniqueID"]
+
+
+def read_csv(filename: str):
+    with open(filename, newline="") as trace_file:
+        yield from csv.DictReader(trace_file)
+
+
+def read_jsonl(filename: str):
+    with open(filename) as trace_file:
+        for line in trace_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_parquet(filename: str, batch_size: int = 10000):
+    #reads one record batch at a time, pyarrow is only needed for parquet traces
+    import pyarrow.parquet
+
+    parquet_file = pyarrow.parquet.ParquetFile(filename)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "parquet": read_parquet}
+
+
+def open_trace(filename: str, trace_format: str = None):
+    #lazy iterator over the raw rows of a trace, the format follows from the extension if it is not given
+    if trace_format is None:
+        trace_format = os.path.splitext(filename)[1].lstrip(".").lower()
+    if trace_format not in READERS:
+        raise ValueError(f"Unknown trace format {trace_format}, choose from {list(READERS)}")
+    return READERS[trace_format](filename)
+
+
+def align_time(arrival_time: datetime, simulation_start: datetime):
+    #arrival times are compared with the simulated clock, so they get the same kind of datetime as simulation_start
+    if simulation_start.tzinfo is None:
+        if arrival_time.tzinfo is not None:
+            arrival_time = arrival_time.astimezone(timezone.utc).replace(tzinfo=None)
+    elif arrival_time.tzinfo is None:
+        arrival_time = arrival_time.replace(tzinfo=simulation_start.tzinfo)
+    else:
+        arrival_time = arrival_time.astimezone(simulation_start.tzinfo)
+    return arrival_time
+
+
+def parse_uniqueID(uniqueID):
+    #numeric ids become integers like the ids of the model counter, so "7" in a csv and 7 in a jsonl trace are the same id
+    if isinstance(uniqueID, str) and uniqueID.isdigit():
+        return int(uniqueID)
+    return uniqueID or None
+
+
+def parse_record(raw: dict, simulation_start: datetime):
+    arrival_time = raw["arrival_time"]
+    if isinstance(arrival_time, datetime):
+        arrival_time = align_time(arrival_time, simulation_start)
+    elif isinstance(arrival_time, (int, float)):
+        arrival_time = simulation_start + timedelta(seconds=arrival_time)
+    else:
+        try:
+            arrival_time = simulation_start + timedelta(seconds=float(arrival_time))
+        except ValueError:
+            arrival_time = align_time(datetime.fromisoformat(arrival_time), simulation_start)
+    direction = raw["direction"].lower()
+    if direction not in ("delivery", "receipt"):
+        raise ValueError(f"Unknown direction {raw['direction']} in trace, has to be delivery or receipt")
+    return {
+        "arrival_time": arrival_time,
+        "direction": direction,
+        "linkcode": raw["linkcode"],
+        "institutionID": raw["institutionID"],
+        "securityType": raw["securityType"],
+        "amount": float(raw["amount"]),
+        "uniqueID": parse_uniqueID(raw.get("uniqueID")),
+    }
+
+
+def parse_trace(records, simulation_start: datetime):
+    for raw in records:
+        yield parse_record(raw, simulation_start)
+
+
+class TraceReplay:
+    """Feeds the instructions of a recorded trace into the model at their arrival time.
+
+    The trace is read lazily through a generator pipeline (reader -> parser) and only the next
+    instruction that is not due yet is held in memory, so the size of the trace doesn't matter.
+    Rows have to be sorted by arrival_time. The institutions of the trace have to exist in the model
+    (e.g. from a population snapshot), instructions for an unknown institution or an institution without
+    an account of the security type are skipped and logged."""
+
+    def __init__(self, model, filename: str, trace_format: str = None):
+        self.model = model
+        self.filename = filename
+        self.trace_format = trace_format
+        self.simulation_start = model.simulation_start
+        self.records = parse_trace(open_trace(filename, trace_format), self.simulation_start)
+        #records taken from the trace, a restored replay skips them
+        self.consumed = 0
+        self.next_record = None
+        self.exhausted = False
+        self.injected = 0
+        self.skipped = 0
+        self.institutions = {institution.institutionID: institution for institution in model.participants}
+
+    def inject_due(self, now: datetime):
+        #creates the instructions of all records with arrival_time <= now, returns how many were created
+        injected = 0
+        while not self.exhausted:
+            if self.next_record is None:
+                self.next_record = next(self.records, None)
+                if self.next_record is None:
+                    self.exhausted = True
+                    break
+                self.consumed += 1
+            if self.next_record["arrival_time"] > now:
+                break
+            if self.inject(self.next_record):
+                injected += 1
+            self.next_record = None
+        return injected
+
+    def __getstate__(self):
+        #the open trace can't be pickled, it is opened again and fast-forwarded on restore
+        state = self.__dict__.copy()
+        del state["records"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        records = parse_trace(open_trace(self.filename, self.trace_format), self.simulation_start)
+        self.records = itertools.islice(records, self.consumed, None)
+
+    def inject(self, record: dict):
+        instruction = create_instruction(self.model, self.institutions, record, "trace")
+        if instruction is None:
+            self.skipped += 1
+            return False
+        self.injected += 1
+        return True
+
+
+def create_instruction(model, institutions: dict, record: dict, source: str = "trace"):
+    """Creates the instruction of a parsed record on the first cash and securities account of its institution,
+    with the arrival_time of the record as creation time. Returns None (and logs) if the institution doesn't
+    exist or has no account for the security type, or if its linkcode already has an open instruction of the
+    same direction. Used by the trace replay and the live feed."""
+    registry = model.account_registry
+    institution = institutions.get(record["institutionID"])
+    cash_accounts = registry.get_accounts(institution, "Cash") if institution is not None else []
+    security_accounts = registry.get_accounts(institution, record["securityType"]) if institution is not None else []
+    if not cash_accounts or not security_accounts:
+        #logging
+        model.log_event(f"ERROR: {source} instruction {record['linkcode']} of {record['institutionID']} skipped, no cash or {record['securityType']} account", record["institutionID"], is_transaction = True)
+        return None
+    if model.matching_index.has_open(record["linkcode"], record["direction"]):
+        #logging
+        model.log_event(f"ERROR: {source} instruction {record['linkcode']} of {record['institutionID']} skipped, the linkcode already has an open {record['direction']} instruction", record["institutionID"], is_transaction = True)
+        return None
+
+    uniqueID = record["uniqueID"]
+    if uniqueID is None:
+        uniqueID = model.new_instruction_id()
+    else:
+        model.reserve_instruction_id(uniqueID)
+    instruction_class = DeliveryInstructionAgent.DeliveryInstructionAgent if record["direction"] == "delivery" else ReceiptInstructionAgent.ReceiptInstructionAgent
+    #the arrival event gets scheduled by the instruction itself at its creation time
+    new_instructionAgent = instruction_class(model=model, uniqueID=uniqueID, motherID="mother", institution=institution,
+                                             securitiesAccount=security_accounts[0], cashAccount=cash_accounts[0],
+                                             securityType=record["securityType"], amount=record["amount"], isChild=False,
+                                             status="Exists", linkcode=record["linkcode"], creation_time=record["arrival_time"])
+    model.instructions.append(new_instructionAgent)
+    return new_instructionAgent
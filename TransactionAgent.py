@@ -1,7 +1,13 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
 from mesa import Agent
-import InstructionAgent
-import ReceiptInstructionAgent
-import DeliveryInstructionAgent
+import Archive
+import EventLogger
+
+#modules only used in annotations, importing them at runtime would make the imports circular
+if TYPE_CHECKING:
+    import ReceiptInstructionAgent
+    import DeliveryInstructionAgent
 
 class TransactionAgent(Agent):
     def __init__(self, model, transactionID: str, deliverer: DeliveryInstructionAgent, receiver: ReceiptInstructionAgent, status: str):
@@ -10,82 +16,154 @@ class TransactionAgent(Agent):
         self.deliverer = deliverer
         self.receiver = receiver
         self.status = status
+        self.creation_time = model.simulated_time() #used by the ordering policy of the batch settlement and for the timeout
+        self.timer = None
+        if self.model.timeouts is not None:
+            self.model.timeouts.track_transaction(self)
+        if self.model.metrics is not None:
+            self.model.metrics.transaction_created(self)
 
         #logging ( don't know why is_transaction = True)
-        self.model.log_event(f"Transaction {self.transactionID} created from account {self.deliverer.get_securitiesAccount.getAccountID} to account {self.receiver.get_cashAccount.getAccountID}", self.transactionID, is_transaction = True)
+        self.model.record_event(EventLogger.EventType.TRANSACTION_CREATED, self.transactionID, ref=self.deliverer.securitiesAccount.accountID, text=self.receiver.cashAccount.accountID)
 
     def get_status(self):
         return self.status
 
+    def set_status(self, new_status: str):
+        old_status = self.status
+        was_terminal = Archive.is_terminal(old_status)
+        self.status = new_status
+        if self.model.metrics is not None:
+            self.model.metrics.transaction_status(self, old_status, new_status)
+        #settled and cancelled transactions get archived at the next archival stage
+        if self.model.archive is not None and not was_terminal and Archive.is_terminal(new_status):
+            self.model.terminal_transactions.append(self)
+        if self.model.timeouts is not None:
+            self.model.timeouts.track_transaction(self)
+
     def settle(self):
         #logging
-        self.model.log_event(f"Transaction {self.transactionID} attempting to settle.", self.transactionID, is_transaction = True)
+        self.model.record_event(EventLogger.EventType.SETTLE_ATTEMPT, self.transactionID)
         if self.deliverer.get_status() == "Matched" and self.receiver.get_status() == "Matched":
             if (
                 #checks if full ammount can be settled
-                self.deliverer.securitiesAccount.checkBalance(self.deliverer.get_amount, self.deliverer.get_securityType)
-                and self.receiver.cashAccount.checkBalance(self.receiver.get_amount, self.receiver.get_securityType)
+                self.deliverer.securitiesAccount.checkBalance(self.deliverer.get_amount(), self.deliverer.get_securityType())
+                and self.receiver.cashAccount.checkBalance(self.receiver.get_amount(), "Cash")
             ):
                 if self.deliverer.get_amount() == self.receiver.get_amount():
                     #additional check that to be settled amounts are equal
 
                     #transfer of securities
-                    delivered_securities = self.deliverer.securitiesAccount.deductBalance(self.deliverer.get_amount, self.deliverer.get_securityType)
-                    received_securites = self.receiver.securitiesAccount.addBalance(self.receiver.get_amount, self.deliverer.get_securityType)
+                    delivered_securities = self.deliverer.securitiesAccount.deductBalance(self.deliverer.get_amount(), self.deliverer.get_securityType())
+                    received_securites = self.receiver.securitiesAccount.addBalance(self.receiver.get_amount(), self.deliverer.get_securityType())
 
                     #transfer of cash
-                    delivered_cash = self.receiver.cashAccount.deductBalance(self.receiver.get_amount, "Cash")
-                    received_cash = self.deliverer.cashAccount.addBalance(self.deliverer.get_amount, "Cash")
+                    delivered_cash = self.receiver.cashAccount.deductBalance(self.receiver.get_amount(), "Cash")
+                    received_cash = self.deliverer.cashAccount.addBalance(self.deliverer.get_amount(), "Cash")
 
                     #extra check for safety
-                    if not delivered_securities == received_securites == delivered_cash == received_cash == self.deliverer.get_amount == self.receiver.get_amount:
+                    if not delivered_securities == received_securites == delivered_cash == received_cash == self.deliverer.get_amount() == self.receiver.get_amount():
                         self.deliverer.set_status("Cancelled due to error")
                         self.receiver.set_status("Cancelled due to error")
-                        self.status = "Cancelled due to error"
+                        self.set_status("Cancelled due to error")
+                        #logging
+                        self.model.record_event(EventLogger.EventType.AMOUNTS_MISMATCH, self.transactionID)
+                        return
 
                     #change states to "Settled"
                     self.deliverer.set_status("Settled")
                     self.receiver.set_status("Settled")
-                    self.status = "Settled"
+                    self.set_status("Settled")
 
                     #logging
-                    self.model.log_event(f"Transaction {self.transactionID} settled fully.", self.transactionID, is_transaction = True)
+                    self.model.record_event(EventLogger.EventType.TRANSACTION_SETTLED, self.transactionID, amount=self.deliverer.amount, security=self.deliverer.securityType)
 
             elif self.deliverer.get_amount() == 0 or self.receiver.get_amount() == 0:
                 #will do nothing if there is no cash or securities available
                 #logging
-                self.model.log_event(f"Error: Transaction {self.transactionID} failed due to no cash or securities available", self.transactionID, is_transaction = True)
+                self.model.record_event(EventLogger.EventType.NO_ASSETS, self.transactionID)
             else:
                 #handless partial settlement
-                if self.deliverer.get_institution().check_partial_allowed() and self.receiver.get_institution().check_partial_allowed():
+                if self.partial_allowed():
                     #check if institutions allow partial settlement
-                    delivery_child_1, delivery_child_2 = self.deliverer.createDeliveryChildren()
-                    receipt_child_1, receipt_child_2 = self.receiver.createReceiptChildren()
-                    child_transaction_1 = delivery_child_1.match()
-                    child_transaction_2 = delivery_child_2.match()
-                    child_transaction_1.settle()
-                    #logging:
-                    self.model.log_event(f"Transaction {self.transactionID} partially settled. Children {receipt_child_1.get_uniqueID}, {receipt_child_2.get_uniqueID}, {delivery_child_1.get_uniqueID} and {delivery_child_2.get_uniqueID} got created. Transactions {child_transaction_1} and {child_transaction_2} got created.", self.transactionID, is_transaction = True)
-
-                    self.cancel_partial()
-
-
+                    with self.model.instrumentation.phase("partial"):
+                        self.settle_partial()
+
+    def partial_allowed(self):
+        #both institutions have to allow partial settlement
+        return self.deliverer.get_institution().check_partial_allowed() and self.receiver.get_institution().check_partial_allowed()
+
+    def available_to_settle(self):
+        #amount both legs can cover now: securities of the deliverer and cash (with unused credit) of the receiver
+        securitiesAccount = self.deliverer.securitiesAccount
+        available_securities = securitiesAccount.available() if securitiesAccount.accountType == self.deliverer.securityType else 0.0
+        return max(min(self.deliverer.amount, available_securities, self.receiver.cashAccount.available()), 0.0)
+
+    def settle_partial(self):
+        """Settles the part of the transaction that the accounts can cover, without creating child agents.
+
+        The instructions and the transaction keep their ids and continue with the remaining amount in their next
+        generation, the settled part is recorded in model.partial_settlements with or without the archive."""
+        settled_amount = self.available_to_settle()
+        if settled_amount <= 0:
+            #logging
+            self.model.record_event(EventLogger.EventType.NO_ASSETS, self.transactionID)
+            return
+
+        #transfer of securities and cash for the settled part
+        delivered_securities = self.deliverer.securitiesAccount.deductBalance(settled_amount, self.deliverer.get_securityType())
+        received_securites = self.receiver.securitiesAccount.addBalance(settled_amount, self.deliverer.get_securityType())
+        delivered_cash = self.receiver.cashAccount.deductBalance(settled_amount, "Cash")
+        received_cash = self.deliverer.cashAccount.addBalance(settled_amount, "Cash")
+
+        #extra check for safety
+        if not delivered_securities == received_securites == delivered_cash == received_cash == settled_amount:
+            self.deliverer.set_status("Cancelled due to error")
+            self.receiver.set_status("Cancelled due to error")
+            self.set_status("Cancelled due to error")
+            #logging
+            self.model.record_event(EventLogger.EventType.AMOUNTS_MISMATCH, self.transactionID)
+            return
+
+        if self.model.metrics is not None:
+            self.model.metrics.partial_settlement(self, settled_amount)
+        #logging
+        self.model.record_event(EventLogger.EventType.INSTRUCTION_PARTIAL, self.deliverer.uniqueID)
+        self.model.record_event(EventLogger.EventType.INSTRUCTION_PARTIAL, self.receiver.uniqueID)
+        self.model.record_event(EventLogger.EventType.TRANSACTION_PARTIAL, self.transactionID)
 
+        self.deliverer.continue_as_child(settled_amount)
+        self.receiver.continue_as_child(settled_amount)
+        self.model.partial_settlements.record(self, settled_amount, self.model.simulated_time().isoformat())
+        #logging
+        self.model.record_event(EventLogger.EventType.PARTIALLY_SETTLED, self.transactionID, amount=settled_amount, security=self.deliverer.securityType,
+                                text=f"Generation {self.deliverer.generation} continues with {self.deliverer.amount}.")
+
+    def settle_in_batch(self):
+        #state change after the legs got posted by the batch settlement
+        self.deliverer.set_status("Settled")
+        self.receiver.set_status("Settled")
+        self.set_status("Settled")
+        #logging
+        self.model.record_event(EventLogger.EventType.SETTLED_IN_BATCH, self.transactionID, amount=self.deliverer.amount, security=self.deliverer.securityType)
 
     def step(self):
         # TODO
         pass
 
+    def timeout(self):
+        #called by the timeout manager when the transaction didn't settle in time
+        self.cancel_timeout()
+
     def cancel_timeout(self):
-        # TODO: Implement timeout cancellation logic
-        self.status = "Cancelled due to timeout"
+        #a transaction that didn't settle in time gets cancelled together with its instructions
+        if self.status != "Matched":
+            return
+        self.deliverer.set_status("Cancelled due to timeout")
+        self.receiver.set_status("Cancelled due to timeout")
+        self.set_status("Cancelled due to timeout")
         # logging
-        self.model.log_event(f"Transaction {self.transactionID} cancelled due to timeout.", self.transactionID, is_transaction=True)
-        pass
+        self.model.record_event(EventLogger.EventType.TRANSACTION_TIMEOUT, self.transactionID)
 
-    def cancel_partial(self):
-        self.status = "Cancelled due to partial settlement"
-        #logging
-        self.model.log_event(f"Transaction {self.transactionID} cancelled due to partial settlement.", self.transactionID, is_transaction = True)
 
 
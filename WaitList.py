@@ -0,0 +1,102 @@
+import heapq
+import math
+import EventScheduler
+
+
+class WaitList:
+    """Matched transactions that couldn't settle, parked on the account they are short on.
+
+    A transaction waits on the securities account of its deliverer or the cash account of its receiver
+    (an account holds one asset type, so the account is the key) with the available amount it needs.
+    The waiting transactions of an account are a heap on that amount: when the available amount of the
+    account goes up (Account.addBalance or a higher credit limit), only the transactions it can now
+    cover are woken, they get a settlement event at the current time. A woken transaction that is
+    short on its other account is parked again on that one.
+    A transaction that may settle partially waits on the account that limits the amount it can settle now,
+    for any amount above the current available amount, so it settles partially as soon as one more unit
+    can go through, like it would at the next retry in poll mode."""
+
+    def __init__(self, model):
+        self.model = model
+        #account -> heap of (required available amount, sequence number, transaction)
+        self.waiting = {}
+        self.sequence = 0
+        self.parked = 0
+        self.woken = 0
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.waiting.values())
+
+    def park(self, transaction):
+        #parks the transaction on the first account that can't cover it, False if both can (it is blocked for another reason)
+        deliverer = transaction.deliverer
+        receiver = transaction.receiver
+        securities = deliverer.securitiesAccount.available()
+        cash = receiver.cashAccount.available()
+        if securities >= deliverer.amount and cash >= receiver.amount:
+            return False
+        if transaction.partial_allowed():
+            account, available = (deliverer.securitiesAccount, securities) if securities <= cash else (receiver.cashAccount, cash)
+            required = math.nextafter(available, math.inf)
+        elif securities < deliverer.amount:
+            account, required = deliverer.securitiesAccount, deliverer.amount
+        else:
+            account, required = receiver.cashAccount, receiver.amount
+        heapq.heappush(self.waiting.setdefault(account, []), (required, self.sequence, transaction))
+        self.sequence += 1
+        self.parked += 1
+        return True
+
+    def notify(self, account):
+        #called when the available amount of the account went up
+        heap = self.waiting.get(account)
+        if not heap:
+            return 0
+        available = account.available()
+        woken = 0
+        while heap and heap[0][0] <= available:
+            transaction = heapq.heappop(heap)[2]
+            #transactions settled or cancelled in the meantime (e.g. by the batch settlement) are dropped
+            if transaction.status == "Matched":
+                self.model.scheduler.schedule(self.model.simulated_time(), EventScheduler.SETTLEMENT, transaction)
+                woken += 1
+        if not heap:
+            del self.waiting[account]
+        self.woken += woken
+        return woken
+
+    def wake_institution(self, institution):
+        """Wakes the waiting transactions of an institution that opted in of partial settlement, they were parked
+        for their full amount and get parked again for a partial settlement if they still can't settle."""
+        woken = 0
+        for account in list(self.waiting):
+            heap = []
+            for entry in self.waiting[account]:
+                transaction = entry[2]
+                if transaction.status != "Matched":
+                    continue
+                if transaction.deliverer.institution is institution or transaction.receiver.institution is institution:
+                    self.model.scheduler.schedule(self.model.simulated_time(), EventScheduler.SETTLEMENT, transaction)
+                    woken += 1
+                else:
+                    heap.append(entry)
+            if heap:
+                heapq.heapify(heap)
+                self.waiting[account] = heap
+            else:
+                del self.waiting[account]
+        self.woken += woken
+        return woken
+
+    def recheck(self):
+        """Checks every account with waiting transactions and drops the ones that are no longer Matched.
+        Used after the batch settlement and gridlock resolution, which post to the ledger without Account.addBalance."""
+        woken = 0
+        for account in list(self.waiting):
+            heap = [entry for entry in self.waiting[account] if entry[2].status == "Matched"]
+            heapq.heapify(heap)
+            self.waiting[account] = heap
+            woken += self.notify(account)
+            if account in self.waiting and not self.waiting[account]:
+                del self.waiting[account]
+        return woken
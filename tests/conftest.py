@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+#the model modules live in the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_model():
+    #quiet model without an in-memory log, like Benchmark.build_model
+    import SettlementModel
+    import EventLogger
+
+    models = []
+
+    def make(**parameters):
+        parameters = {"num_institutions": 5, "steps_per_day": 20, "simulation_duration_days": 3, "seed": 1,
+                      "log": EventLogger.LogConfig(verbosity=EventLogger.QUIET, keep=False), **parameters}
+        model = SettlementModel.SettlementModel(**parameters)
+        models.append(model)
+        return model
+
+    yield make
+    for model in models:
+        model.close()
+
+
+def run_steps(model, steps: int):
+    for _ in range(steps):
+        model.step()
+    return model
+
+
+def model_state(model):
+    #what a run ends with: account values, the status and amount of every live instruction and the summary
+    accounts = [(account.accountID, account.balance, account.creditLimit, account.usedCredit) for account in model.accounts]
+    instructions = sorted((str(instruction.uniqueID), instruction.status, instruction.amount) for instruction in model.instructions)
+    return accounts, instructions, model.summary_metrics()
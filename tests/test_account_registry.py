@@ -0,0 +1,36 @@
+import random
+from collections import Counter
+from types import SimpleNamespace
+
+import AccountRegistry
+
+
+def registry_of(holdings: dict):
+    #institutionID -> account types it holds, one account per type
+    registry = AccountRegistry.AccountRegistry()
+    institutions = {}
+    for institutionID, accountTypes in holdings.items():
+        institutions[institutionID] = SimpleNamespace(institutionID=institutionID)
+        for accountType in accountTypes:
+            registry.add(institutions[institutionID], SimpleNamespace(accountType=accountType))
+    return registry, institutions
+
+
+def test_accounts_and_security_types_per_institution():
+    registry, institutions = registry_of({"INST-1": ["Cash", "Bond-A", "Bond-A", "Bond-B"], "INST-2": ["Cash"]})
+    assert len(registry.get_accounts(institutions["INST-1"], "Bond-A")) == 2
+    assert registry.get_accounts(institutions["INST-2"], "Bond-A") == []
+    assert registry.get_security_types(institutions["INST-1"]) == ["Bond-A", "Bond-B"]
+    assert registry.get_security_types(institutions["INST-2"]) == []
+
+
+def test_counterparty_is_drawn_uniformly_from_the_other_holders():
+    registry, institutions = registry_of({"INST-1": ["Bond-A"], "INST-2": ["Bond-A"], "INST-3": ["Bond-B"], "INST-4": ["Bond-A"]})
+    rng = random.Random(7)
+    drawn = Counter(registry.sample_counterparty(institutions["INST-2"], "Bond-A", rng).institutionID for _ in range(3000))
+    assert set(drawn) == {"INST-1", "INST-4"}
+    assert abs(drawn["INST-1"] - drawn["INST-4"]) < 300
+    #an institution without the type can draw any holder, a type with a single holder has no counterparty
+    assert registry.sample_counterparty(institutions["INST-3"], "Bond-A", rng).institutionID in ("INST-1", "INST-2", "INST-4")
+    assert registry.sample_counterparty(institutions["INST-3"], "Bond-B", rng) is None
+    assert registry.sample_counterparty(institutions["INST-1"], "Bond-C", rng) is None
@@ -0,0 +1,31 @@
+import Archive
+from conftest import run_steps
+
+
+def test_full_chunks_spill_and_are_read_back(tmp_path):
+    table = Archive.ArchiveTable("transactions", ["transactionID", "amount"], "transactionID", spill_dir=str(tmp_path), chunk_size=2)
+    for number in range(5):
+        table.append({"transactionID": f"T{number}", "amount": float(number)})
+    assert len(table) == 5
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["transactions-00000.csv", "transactions-00001.csv"]
+    #the last record is still in memory, spilled records come back as strings
+    assert table.get("T4") == {"transactionID": "T4", "amount": 4.0}
+    assert table.get("T1") == {"transactionID": "T1", "amount": "1.0"}
+    assert table.get("T2") == {"transactionID": "T2", "amount": "2.0"}
+    assert table.get("T0") == {"transactionID": "T0", "amount": "0.0"}
+    assert table.get("T9") is None and "T9" not in table
+
+
+def test_terminal_instructions_move_to_the_archive(make_model):
+    model = run_steps(make_model(), 20)
+    archive = model.archive
+    assert len(archive.instructions) > 0 and len(archive.transactions) > 0
+    #only live work stays in the model, an archived record is found by its id
+    assert not any(Archive.is_terminal(instruction.status) for instruction in model.instructions)
+    assert not any(Archive.is_terminal(transaction.status) for transaction in model.transactions)
+    uniqueID = archive.instructions.columns["uniqueID"][0]
+    record = archive.get_instruction(uniqueID)
+    assert Archive.is_terminal(record["status"])
+    assert sum(archive.instruction_statuses.values()) == len(archive.instructions)
+    settled = [archive.get_transaction(transactionID) for transactionID in archive.transactions.columns["transactionID"]]
+    assert archive.settled_value == sum(record["amount"] for record in settled if record["status"] == "Settled")
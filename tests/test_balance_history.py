@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+import BalanceHistory
+from conftest import run_steps
+
+
+@pytest.mark.parametrize("use_ledger", [False, True])
+def test_reader_returns_the_recorded_snapshots(make_model, tmp_path, use_ledger):
+    #a one day run expects 5 snapshots at interval 5, running two days makes the files grow
+    model = run_steps(make_model(simulation_duration_days=1, use_ledger=use_ledger, balance_history_dir=str(tmp_path), balance_history_interval=5), 40)
+    model.close()
+    reader = BalanceHistory.BalanceHistoryReader(str(tmp_path))
+    assert len(reader) == 9
+    assert reader.steps.tolist() == list(range(0, 41, 5))
+
+    last = reader.snapshot(42)
+    for name in BalanceHistory.HISTORY_COLUMNS:
+        assert last[name][:len(model.accounts)] == pytest.approx([getattr(account, name) for account in model.accounts])
+
+    account = model.accounts[1]
+    trajectory = reader.account(account.accountID, start_step=10, stop_step=30)
+    assert trajectory["step"].tolist() == [10, 15, 20, 25]
+    assert np.array_equal(trajectory["balance"], reader.column("balance")[2:6, 1])
+    selection = reader.accounts([account.accountID, 0])
+    assert selection["balance"].shape == (9, 2)
+    with pytest.raises(KeyError):
+        reader.snapshot(-1)
@@ -0,0 +1,11 @@
+import BatchRunner
+
+
+def test_killed_run_does_not_affect_the_other_runs(tmp_path):
+    #the long run is killed by the hard timeout, the short ones finish in their own processes
+    grid = {"num_institutions": [3], "steps_per_day": [5], "simulation_duration_days": [1, 1000000]}
+    runner = BatchRunner.BatchRunner(grid, replications=2, output=str(tmp_path / "results.csv"), workers=2, hard_timeout=10)
+    rows = sorted(runner.run(), key=lambda row: row["run"])
+    assert [row["run_status"] for row in rows] == ["finished", "finished", "killed", "killed"]
+    assert rows[0]["steps"] == rows[1]["steps"] == 5
+    assert (tmp_path / "results.csv").read_text().count("\n") == 5
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+import BatchSettlement
+import Ledger
+
+
+def batch_arrays(ledger, legs, creation_times=None):
+    #legs are (deliverer securities, receiver cash, amount), the other two accounts of every transaction have room for anything
+    receiver_securities = ledger.add_account("Bond", 0.0)
+    deliverer_cash = ledger.add_account("Cash", 0.0)
+    count = len(legs)
+    return {
+        "deliverer_securities": np.array([leg[0] for leg in legs], dtype=np.int64),
+        "receiver_securities": np.full(count, receiver_securities, dtype=np.int64),
+        "receiver_cash": np.array([leg[1] for leg in legs], dtype=np.int64),
+        "deliverer_cash": np.full(count, deliverer_cash, dtype=np.int64),
+        "security_code": np.full(count, ledger.get_type_code("Bond"), dtype=np.int16),
+        "amount": np.array([leg[2] for leg in legs], dtype=np.float64),
+        "creation_time": np.arange(count, dtype=np.float64) if creation_times is None else np.array(creation_times, dtype=np.float64),
+        "eligible": np.ones(count, dtype=bool),
+    }
+
+
+def reference_selection(ledger, arrays, order):
+    #one transaction at a time: take it when its accounts still cover it, otherwise skip it
+    remaining = ledger.available()
+    selected = []
+    for position in order:
+        amount = arrays["amount"][position]
+        securities = arrays["deliverer_securities"][position]
+        cash = arrays["receiver_cash"][position]
+        if arrays["eligible"][position] and remaining[securities] >= amount and remaining[cash] >= amount:
+            remaining[securities] -= amount
+            remaining[cash] -= amount
+            selected.append(position)
+    return selected
+
+
+def test_a_skipped_transaction_leaves_its_securities_to_later_ones():
+    ledger = Ledger.Ledger()
+    bonds = ledger.add_account("Bond", 100.0)
+    poor_cash = ledger.add_account("Cash", 10.0)
+    rich_cash = ledger.add_account("Cash", 1000.0)
+    #T1 isn't covered by the cash of its receiver, T2 gets the bonds instead
+    arrays = batch_arrays(ledger, [(bonds, poor_cash, 60.0), (bonds, rich_cash, 60.0)])
+    selected = BatchSettlement.select_covered(ledger, arrays, BatchSettlement.order_transactions(arrays, "fifo"))
+    assert selected.tolist() == [1]
+
+
+@pytest.mark.parametrize("policy, expected", [
+    ("fifo", [0, 1]),
+    ("lifo", [3, 2]),
+    ("largest", [2, 3]),
+    ("smallest", [1, 0]),
+])
+def test_ordering_policy_decides_which_transactions_get_the_securities(policy, expected):
+    ledger = Ledger.Ledger()
+    bonds = ledger.add_account("Bond", 100.0)
+    cash = ledger.add_account("Cash", 1000.0)
+    #any two of the four fit in the bonds, the third one doesn't
+    arrays = batch_arrays(ledger, [(bonds, cash, 40.0), (bonds, cash, 30.0), (bonds, cash, 50.0), (bonds, cash, 45.0)])
+    selected = BatchSettlement.select_covered(ledger, arrays, BatchSettlement.order_transactions(arrays, policy))
+    assert selected.tolist() == expected
+
+
+@pytest.mark.parametrize("policy", list(BatchSettlement.ORDER_POLICIES))
+def test_selection_matches_one_at_a_time_settlement(policy):
+    rng = np.random.default_rng(5)
+    ledger = Ledger.Ledger()
+    bonds = [ledger.add_account("Bond", float(balance)) for balance in rng.integers(0, 200, 10)]
+    cash = [ledger.add_account("Cash", float(balance), float(credit)) for balance, credit in zip(rng.integers(0, 200, 10), rng.integers(0, 50, 10))]
+    legs = [(bonds[rng.integers(10)], cash[rng.integers(10)], float(rng.integers(1, 80))) for _ in range(200)]
+    arrays = batch_arrays(ledger, legs, creation_times=rng.permutation(200))
+    arrays["eligible"][rng.integers(0, 200, 20)] = False
+    order = BatchSettlement.order_transactions(arrays, policy)
+    assert BatchSettlement.select_covered(ledger, arrays, order).tolist() == reference_selection(ledger, arrays, order)
@@ -0,0 +1,20 @@
+import inspect
+
+import Benchmark
+
+
+def result(throughput: float, peak_memory: float):
+    return {"benchmark": "settle", "num_institutions": 10, "volume": 1000, "status": "ok", "throughput": throughput, "peak_memory": peak_memory}
+
+
+def test_compare_uses_the_same_default_tolerance_as_the_command_line():
+    assert inspect.signature(Benchmark.compare).parameters["tolerance"].default == Benchmark.DEFAULT_TOLERANCE
+    baseline = {"results": [result(1000.0, 1e6)]}
+    assert not Benchmark.compare({"results": [result(850.0, 1.15e6)]}, baseline)[0]["regression"]
+    assert Benchmark.compare({"results": [result(750.0, 1e6)]}, baseline)[0]["regression"]
+
+
+def test_benchmark_runs_and_reports_its_operations():
+    run = Benchmark.run_benchmark("settle", num_institutions=5, volume=100, repeats=2)
+    assert run["status"] == "ok"
+    assert run["operations"] > 0 and run["best_time"] <= run["median_time"]
@@ -0,0 +1,46 @@
+import pytest
+
+import Checkpoint
+import EventLogger
+from conftest import model_state, run_steps
+
+
+@pytest.mark.parametrize("parameters", [{}, {"use_ledger": True}, {"settlement_retry": "poll"}])
+def test_restored_run_matches_uninterrupted_run(make_model, tmp_path, parameters):
+    uninterrupted = run_steps(make_model(**parameters), 60)
+
+    interrupted = run_steps(make_model(checkpoints=Checkpoint.CheckpointConfig(str(tmp_path), interval=10), **parameters), 30)
+    restored = Checkpoint.restore(str(tmp_path / "checkpoint-00000030.ckpt"))
+    run_steps(restored, 30)
+
+    assert model_state(restored) == model_state(uninterrupted)
+    restored.close()
+
+
+def test_incremental_chain_restores_every_checkpoint(make_model, tmp_path):
+    model = make_model(use_ledger=True, checkpoints=Checkpoint.CheckpointConfig(str(tmp_path), interval=5))
+    states = {}
+    for _ in range(25):
+        model.step()
+        if model.steps % 5 == 0:
+            states[model.steps] = model_state(model)
+    for step, state in states.items():
+        restored = Checkpoint.restore(str(tmp_path / f"checkpoint-{step:08d}.ckpt"))
+        assert model_state(restored) == state
+
+
+def test_incremental_checkpoint_only_stores_appended_records(make_model, tmp_path):
+    model = run_steps(make_model(log=EventLogger.LogConfig(verbosity=EventLogger.QUIET), checkpoints=Checkpoint.CheckpointConfig(str(tmp_path), interval=20)), 60)
+    previous = Checkpoint.read_checkpoint(str(tmp_path / "checkpoint-00000040.ckpt"))
+    checkpoint = Checkpoint.read_checkpoint(str(tmp_path / "checkpoint-00000060.ckpt"))
+    assert checkpoint["base"] == "checkpoint-00000040.ckpt"
+    previous_sequences = Checkpoint.load_arrays(str(tmp_path / "checkpoint-00000040.ckpt"), previous)[1]
+    for name in ("archive.instructions.uniqueID", "archive.transactions.lookup", "event_log.0.timestamp", "activity_log.0.timestamp"):
+        length, appended = checkpoint["sequences"][name]
+        assert length == len(previous_sequences[name]) > 0
+        assert len(appended) == len(Checkpoint.tracked_sequences(model)[name]) - length
+    restored = Checkpoint.load_arrays(str(tmp_path / "checkpoint-00000060.ckpt"))[1]
+    for name, sequence in Checkpoint.tracked_sequences(model).items():
+        #the metrics record of the step is written after its checkpoint
+        if name.startswith(("archive.", "event_log.", "activity_log.")):
+            assert restored[name] == sequence
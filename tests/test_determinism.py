@@ -0,0 +1,26 @@
+import random
+
+import EventLogger
+from conftest import model_state, run_steps
+
+
+def logged_run(make_model, seed: int):
+    model = run_steps(make_model(seed=seed, log=EventLogger.LogConfig(verbosity=EventLogger.QUIET)), 40)
+    model.event_logger.flush()
+    return model_state(model), list(model.event_logger.memory_sink(is_transaction=True).records())
+
+
+def test_same_seed_gives_the_same_run(make_model):
+    first = logged_run(make_model, seed=3)
+    assert logged_run(make_model, seed=3) == first
+    assert logged_run(make_model, seed=4) != first
+
+
+def test_runs_only_use_the_model_rng_and_the_simulated_clock(make_model):
+    random.seed(11)
+    expected = random.random()
+    random.seed(11)
+    model = run_steps(make_model(), 25)
+    #the global random module isn't touched by the run
+    assert random.random() == expected
+    assert model.simulated_time() == model.simulation_start + 25 * model.step_duration
@@ -0,0 +1,80 @@
+import json
+
+import EventLogger
+from EventLogger import EventType
+
+
+def make_logger(**options):
+    events = EventLogger.MemoryLogSink()
+    activities = EventLogger.MemoryLogSink()
+    logger = EventLogger.EventLogger(event_sinks=[events], activity_sinks=[activities], verbosity=EventLogger.QUIET, **options)
+    return logger, events, activities
+
+
+def test_duplicates_are_dropped_within_a_timestamp():
+    logger, events, activities = make_logger()
+    for timestamp in ("t1", "t1", "t2"):
+        logger.record(timestamp, EventType.INSTRUCTION_VALIDATED, 7)
+    logger.flush()
+    assert [record[0] for record in events.records()] == ["t1", "t2"]
+    #the activity log keeps every record
+    assert len(activities) == 3
+
+
+def test_without_dedup_every_record_is_kept():
+    logger, events, _ = make_logger(dedup=None)
+    for _ in range(3):
+        logger.record("t1", EventType.INSTRUCTION_VALIDATED, 7)
+    logger.flush()
+    assert len(events) == 3
+
+
+def test_sinks_get_the_records_in_batches_of_the_buffer_size():
+    logger, events, _ = make_logger(buffer_size=3)
+    for agent_id in range(5):
+        logger.record("t1", EventType.INSTRUCTION_VALIDATED, agent_id)
+    assert len(events) == 3
+    logger.flush()
+    assert [record[1] for record in events.records()] == [0, 1, 2, 3, 4]
+
+
+def test_messages_go_to_the_log_and_not_to_stdout(make_model, capsys):
+    model = make_model(log=EventLogger.LogConfig(verbosity=EventLogger.QUIET))
+    institution = model.participants[0]
+    account = institution.accounts[0]
+    institution.allowPartial = True
+    institution.opt_in_partial()
+    institution.opt_out_partial()
+    account.addBalance(1.0, "No such asset")
+    assert capsys.readouterr().out == ""
+
+    records = list(model.event_logger.memory_sink(is_transaction=False).records())
+    types = [record[2] for record in records[-3:]]
+    assert types == [EventType.ERROR_MESSAGE, EventType.MESSAGE, EventType.WRONG_ASSET_TYPE]
+    assert records[-2][8] == f"Institution {institution.institutionID} opted out of partial settlement"
+
+
+def test_records_keep_their_fields_and_render_from_the_template(tmp_path):
+    events = EventLogger.JSONLLogSink(str(tmp_path / "event_log.jsonl"))
+    activities = EventLogger.MemoryLogSink()
+    logger = EventLogger.EventLogger(event_sinks=[events], activity_sinks=[activities], verbosity=EventLogger.QUIET)
+    logger.record("t1", EventType.INSTRUCTION_CREATED, 7, ref="INST-1", amount=250.0, security="Bond-A", text="Delivery")
+    #account activity only goes to the activity log, which keeps every record
+    logger.record("t1", EventType.CASH_ADDED, "ACC-1", amount=10.0, balance=110.0, credit=0.0)
+    logger.close()
+
+    with open(tmp_path / "event_log.jsonl") as log_file:
+        rows = [json.loads(line) for line in log_file]
+    assert rows == [{"Timestamp": "t1", "Agent ID": 7, "Event": "Delivery instruction with ID 7 created by institution INST-1 for Bond-A for amount 250.0",
+                     "Event Type": "INSTRUCTION_CREATED", "Reference": "INST-1", "Amount": 250.0, "Balance": None, "Credit": None, "Security Type": "Bond-A"}]
+    records = list(activities.records())
+    assert [record[2] for record in records] == [EventType.INSTRUCTION_CREATED, EventType.CASH_ADDED]
+    assert records[1][4:7] == (10.0, 110.0, 0.0)
+    assert activities.entries[1]["Event"] == EventLogger.render(records[1])
+
+
+def test_errors_verbosity_only_prints_errors(capsys):
+    logger = EventLogger.EventLogger(verbosity=EventLogger.ERRORS)
+    logger.record("t1", EventType.INSTRUCTION_VALIDATED, 7)
+    logger.record("t1", EventType.MATCH_FAILED, 7)
+    assert capsys.readouterr().out == "t1 | Agent ID: 7 | ERROR: Instruction 7 failed to match, no matching instruction found\n"
@@ -0,0 +1,47 @@
+import pytest
+
+import EventScheduler
+
+
+def recording_scheduler():
+    scheduler = EventScheduler.EventScheduler()
+    handled = []
+    for kind in EventScheduler.EVENT_KINDS:
+        scheduler.register(kind, lambda target, time, kind=kind: handled.append((time, kind, target)))
+    return scheduler, handled
+
+
+def test_due_events_are_handled_by_time_then_in_scheduling_order():
+    scheduler, handled = recording_scheduler()
+    scheduler.schedule(2, EventScheduler.MATCHING, "b")
+    scheduler.schedule(1, EventScheduler.SETTLEMENT, "a")
+    scheduler.schedule(2, EventScheduler.ARRIVAL, "c")
+    scheduler.schedule(5, EventScheduler.VALIDATION, "d")
+    assert scheduler.run_until(3) == 3
+    assert handled == [(1, EventScheduler.SETTLEMENT, "a"), (2, EventScheduler.MATCHING, "b"), (2, EventScheduler.ARRIVAL, "c")]
+    #the event that isn't due stays on the queue
+    assert len(scheduler) == 1 and scheduler.next_time() == 5
+
+
+def test_events_scheduled_while_handling_are_handled_when_due():
+    scheduler = EventScheduler.EventScheduler()
+    handled = []
+
+    def arrival(target, time):
+        handled.append(target)
+        #a follow-up due in the same run and one that isn't
+        scheduler.schedule(time, EventScheduler.VALIDATION, f"{target}-now")
+        scheduler.schedule(time + 10, EventScheduler.VALIDATION, f"{target}-later")
+
+    scheduler.register(EventScheduler.ARRIVAL, arrival)
+    scheduler.register(EventScheduler.VALIDATION, lambda target, time: handled.append(target))
+    scheduler.schedule(1, EventScheduler.ARRIVAL, "a")
+    assert scheduler.run_until(1) == 2
+    assert handled == ["a", "a-now"]
+    assert scheduler.processed == 2
+    assert scheduler.next_time() == 11
+
+
+def test_unknown_event_kind_is_rejected():
+    with pytest.raises(ValueError, match="Unknown event kind"):
+        EventScheduler.EventScheduler().register("clearing", print)
@@ -0,0 +1,32 @@
+import numpy as np
+
+import GridlockResolver
+import Ledger
+
+
+class LedgerModel:
+    #the resolver only uses the ledger of the model
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+
+def test_stops_when_an_account_in_deficit_has_no_outgoing_legs():
+    ledger = Ledger.Ledger()
+    #cash of A is already short before the batch, it only receives cash
+    cash_a = ledger.add_account("Cash", -100.0)
+    bonds_a = ledger.add_account("Bond", 50.0)
+    cash_b = ledger.add_account("Cash", 1000.0)
+    bonds_b = ledger.add_account("Bond", 0.0)
+    #A delivers 30 bonds to B, then 40 more than it holds
+    arrays = {
+        "deliverer_securities": np.array([bonds_a, bonds_a]),
+        "receiver_securities": np.array([bonds_b, bonds_b]),
+        "receiver_cash": np.array([cash_b, cash_b]),
+        "deliverer_cash": np.array([cash_a, cash_a]),
+        "amount": np.array([30.0, 40.0]),
+        "eligible": np.array([True, True]),
+    }
+    resolver = GridlockResolver.GridlockResolver(LedgerModel(ledger))
+    selected, iterations = resolver.resolve(arrays, np.arange(2))
+    assert selected.tolist() == [True, False]
+    assert iterations == 2
@@ -0,0 +1,56 @@
+import tracemalloc
+
+import pytest
+
+import DeliveryInstructionAgent
+import InstructionStore
+
+from conftest import run_steps
+
+
+def test_archived_instruction_raises_on_access(make_model):
+    model = run_steps(make_model(), 5)
+    instruction = model.instructions[0]
+    run_steps(model, 55)
+    assert instruction.is_archived()
+    with pytest.raises(RuntimeError, match="is archived"):
+        instruction.amount
+    with pytest.raises(RuntimeError, match="is archived"):
+        instruction.status = "Settled"
+
+
+def test_memory_usage_includes_the_agents(make_model):
+    model = run_steps(make_model(), 30)
+    store_only = model.instruction_store.memory_usage()
+    usage = model.instruction_store.memory_usage(model.instructions)
+    assert store_only["agent_bytes"] == 0
+    assert usage["agent_bytes"] > 0
+    assert usage["total_bytes"] == store_only["total_bytes"] + usage["agent_bytes"]
+    assert usage["bytes_per_instruction"] > usage["store_bytes_per_instruction"] == store_only["bytes_per_instruction"]
+
+
+def test_instruction_state_fits_the_target_under_tracemalloc(make_model):
+    model = make_model()
+    store = model.instruction_store
+    institution = model.participants[0]
+    cash = model.account_registry.get_accounts(institution, "Cash")[0]
+    securities = next(account for account in institution.accounts if account.accountType != "Cash")
+    count = 5000
+    #the columns are grown beforehand, so the spare capacity of a doubling doesn't count
+    store.grow(store.size + count)
+    instructions = []
+    #Validated instructions aren't scheduled, the matching index and the log aren't state of the instruction
+    excluded = [tracemalloc.Filter(False, f"*{module}.py") for module in ("MatchingIndex", "EventLogger", "Metrics", "TimingWheel")]
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(excluded)
+    for i in range(count):
+        instructions.append(DeliveryInstructionAgent.DeliveryInstructionAgent(
+            model, uniqueID=model.new_instruction_id(), motherID="mother", institution=institution, securitiesAccount=securities,
+            cashAccount=cash, securityType=securities.accountType, amount=100.0, isChild=False, status="Validated",
+            linkcode=f"LINK-{i}", creation_time=model.simulation_start))
+    after = tracemalloc.take_snapshot().filter_traces(excluded)
+    tracemalloc.stop()
+
+    bytes_per_instruction = sum(stat.size_diff for stat in after.compare_to(before, "filename")) / count
+    assert bytes_per_instruction <= InstructionStore.TARGET_BYTES_PER_INSTRUCTION
@@ -0,0 +1,38 @@
+import csv
+import time
+
+import EventScheduler
+import Instrumentation
+from conftest import model_state, run_steps
+
+
+def test_nested_phase_only_counts_its_own_time():
+    instrumentation = Instrumentation.Instrumentation()
+    instrumentation.begin_step(0)
+    with instrumentation.phase("settlement"):
+        with instrumentation.phase("logging"):
+            time.sleep(0.02)
+    instrumentation.end_step(0, 0, end_of_day=True)
+    summary = instrumentation.summary()
+    assert summary["settlement"]["calls"] == summary["logging"]["calls"] == 1
+    assert summary["logging"]["time"] >= 0.02 > summary["settlement"]["time"]
+    assert instrumentation.sinks[0].days[0]["logging_calls"] == 1
+
+
+def test_instrumentation_records_the_phases_without_changing_the_run(make_model, tmp_path):
+    instrumented = run_steps(make_model(instrumentation_dir=str(tmp_path)), 40)
+    plain = run_steps(make_model(), 40)
+    assert model_state(instrumented) == model_state(plain)
+
+    summary = instrumented.instrumentation.summary()
+    assert summary["creation"]["calls"] == 40
+    assert summary["arrival"]["calls"] > 0 and summary["settlement"]["calls"] > 0
+    instrumented.close()
+    with open(tmp_path / "steps.csv", newline="") as steps_file:
+        assert len(list(csv.DictReader(steps_file))) == 40
+    assert len(instrumented.instrumentation.days) == 2
+
+    #off, the handlers are registered as they are
+    assert not plain.instrumentation.enabled
+    assert plain.scheduler.handlers[EventScheduler.ARRIVAL] == plain.handle_arrival
+    assert "Instrumentation is off" in plain.instrumentation.report()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import Account
+import Ledger
+
+
+class Recorder:
+    #model side of Account: only the logging and wait list hooks are used
+    wait_list = None
+
+    def record_event(self, *args, **kwargs):
+        pass
+
+
+def make_accounts(ledger):
+    model = Recorder()
+    specs = [("Cash", 1000.0, 500.0), ("Cash", 0.0, 300.0), ("Bond-A", 200.0, 0.0), ("Bond-B", 50.0, 0.0)]
+    scalar = [Account.Account.open(model, f"ACC-{i}", accountType, balance, creditLimit, log_creation=False) for i, (accountType, balance, creditLimit) in enumerate(specs)]
+    views = [Account.Account.open(model, f"ACC-{i}", accountType, balance, creditLimit, ledger=ledger, log_creation=False) for i, (accountType, balance, creditLimit) in enumerate(specs)]
+    return scalar, views
+
+
+def operations(seed: int, count: int):
+    rng = np.random.default_rng(seed)
+    types = ["Cash", "Bond-A", "Bond-B"]
+    return [(str(rng.choice(["add", "deduct"])), int(rng.integers(4)), float(rng.integers(1, 800)), str(rng.choice(types))) for _ in range(count)]
+
+
+def values(accounts):
+    return [(account.balance, account.usedCredit) for account in accounts]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_single_item_batches_match_account_methods(seed):
+    ledger = Ledger.Ledger(capacity=2)
+    scalar, views = make_accounts(ledger)
+    for operation, index, amount, securityType in operations(seed, 200):
+        account = scalar[index]
+        assert ledger.check([views[index].slot], [amount], securityType)[0] == account.checkBalance(amount, securityType)
+        if operation == "add":
+            expected = account.addBalance(amount, securityType) or 0.0
+            result = ledger.add([views[index].slot], [amount], securityType)[0]
+        else:
+            expected = account.deductBalance(amount, securityType) or 0.0
+            result = ledger.deduct([views[index].slot], [amount], securityType)[0]
+        assert result == pytest.approx(expected)
+        assert values(views) == pytest.approx(values(scalar))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_with_repeated_slots_applies_items_in_order(seed):
+    ledger = Ledger.Ledger()
+    scalar, views = make_accounts(ledger)
+    batch = [(index, amount) for _, index, amount, _ in operations(seed, 30) if scalar[index].accountType == "Cash"]
+    slots = [views[index].slot for index, _ in batch]
+    amounts = [amount for _, amount in batch]
+
+    covered = ledger.check(slots, amounts, "Cash", cumulative=True)
+    deducted = ledger.deduct(slots, amounts, "Cash")
+    for (index, amount), is_covered, result in zip(batch, covered, deducted):
+        assert is_covered == scalar[index].checkBalance(amount, "Cash")
+        assert result == pytest.approx(scalar[index].deductBalance(amount, "Cash"))
+    assert values(views) == pytest.approx(values(scalar))
+
+    added = ledger.add(slots, amounts, "Cash")
+    for (index, amount), result in zip(batch, added):
+        assert result == pytest.approx(scalar[index].addBalance(amount, "Cash"))
+    assert values(views) == pytest.approx(values(scalar))
+
+
+def test_storage_is_picked_when_the_account_is_opened():
+    ledger = Ledger.Ledger()
+    scalar, views = make_accounts(ledger)
+    assert all(type(account) is Account.PlainAccount for account in scalar)
+    assert all(type(account) is Account.LedgerAccount for account in views)
+    assert [account.slot for account in views] == list(range(len(views)))
+    views[0].creditLimit = 800.0
+    assert ledger.creditLimit[views[0].slot] == 800.0
+    #the base class only defines the behaviour, an account is opened with a storage
+    with pytest.raises(TypeError):
+        Account.Account(Recorder(), "ACC-X", "Cash", 0.0)
+    assert type(Account.PlainAccount(Recorder(), "ACC-X", "Cash", 0.0)) is Account.PlainAccount
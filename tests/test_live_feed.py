@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import LiveFeed
+import Metrics
+from conftest import run_steps
+
+
+def feed_record(linkcode: str, direction: str, amount: float = 10.0):
+    #INST-1 and INST-2 of the seed 1 population both hold Bond-D
+    institutionID = "INST-1" if direction == "delivery" else "INST-2"
+    return json.dumps({"direction": direction, "linkcode": linkcode, "institutionID": institutionID, "securityType": "Bond-D", "amount": amount})
+
+
+def feed_step(feed, lines):
+    #what LiveFeed.run does for one step, with the lines decoded as if a reader got them
+    feed.pending.extend(feed.decode(line) for line in lines)
+    feed.model.step()
+    feed.update_backpressure()
+
+
+@pytest.mark.parametrize("metrics", [True, False])
+def test_feed_pauses_over_the_matching_backlog_and_resumes_under_it(make_model, metrics):
+    model = make_model(workload="live", feed=LiveFeed.FeedConfig(max_matching_backlog=3, resume_ratio=0.5), metrics=Metrics.MetricsConfig(enabled=metrics))
+    feed = model.live_feed
+    #deliveries without their receipts stay in the matching backlog
+    feed_step(feed, [feed_record(f"L{number}", "delivery") for number in range(4)])
+    assert feed.backlog() == (4, 0)
+    assert feed.paused and not feed.accepting.is_set()
+    assert feed.pauses == 1
+
+    feed_step(feed, [feed_record(f"L{number}", "receipt") for number in range(4)])
+    run_steps(model, 3)
+    feed.update_backpressure()
+    assert feed.backlog()[0] == 0
+    assert not feed.paused and feed.accepting.is_set()
+    assert feed.stats()["paused_time"] > 0
+
+
+def test_settled_feed_instructions_give_latency_samples(make_model):
+    model = make_model(workload="live")
+    feed = model.live_feed
+    feed_step(feed, [feed_record("L1", "delivery"), feed_record("L1", "receipt"), feed_record("L2", "delivery")])
+    run_steps(model, 3)
+    stats = feed.stats()
+    assert stats["injected"] == 3
+    #both instructions of L1 settled, the unmatched L2 has no sample yet
+    assert stats["settled"] == stats["latency_samples"] == 2
+    assert 0 < stats["p50"] <= stats["p99"]
+    assert stats["matching_backlog"] == 1
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+import pytest
+
+import MatchingIndex
+import TraceReplay
+
+
+def instruction(linkcode: str, direction: str, status: str = "Validated", uniqueID: int = 1):
+    return SimpleNamespace(linkcode=linkcode, direction=direction, status=status, uniqueID=uniqueID)
+
+
+def test_counterpart_is_found_by_linkcode():
+    index = MatchingIndex.MatchingIndex()
+    delivery = instruction("L1", "delivery", uniqueID=1)
+    receipt = instruction("L1", "receipt", uniqueID=2)
+    other = instruction("L2", "receipt", uniqueID=3)
+    for registered in (delivery, receipt, other):
+        index.add(registered)
+    assert index.find_counterpart(delivery) is receipt
+    assert index.find_counterpart(receipt) is delivery
+    assert index.find_counterpart(other) is None
+    #only a validated counterpart can be matched
+    receipt.status = "Pending"
+    assert index.find_counterpart(delivery) is None
+
+
+def test_matched_and_cancelled_instructions_leave_the_index():
+    index = MatchingIndex.MatchingIndex()
+    delivery = instruction("L1", "delivery", uniqueID=1)
+    receipt = instruction("L1", "receipt", uniqueID=2)
+    index.add(delivery)
+    index.add(receipt)
+    receipt.status = "Cancelled due to timeout"
+    index.update(receipt)
+    assert index.find_counterpart(delivery) is None
+    delivery.status = "Matched"
+    index.update(delivery)
+    assert len(index) == 0
+    #a removed instruction doesn't take a newer one of the same linkcode with it
+    newer = instruction("L1", "receipt", uniqueID=3)
+    index.add(newer)
+    index.remove(receipt)
+    assert index.has_open("L1", "receipt")
+
+
+def test_duplicate_linkcode_doesnt_replace_the_open_instruction():
+    index = MatchingIndex.MatchingIndex()
+    first = instruction("L1", "delivery", uniqueID=1)
+    index.add(first)
+    #a status change of the same instruction registers it again
+    index.update(first)
+    with pytest.raises(ValueError, match="already has an open delivery instruction 1"):
+        index.add(instruction("L1", "delivery", uniqueID=2))
+    assert index.find_counterpart(instruction("L1", "receipt", uniqueID=3)) is first
+
+
+def test_trace_instruction_with_a_duplicate_linkcode_is_skipped(make_model):
+    model = make_model()
+    institution = model.participants[0]
+    securityType = next(account.accountType for account in institution.accounts if account.accountType != "Cash")
+    institutions = {institution.institutionID: institution}
+    record = {"arrival_time": model.simulation_start, "direction": "delivery", "linkcode": "TRACE-1", "institutionID": institution.institutionID,
+              "securityType": securityType, "amount": 10.0, "uniqueID": None}
+    first = TraceReplay.create_instruction(model, institutions, record)
+    assert first is not None
+    assert TraceReplay.create_instruction(model, institutions, record) is None
+    assert model.matching_index.index["TRACE-1"] == {"delivery": first}
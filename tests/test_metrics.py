@@ -0,0 +1,12 @@
+import pytest
+
+import Metrics
+from conftest import run_steps
+
+
+@pytest.mark.parametrize("parameters", [{}, {"use_ledger": True}, {"settlement_retry": "poll"}])
+def test_summary_is_the_same_with_and_without_metrics(make_model, parameters):
+    with_metrics = run_steps(make_model(**parameters), 60)
+    without_metrics = run_steps(make_model(metrics=Metrics.MetricsConfig(enabled=False), **parameters), 60)
+    assert with_metrics.metrics.counters["partial_settlements"] > 0
+    assert with_metrics.summary_metrics() == pytest.approx(without_metrics.summary_metrics())
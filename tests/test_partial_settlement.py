@@ -0,0 +1,50 @@
+import pytest
+
+import Metrics
+
+
+def partial_transaction(model, max_steps: int = 60):
+    #steps until a matched transaction can settle partially
+    for _ in range(max_steps):
+        model.step()
+        for transaction in model.transactions:
+            if transaction.status == "Matched" and transaction.partial_allowed():
+                return transaction
+    raise AssertionError("no transaction to settle partially")
+
+
+@pytest.mark.parametrize("archive", [True, False])
+def test_repeated_partial_settlements_keep_the_ids(make_model, archive):
+    model = make_model(archive=archive)
+    transaction = partial_transaction(model)
+    deliverer, receiver = transaction.deliverer, transaction.receiver
+    ids = (transaction.transactionID, deliverer.uniqueID, deliverer.linkcode, receiver.uniqueID, receiver.linkcode)
+    generation = deliverer.generation
+    amount = deliverer.amount
+    recorded = len(model.partial_settlements)
+
+    for _ in range(3):
+        deliverer.securitiesAccount.deductBalance(deliverer.securitiesAccount.available(), deliverer.securityType)
+        deliverer.securitiesAccount.addBalance(amount / 10, deliverer.securityType)
+        transaction.settle_partial()
+
+    assert (transaction.transactionID, deliverer.uniqueID, deliverer.linkcode, receiver.uniqueID, receiver.linkcode) == ids
+    assert deliverer.generation == receiver.generation == generation + 3
+    assert deliverer.amount == pytest.approx(amount * 0.7)
+    #one lineage record per partial settlement, also without the archive
+    assert len(model.partial_settlements) == recorded + 3
+    partials = model.partial_settlements.get_partials(transaction.transactionID)[-3:]
+    assert [partial["generation"] for partial in partials] == [generation + 1, generation + 2, generation + 3]
+    assert [partial["settled_amount"] for partial in partials] == pytest.approx([amount / 10] * 3)
+    assert partials[-1]["remaining_amount"] == pytest.approx(amount * 0.7)
+
+
+def test_summary_counts_partial_settlements_without_the_archive(make_model):
+    #without metrics the summary counts from the live agents, the archive and the partial settlements
+    with_archive = make_model()
+    without_archive = make_model(archive=False, metrics=Metrics.MetricsConfig(enabled=False))
+    for model in (with_archive, without_archive):
+        for _ in range(60):
+            model.step()
+    assert len(without_archive.partial_settlements) > 0
+    assert without_archive.summary_metrics() == pytest.approx(with_archive.summary_metrics())
@@ -0,0 +1,26 @@
+import numpy as np
+
+import PopulationGenerator
+
+
+def accounts(model):
+    return [(account.accountID, account.accountType, account.balance, account.creditLimit) for account in model.accounts]
+
+
+def test_account_ids_are_unique_when_the_space_is_small():
+    #4 countries x 90 check digits x 10 numbers: 1000 ids out of 3600 need redraws
+    ids = PopulationGenerator.generate_account_ids(np.random.default_rng(2), 1000, digits=1)
+    assert len(ids) == len(set(ids)) == 1000
+    assert all(len(account_id) == 5 and account_id[:2] in PopulationGenerator.COUNTRY_CODES for account_id in ids)
+
+
+def test_snapshot_gives_the_same_population_for_any_seed(make_model, tmp_path):
+    snapshot = str(tmp_path / "population")
+    generated = make_model(population="bulk", population_snapshot=snapshot, seed=1, num_institutions=20)
+    assert PopulationGenerator.snapshot_exists(snapshot)
+    loaded = make_model(population_snapshot=snapshot, seed=2, use_ledger=True)
+    assert accounts(loaded) == accounts(generated)
+    assert [institution.institutionID for institution in loaded.participants] == [institution.institutionID for institution in generated.participants]
+    assert len({account_id for account_id, *_ in accounts(loaded)}) == len(loaded.accounts)
+    #every institution starts with its cash account
+    assert all(institution.accounts[0].accountType == "Cash" for institution in loaded.participants)
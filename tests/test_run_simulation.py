@@ -0,0 +1,78 @@
+import json
+import socket
+import threading
+import time
+
+import RunSimulation
+
+
+def test_flat_dotted_and_table_settings_are_grouped():
+    parameters = RunSimulation.convert_parameters({
+        "num_institutions": 7,
+        "log": {"verbosity": "events", "buffer_size": 100},
+        "log_dir": "logs",
+        "batch.shards": 2,
+        "metrics": False,
+        "checkpoint_interval": 50,
+        "validation_delay": 2,
+    })
+    assert parameters["num_institutions"] == 7
+    assert parameters["log"] == {"verbosity": RunSimulation.VERBOSITY_LEVELS["events"], "buffer_size": 100, "directory": "logs"}
+    assert parameters["batch"] == {"shards": 2}
+    assert parameters["metrics"] == {"enabled": False}
+    assert parameters["checkpoints"] == {"interval": 50}
+    assert parameters["validation_delay"].total_seconds() == 2
+
+
+def test_flags_win_over_the_config_file(tmp_path):
+    config = tmp_path / "run.toml"
+    config.write_text('steps = 5\n[log]\nverbosity = "all"\nformat = "jsonl"\n')
+    args = RunSimulation.build_parser().parse_args(["--config", str(config), "--verbosity", "errors", "--shards", "2", "--set", "feed.batch_size=10"])
+    parameters, options = RunSimulation.settings(args)
+    assert options == {"steps": 5}
+    assert parameters["log"] == {"verbosity": RunSimulation.VERBOSITY_LEVELS["errors"], "format": "jsonl", "keep": False}
+    assert parameters["batch"] == {"shards": 2}
+    assert parameters["feed"] == {"batch_size": 10}
+
+
+def test_run_builds_the_config_objects(tmp_path):
+    parameters, options = RunSimulation.settings(RunSimulation.build_parser().parse_args(
+        ["--institutions", "3", "--steps-per-day", "10", "--steps", "20", "--metrics-dir", str(tmp_path), "--set", "checkpoints.interval=10",
+         "--checkpoint-dir", str(tmp_path / "checkpoints")]))
+    summary = RunSimulation.run(parameters, options)
+    assert summary["steps"] == 20
+    assert (tmp_path / "metrics_days.csv").exists()
+    assert sorted(path.name for path in (tmp_path / "checkpoints").iterdir()) == ["checkpoint-00000010.ckpt", "checkpoint-00000020.ckpt"]
+
+
+def test_live_workload_needs_a_feed(capsys):
+    assert RunSimulation.main(["--workload", "live", "--steps", "1"]) == 2
+    assert "needs a feed" in capsys.readouterr().err
+
+
+def test_live_workload_reads_its_feed(tmp_path):
+    path = str(tmp_path / "feed.sock")
+    records = [{"direction": "delivery", "linkcode": "L1", "institutionID": "INST-1", "securityType": "Bond-A", "amount": 10.0},
+               {"direction": "receipt", "linkcode": "L1", "institutionID": "INST-2", "securityType": "Bond-A", "amount": 10.0}]
+
+    def send():
+        #the socket file exists once the server is bound, connections are refused until it listens
+        with socket.socket(socket.AF_UNIX) as client:
+            while True:
+                try:
+                    client.connect(path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    time.sleep(0.001)
+            client.sendall("".join(json.dumps(record) + "\n" for record in records).encode())
+
+    client = threading.Thread(target=send)
+    client.start()
+    parameters, options = RunSimulation.settings(RunSimulation.build_parser().parse_args(
+        ["--institutions", "3", "--steps", "100", "--step-interval", "0.01", "--feed-socket", path]))
+    summary = RunSimulation.run(parameters, options)
+    client.join()
+    assert parameters["workload"] == "live"
+    assert summary["steps"] == 100
+    assert summary["feed"]["received"] == 2
+    assert summary["feed"]["injected"] + summary["feed"]["skipped"] == 2
@@ -0,0 +1,37 @@
+import pytest
+
+import BatchSettlement
+import Benchmark
+from conftest import model_state, run_steps
+
+
+@pytest.mark.parametrize("shards", [2, 3])
+def test_sharded_batch_matches_single_process_batch(make_model, shards):
+    #partial settlement is off, so the end of day batch settles the queued transactions in both runs
+    single = run_steps(make_model(use_ledger=True, allow_partial=False), 60)
+    sharded = run_steps(make_model(use_ledger=True, allow_partial=False, batch=BatchSettlement.BatchConfig(shards=shards)), 60)
+    assert model_state(sharded) == model_state(single)
+
+
+def tight_batch(make_model, batch, securities_balance: float = 20000.0, cash_balance: float = 40000.0):
+    #matched transactions settled by one end of day batch, without credit neither the securities nor the cash cover all of them
+    model = make_model(use_ledger=True, allow_partial=False, batch=batch)
+    Benchmark.match_all(model, 400)
+    for account in model.accounts:
+        if account.accountType == "Cash":
+            account.balance = cash_balance
+            account.creditLimit = 0.0
+        else:
+            account.balance = securities_balance
+    result = model.batch_settlement.run()
+    return result, model_state(model)
+
+
+@pytest.mark.parametrize("shards", [2, 3, 4])
+def test_sharded_batch_matches_single_process_batch_when_balances_bind(make_model, shards):
+    single = tight_batch(make_model, BatchSettlement.BatchConfig())
+    #both constraints decide what settles: with plenty of either the batch settles other transactions
+    assert 0 < single[0]["settled"] < single[0]["matched"]
+    assert tight_batch(make_model, BatchSettlement.BatchConfig(), cash_balance=1e12)[0] != single[0]
+    assert tight_batch(make_model, BatchSettlement.BatchConfig(), securities_balance=1e12)[0] != single[0]
+    assert tight_batch(make_model, BatchSettlement.BatchConfig(shards=shards)) == single
@@ -0,0 +1,67 @@
+import heapq
+import random
+
+import pytest
+
+import TimingWheel
+
+
+class HeapTimers:
+    #reference: the same timers on a binary heap, ordered by deadline and then by the order they were added
+    def __init__(self):
+        self.queue = []
+        self.sequence = 0
+        self.cancelled = set()
+
+    def add(self, deadline: int, target):
+        heapq.heappush(self.queue, (deadline, self.sequence, target))
+        self.sequence += 1
+
+    def cancel(self, target):
+        self.cancelled.add(target)
+
+    def advance(self, to: int):
+        expired = []
+        while self.queue and self.queue[0][0] <= to:
+            target = heapq.heappop(self.queue)[2]
+            if target not in self.cancelled:
+                expired.append(target)
+        return expired
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_expires_the_same_timers_as_a_heap(seed):
+    rng = random.Random(seed)
+    wheel = TimingWheel.TimingWheel()
+    heap = HeapTimers()
+    timers = {}
+    target = 0
+    #deadlines up to 2^18 ticks so timers cascade over three levels
+    for now in range(1, 3000):
+        for _ in range(rng.randint(0, 5)):
+            deadline = now + rng.choice([0, 1, rng.randint(1, 300), rng.randint(1, 70000), rng.randint(1, 1 << 18)])
+            timers[target] = wheel.add(deadline, target)
+            heap.add(deadline, target)
+            target += 1
+        if timers and rng.random() < 0.3:
+            cancelled = rng.choice(list(timers))
+            wheel.cancel(timers.pop(cancelled))
+            heap.cancel(cancelled)
+        #timers with the same deadline can come out of the wheel in another order
+        expired = wheel.advance(now)
+        assert sorted(expired) == sorted(heap.advance(now))
+        for done in expired:
+            timers.pop(done, None)
+        assert len(wheel) == len(timers)
+
+
+def test_advance_over_many_ticks_returns_deadline_order():
+    rng = random.Random(7)
+    wheel = TimingWheel.TimingWheel()
+    deadlines = {target: rng.randint(1, 100000) for target in range(2000)}
+    for target, deadline in deadlines.items():
+        wheel.add(deadline, target)
+    expired = wheel.advance(100000)
+    assert sorted(expired) == list(range(2000))
+    assert [deadlines[target] for target in expired] == sorted(deadlines.values())
+    assert len(wheel) == 0
@@ -0,0 +1,72 @@
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import TraceReplay
+from conftest import run_steps
+
+
+def trace_records():
+    #two matching pairs in Bond-D, which INST-1 and INST-2 of the seed 1 population both hold
+    return [
+        {"arrival_time": 60, "direction": "delivery", "linkcode": "TRACE-1", "institutionID": "INST-1", "securityType": "Bond-D", "amount": 100.0, "uniqueID": ""},
+        {"arrival_time": 60, "direction": "receipt", "linkcode": "TRACE-1", "institutionID": "INST-2", "securityType": "Bond-D", "amount": 100.0, "uniqueID": "2"},
+        {"arrival_time": 120, "direction": "receipt", "linkcode": "TRACE-2", "institutionID": "INST-1", "securityType": "Bond-D", "amount": 50.0, "uniqueID": ""},
+        {"arrival_time": 120, "direction": "delivery", "linkcode": "TRACE-2", "institutionID": "INST-2", "securityType": "Bond-D", "amount": 50.0, "uniqueID": "TX-9"},
+    ]
+
+
+def write_trace(path, records):
+    if path.suffix == ".csv":
+        with open(path, "w", newline="") as trace_file:
+            writer = csv.DictWriter(trace_file, fieldnames=TraceReplay.TRACE_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, "w") as trace_file:
+            for record in records:
+                trace_file.write(json.dumps(record) + "\n")
+    return str(path)
+
+
+def replayed(model):
+    return [(instruction.uniqueID, instruction.direction, instruction.linkcode, instruction.institution.institutionID,
+             instruction.securityType, instruction.amount, instruction.creation_time) for instruction in model.instructions]
+
+
+def test_csv_and_jsonl_traces_replay_the_same_instructions(make_model, tmp_path):
+    records = trace_records()
+    runs = []
+    for name in ("trace.csv", "trace.jsonl"):
+        model = make_model(workload="replay", trace_path=write_trace(tmp_path / name, records))
+        runs.append(replayed(run_steps(model, 3)))
+        assert model.trace_replay.injected == len(records)
+    start = model.simulation_start
+    #the records without uniqueID get the next ids of the counter, which skips the id 2 of the trace
+    assert runs[0] == runs[1] == [
+        (1, "delivery", "TRACE-1", "INST-1", "Bond-D", 100.0, start + timedelta(seconds=60)),
+        (2, "receipt", "TRACE-1", "INST-2", "Bond-D", 100.0, start + timedelta(seconds=60)),
+        (3, "receipt", "TRACE-2", "INST-1", "Bond-D", 50.0, start + timedelta(seconds=120)),
+        ("TX-9", "delivery", "TRACE-2", "INST-2", "Bond-D", 50.0, start + timedelta(seconds=120)),
+    ]
+
+
+def test_generated_ids_dont_collide_with_trace_ids(make_model, tmp_path):
+    records = trace_records()
+    records[0]["uniqueID"] = "7"
+    model = run_steps(make_model(workload="replay", trace_path=write_trace(tmp_path / "trace.jsonl", records)), 3)
+    uniqueIDs = [instruction.uniqueID for instruction in model.instructions]
+    assert uniqueIDs == [7, 2, 8, "TX-9"]
+    assert model.new_instruction_id() == 9
+
+
+@pytest.mark.parametrize("arrival_time", ["2025-01-01T02:00:00+01:00", datetime(2025, 1, 1, 2, tzinfo=timezone(timedelta(hours=1)))])
+def test_arrival_time_with_a_timezone_is_aligned_to_the_simulation_start(arrival_time):
+    raw = dict(trace_records()[0], arrival_time=arrival_time)
+    assert TraceReplay.parse_record(raw, datetime(2025, 1, 1))["arrival_time"] == datetime(2025, 1, 1, 1)
+    #a simulation start with a timezone gets aware arrival times in its timezone
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert TraceReplay.parse_record(raw, start)["arrival_time"] == datetime(2025, 1, 1, 1, tzinfo=timezone.utc)
+    assert TraceReplay.parse_record(dict(raw, arrival_time="2025-01-01T01:00:00"), start)["arrival_time"] == datetime(2025, 1, 1, 1, tzinfo=timezone.utc)
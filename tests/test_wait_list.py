@@ -0,0 +1,49 @@
+import pytest
+
+from conftest import run_steps
+
+
+def parked_transactions(model, partial: bool):
+    return [(account, entry[2]) for account, heap in model.wait_list.waiting.items() for entry in heap
+            if entry[2].status == "Matched" and entry[2].partial_allowed() == partial]
+
+
+def is_parked(model, account, transaction):
+    return any(entry[2] is transaction for entry in model.wait_list.waiting.get(account, []))
+
+
+def test_partial_transaction_wakes_on_any_increase(make_model):
+    model = run_steps(make_model(simulation_duration_days=10), 60)
+    parked = parked_transactions(model, partial=True)
+    assert parked
+    for account, transaction in parked:
+        account.addBalance(0.01, account.accountType)
+        assert not is_parked(model, account, transaction)
+
+
+def test_opting_in_wakes_the_waiting_transactions(make_model):
+    model = run_steps(make_model(simulation_duration_days=10, allow_partial=False), 150)
+    parked = parked_transactions(model, partial=False)
+    assert parked
+    account, transaction = parked[0]
+    institution = transaction.deliverer.institution
+    institution.opt_in_partial()
+    assert not is_parked(model, account, transaction)
+    assert all(institution not in (waiting.deliverer.institution, waiting.receiver.institution) for _, waiting in parked_transactions(model, partial=False))
+
+
+def test_transaction_without_partial_waits_for_the_full_amount(make_model):
+    model = run_steps(make_model(simulation_duration_days=10, allow_partial=False), 150)
+    parked = parked_transactions(model, partial=False)
+    assert parked
+    for account, transaction in parked:
+        short = transaction.deliverer.amount - account.available()
+        if short > 0.02:
+            account.addBalance(0.01, account.accountType)
+            assert is_parked(model, account, transaction)
+
+
+@pytest.mark.parametrize("settlement_retry", ["waitlist", "poll"])
+def test_partial_settlements_happen_with_both_retry_modes(make_model, settlement_retry):
+    model = run_steps(make_model(settlement_retry=settlement_retry), 60)
+    assert model.metrics.counters["partial_settlements"] > 0